@@ -11,44 +11,90 @@ from db.db import init_db, populate_db, db  # Импортируем db для 
 from db.users import User # Импортируем модели User
 from routes import routes  # Ваши маршруты
 from model.recommend_system import HybridRecommender
+from model.artifacts import artifacts_available
+from utils.startup import StagedLoader, file_lock
+from utils.utils_logging import setup_logging
 import config
 
 # Flask-приложение
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
 app.config['SECRET_KEY'] = os.urandom(24)
 
-# Логирование
-logging.basicConfig(level=logging.INFO)
+# Логирование: одна конфигурация для приложения и рекомендателя (очередь + поток записи)
+setup_logging(config.LOG_PATH)
 logger = logging.getLogger(__name__)
 
 migrate = Migrate(app, db)  # Настройка миграций
 
 # Инициализация БД и маршрутов
 init_db(app, db_path=config.DB_PATH)
-with app.app_context():
-    populate_db()
 
 app.wsgi_app = DispatcherMiddleware(app.wsgi_app, {
     '/metrics': make_wsgi_app()
 })
 
 # Загрузка модели
-recommender = HybridRecommender(
-    model_path=config.MODEL_PATH,
-    annoy_index_path=config.ANNOY_INDEX_PATH,
-    items_path=config.ITEMS_PATH,
-    cleaned_events_path=config.CLEANED_EVENTS_PATH,
-    ranker_data_path=config.RANKER_DATA_PATH
-)
-
-# Привязка модели к приложению
-routes.recommender = recommender
-app.recommender = recommender
+def load_recommender():
+    options = dict(
+        precomputed_dir=config.PRECOMPUTED_DIR,
+        precomputed_reload_interval=config.PRECOMPUTED_RELOAD_INTERVAL,
+        similar_max_k=config.SIMILAR_MAX_K,
+        similar_cache_size=config.SIMILAR_CACHE_SIZE,
+        similar_cache_ttl=config.SIMILAR_CACHE_TTL,
+        similar_store_path=config.SIMILAR_STORE_PATH,
+        neighbours_path=config.NEIGHBOURS_PATH,
+        trace_stages=config.TRACE_STAGES,
+        ranker_thread_count=config.RANKER_THREAD_COUNT,
+        ranker_time_budget=config.RANKER_TIME_BUDGET_MS / 1000 or None,
+        candidate_budget=config.CANDIDATE_BUDGET,
+        candidate_options=config.CANDIDATE_OPTIONS
+    )
+    # Собранные артефакты открываются через mmap и общие для всех воркеров
+    if artifacts_available(config.ARTIFACTS_DIR):
+        return HybridRecommender.from_artifacts(
+            config.ARTIFACTS_DIR,
+            model_path=config.MODEL_PATH,
+            annoy_index_path=config.ANNOY_INDEX_PATH,
+            **options
+        )
+    return HybridRecommender(
+        model_path=config.MODEL_PATH,
+        annoy_index_path=config.ANNOY_INDEX_PATH,
+        items_path=config.ITEMS_PATH,
+        cleaned_events_path=config.CLEANED_EVENTS_PATH,
+        ranker_data_path=config.RANKER_DATA_PATH,
+        **options
+    )
+
+
+def fill_db():
+    # Блокировка на файле: при нескольких воркерах БД заполняет только один из них
+    with file_lock(f"{config.DB_PATH}.lock"), app.app_context():
+        populate_db()
+
+
+def attach_recommender():
+    recommender = load_recommender()
+    # Привязка модели к приложению
+    routes.recommender = recommender
+    app.recommender = recommender
+
+
+# Пока модель не загружена, маршруты рекомендаций отвечают 503
+app.recommender = None
+app.startup = StagedLoader()
+startup_stages = [('recommender', attach_recommender), ('populate_db', fill_db)]
 
 # Регистрация маршрутов
 app.register_blueprint(routes)
 
+# В режиме поэтапного старта сервер начинает принимать запросы сразу,
+# а БД и модель загружаются в фоновом потоке (готовность — /readyz)
+if config.STAGED_STARTUP:
+    app.startup.start(startup_stages)
+elif not app.startup.run(startup_stages):
+    raise RuntimeError(f"Не удалось запустить приложение: {app.startup.error}")
+
 # Запуск приложения
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,172 @@
+'''
+Бенчмарк чтения истории пользователей из SQLite под конкурентной нагрузкой:
+настройки по умолчанию (rollback journal, без mmap, соединение на запрос)
+против движка из db/engine.py (WAL, mmap, кэш страниц, busy_timeout, пул).
+
+    python -m benchmarks.bench_db --readers 4 --duration 5
+
+Несколько процессов-читателей (как воркеры gunicorn) выбирают страницы истории
+случайных пользователей, один процесс-писатель параллельно дописывает действия.
+'''
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+from sqlalchemy import create_engine, insert
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import NullPool
+
+from db.db import db
+from db.engine import create_db_engine
+from db.queries import user_actions
+
+FEATURES = ('dayofweek', 'hour', 'view_count', 'addtocart_count', 'purchase_count', 'total_events',
+            'items_count', 'purchases', 'itemevents_by_visitor')
+FLOAT_FEATURES = ('conversion', 'avg_time_view', 'avg_time_addtocart', 'avg_time_transaction',
+                  'session', 'itemviews_before_purchase', 'time_to_purchase')
+
+
+def synthetic_actions(n, n_users, seed):
+    rng = random.Random(seed)
+    start = datetime(2015, 6, 1)
+    rows = []
+    for _ in range(n):
+        row = {
+            'timestamp': start + timedelta(seconds=rng.randrange(0, 90 * 24 * 3600)),
+            'event': rng.choice(('view', 'view', 'view', 'addtocart', 'transaction')),
+            'itemid': rng.randrange(0, 50000),
+            'visitorid': rng.randrange(0, n_users),
+            'is_weekend': False,
+            'is_holiday': False,
+        }
+        row.update({name: rng.randrange(0, 100) for name in FEATURES})
+        row.update({name: rng.random() for name in FLOAT_FEATURES})
+        rows.append(row)
+    return rows
+
+
+def build_database(path, n_rows, n_users):
+    from db.users import Action
+
+    engine = create_engine(f"sqlite:///{path}")
+    db.metadata.create_all(engine)
+    with engine.begin() as connection:
+        for start in range(0, n_rows, 50_000):
+            connection.execute(insert(Action.__table__),
+                               synthetic_actions(min(50_000, n_rows - start), n_users, seed=start))
+    engine.dispose()
+
+
+def _engine(path, tuned):
+    if tuned:
+        return create_db_engine(path)
+    # Как раньше: настройки SQLite по умолчанию, новое соединение на каждый запрос
+    return create_engine(f"sqlite:///{path}", poolclass=NullPool)
+
+
+def reader(path, tuned, n_users, start_at, duration, seed):
+    engine = _engine(path, tuned)
+    rng = random.Random(seed)
+    latencies, errors = [], 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + duration
+    while time.time() < deadline:
+        begin = time.perf_counter()
+        try:
+            with engine.connect() as connection:
+                user_actions(rng.randrange(0, n_users), limit=50, session=connection)
+        except OperationalError:
+            errors += 1
+            continue
+        latencies.append(time.perf_counter() - begin)
+    engine.dispose()
+    return latencies, errors
+
+
+def writer(path, tuned, n_users, start_at, duration, batch):
+    from db.users import Action
+
+    engine = _engine(path, tuned)
+    written, errors, seed = 0, 0, 0
+    while time.time() < start_at:
+        time.sleep(0.001)
+    deadline = start_at + duration
+    while time.time() < deadline:
+        seed += 1
+        try:
+            with engine.begin() as connection:
+                connection.execute(insert(Action.__table__), synthetic_actions(batch, n_users, seed=-seed))
+            written += batch
+        except OperationalError:
+            errors += 1
+    engine.dispose()
+    return written, errors
+
+
+def run(path, tuned, args):
+    start_at = time.time() + 1.0
+    with ProcessPoolExecutor(max_workers=args.readers + 1) as pool:
+        write = pool.submit(writer, path, tuned, args.users, start_at, args.duration, args.write_batch)
+        reads = [pool.submit(reader, path, tuned, args.users, start_at, args.duration, seed)
+                 for seed in range(args.readers)]
+        results = [r.result() for r in reads]
+        written, write_errors = write.result()
+    latencies = np.concatenate([np.asarray(lat) for lat, _ in results]) if results else np.array([])
+    return {
+        'reads_per_sec': len(latencies) / args.duration,
+        'p50_ms': float(np.percentile(latencies, 50) * 1000) if len(latencies) else float('nan'),
+        'p99_ms': float(np.percentile(latencies, 99) * 1000) if len(latencies) else float('nan'),
+        'read_errors': sum(e for _, e in results),
+        'rows_written': written,
+        'write_errors': write_errors,
+    }
+
+
+def _report(name, result):
+    print(f"{name:<14} чтений/с: {result['reads_per_sec']:>9.0f}   p50: {result['p50_ms']:>7.2f} мс   "
+          f"p99: {result['p99_ms']:>7.2f} мс   ошибок чтения: {result['read_errors']}   "
+          f"записано строк: {result['rows_written']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк конкурентного чтения из SQLite")
+    parser.add_argument('--rows', type=int, default=200_000)
+    parser.add_argument('--users', type=int, default=5_000)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--write-batch', type=int, default=200)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench-db-')
+    try:
+        template = os.path.join(tmp_dir, 'template.db')
+        build_database(template, args.rows, args.users)
+        print(f"БД: {args.rows} действий, {args.users} пользователей; читателей: {args.readers}, "
+              f"писатель: по {args.write_batch} строк")
+
+        results = {}
+        for name, tuned in (('по умолчанию', False), ('настроенный', True)):
+            # Отдельная копия: journal_mode=WAL сохраняется в самом файле БД
+            path = os.path.join(tmp_dir, f"{'tuned' if tuned else 'default'}.db")
+            shutil.copyfile(template, path)
+            results[name] = run(path, tuned, args)
+            _report(name, results[name])
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    base, tuned = results['по умолчанию'], results['настроенный']
+    if base['reads_per_sec']:
+        print(f"Ускорение чтения: x{tuned['reads_per_sec'] / base['reads_per_sec']:.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+'''
+Бенчмарк этапа items.parquet: прежняя реализация (рекурсивная глубина категории,
+split через apply, join свойств через lambda) против векторизованной из utils/item_properties.
+
+    python -m benchmarks.bench_items --data-dir model/data
+
+Свойства сначала загружаются в секции (utils/ingest), затем обе реализации
+агрегируют одни и те же секции; время загрузки в сравнение не входит.
+'''
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from utils.ingest import ingest_properties
+from utils.item_properties import category_depth, depth_counts, median_from_counts, build_items, read_properties
+
+
+def legacy_depth(tree_path):
+    with open(tree_path, 'r') as f:
+        tree = pd.read_csv(f)
+    tree['parentid'] = tree['parentid'].fillna(-1).astype(int)
+    category_dict = dict(zip(tree['categoryid'], tree['parentid']))
+
+    def get_depth(category_id, depth_cache={}):
+        if category_id in depth_cache:
+            return depth_cache[category_id]
+        if category_id == -1:
+            return 0
+        parent_id = category_dict.get(category_id, -1)
+        depth_cache[category_id] = 1 + get_depth(parent_id, depth_cache)
+        return depth_cache[category_id]
+
+    return pd.Series([get_depth(c) for c in tree['categoryid']], index=tree['categoryid'].astype('uint16'))
+
+
+def legacy_items(paths, tree_path):
+    depth = legacy_depth(tree_path)
+    frames = [pd.read_parquet(path) for path in paths]
+    default_depth = pd.concat([f['property'].map(depth) for f in frames]).median()
+    grouped = []
+    for items in frames:
+        items['depth'] = items['property'].map(depth).fillna(default_depth).astype('uint8')
+        items['value'] = items['value'].apply(lambda x: str(x))
+        items['value_length'] = items['value'].apply(lambda x: len(x.split()))
+        grouped.append(items.groupby('itemid').agg({
+            'property': lambda x: ' '.join(str(p) for p in set(x)),
+            'value_length': 'sum',
+            'depth': 'median'
+        }).reset_index())
+    return pd.concat(grouped, ignore_index=True).sort_values('itemid').reset_index(drop=True)
+
+
+def vectorized_items(paths, tree_path):
+    depth_table = category_depth(tree_path)
+    counts = [depth_counts(pd.read_parquet(path, columns=['property'])['property'].to_numpy(), depth_table)
+              for path in paths]
+    default_depth = median_from_counts(pd.concat(counts).groupby(level=0).sum())
+    grouped = [build_items(read_properties(path), depth_table, default_depth) for path in paths]
+    return pd.concat(grouped, ignore_index=True).sort_values('itemid').reset_index(drop=True)
+
+
+def _timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def same_items(a, b):
+    '''Совпадение результатов; порядок свойств в строке не важен (раньше он задавался порядком set).'''
+    return (
+        len(a) == len(b)
+        and (a['itemid'].to_numpy() == b['itemid'].to_numpy()).all()
+        and all(sorted(x.split()) == sorted(y.split()) for x, y in zip(a['property'], b['property']))
+        and (a['value_length'].to_numpy() == b['value_length'].to_numpy()).all()
+        and (a['depth'].to_numpy() == b['depth'].to_numpy()).all()
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк агрегации свойств товаров")
+    parser.add_argument('--data-dir', default='model/data')
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--repeat', type=int, default=1)
+    args = parser.parse_args()
+
+    csv_paths = [os.path.join(args.data_dir, f'item_properties_part{i}.csv') for i in (1, 2)]
+    tree_path = os.path.join(args.data_dir, 'category_tree.csv')
+    tmp_dir = tempfile.mkdtemp(prefix='bench-items-')
+    try:
+        paths, ingest_time = _timed(ingest_properties, csv_paths, tmp_dir, args.partitions)
+        rows = sum(read_properties(path).num_rows for path in paths)
+        print(f"Загрузка свойств: {ingest_time:.2f} с, строк после дедупликации: {rows}")
+
+        legacy_times, vectorized_times = [], []
+        for _ in range(args.repeat):
+            legacy, t = _timed(legacy_items, paths, tree_path)
+            legacy_times.append(t)
+            vectorized, t = _timed(vectorized_items, paths, tree_path)
+            vectorized_times.append(t)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    legacy_time, vectorized_time = min(legacy_times), min(vectorized_times)
+    print(f"Прежняя реализация:      {legacy_time:.2f} с")
+    print(f"Векторизованная:         {vectorized_time:.2f} с")
+    print(f"Ускорение:               x{legacy_time / vectorized_time:.1f}")
+    equal = same_items(legacy, vectorized)
+    print(f"Результаты совпадают:    {'да' if equal else 'нет'}")
+    return 0 if equal else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+'''
+Нагрузочный бенчмарк рекомендаций: смесь запросов новых/пассивных/активных
+посетителей (или JSONL из benchmarks/workload.py) прогоняется через
+HybridRecommender.get_recommendations в процессе или через HTTP API Flask.
+
+    python -m benchmarks.bench_recommender --n 5000 --concurrency 4
+    python -m benchmarks.bench_recommender --mode http --url http://localhost:5000 --requests mix.jsonl
+
+Отчёт: RPS, p50/p95/p99 по всем запросам, по типу пользователя и по этапам
+расчёта (timings из trace=True), время и память по фазам. Результаты
+сохраняются в JSON для сравнения между коммитами (benchmarks/compare.py).
+'''
+import argparse
+import logging
+import os
+import sys
+import threading
+from collections import defaultdict
+
+import config
+from benchmarks.harness import Report, latency_summary, run_concurrent, print_summary
+from benchmarks.workload import DEFAULT_MIX, synthesize_mix, load_requests, parse_mix
+
+RESULTS_DIR = os.path.join('benchmarks', 'results')
+
+
+def build_recommender(args):
+    from model.recommend_system import HybridRecommender
+    from model.artifacts import artifacts_available, source_paths
+
+    options = dict(
+        precomputed_dir=config.PRECOMPUTED_DIR if args.precomputed else None,
+        similar_max_k=config.SIMILAR_MAX_K,
+        similar_cache_size=config.SIMILAR_CACHE_SIZE,
+        similar_cache_ttl=config.SIMILAR_CACHE_TTL,
+        neighbours_path=config.NEIGHBOURS_PATH,
+        candidate_budget=args.candidate_budget,
+        candidate_options=config.CANDIDATE_OPTIONS,
+    )
+    sources = source_paths(args.model, args.items, args.events, args.ranker_data)
+    if args.artifacts and artifacts_available(args.artifacts, sources):
+        return HybridRecommender.from_artifacts(args.artifacts, model_path=args.model,
+                                                annoy_index_path=args.annoy_index, **options)
+    return HybridRecommender(
+        model_path=args.model,
+        annoy_index_path=args.annoy_index,
+        items_path=args.items,
+        cleaned_events_path=args.events,
+        ranker_data_path=args.ranker_data,
+        **options
+    )
+
+
+def inprocess_call(recommender, stages):
+    def call(request):
+        return recommender.get_recommendations(request['user_id'], top_n=request.get('top_n', 3), trace=stages)
+    return call
+
+
+def http_call(url, stages, timeout):
+    import requests as http
+
+    local = threading.local()
+
+    def call(request):
+        # Отдельная сессия (keep-alive соединение) на поток
+        if not hasattr(local, 'session'):
+            local.session = http.Session()
+        params = {'top_n': request.get('top_n', 3)}
+        if stages:
+            params['trace'] = '1'
+        response = local.session.get(f"{url.rstrip('/')}/api/v1/recommendations/{request['user_id']}",
+                                     params=params, timeout=timeout)
+        response.raise_for_status()
+        return response.json()
+    return call
+
+
+def summarize(results, elapsed):
+    '''Сводки: все запросы, по типу пользователя и по этапам расчёта.'''
+    by_type, by_stage = defaultdict(list), defaultdict(list)
+    for request, latency, value in results:
+        by_type[request.get('user_type') or value.get('status', 'unknown')].append(latency)
+        for name, ms in value.get('timings', {}).items():
+            by_stage[name].append(ms / 1000)
+    return {
+        'overall': latency_summary([latency for _, latency, _ in results], elapsed),
+        'by_user_type': {name: latency_summary(values) for name, values in sorted(by_type.items())},
+        'by_stage': {name: latency_summary(values) for name, values in sorted(by_stage.items())},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный бенчмарк рекомендаций")
+    parser.add_argument('--mode', choices=('inprocess', 'http'), default='inprocess')
+    parser.add_argument('--url', default='http://localhost:5000')
+    parser.add_argument('--requests', help="JSONL с запросами; по умолчанию смесь генерируется из cleaned_events")
+    parser.add_argument('--events', default=config.CLEANED_EVENTS_PATH)
+    parser.add_argument('--items', default=config.ITEMS_PATH)
+    parser.add_argument('--ranker-data', default=config.RANKER_DATA_PATH)
+    parser.add_argument('--model', default=config.MODEL_PATH)
+    parser.add_argument('--annoy-index', default=config.ANNOY_INDEX_PATH)
+    parser.add_argument('--artifacts', default=config.ARTIFACTS_DIR, help="каталог mmap-артефактов (если собран)")
+    parser.add_argument('--n', type=int, default=5_000)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=200, help="запросов на прогрев (в статистику не входят)")
+    parser.add_argument('--no-stages', dest='stages', action='store_false', help="без разбивки по этапам")
+    parser.add_argument('--precomputed', action='store_true', help="разрешить предрассчитанную таблицу")
+    parser.add_argument('--candidate-budget', type=int, default=config.CANDIDATE_BUDGET,
+                        help="бюджет кандидатов активного пользователя (0 — все строки df_ranker)")
+    parser.add_argument('--timeout', type=float, default=10.0)
+    parser.add_argument('--log-level', default='ERROR', help="логи рекомендателя не должны влиять на замеры")
+    parser.add_argument('--out')
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level)
+
+    report = Report(f'recommender-{args.mode}', vars(args))
+
+    with report.phase('workload'):
+        requests = load_requests(args.requests) if args.requests else synthesize_mix(args.events, args.n, args.mix,
+                                                                                     seed=args.seed)
+    with report.phase('load'):
+        if args.mode == 'inprocess':
+            call = inprocess_call(build_recommender(args), args.stages)
+        else:
+            call = http_call(args.url, args.stages, args.timeout)
+    with report.phase('warmup'):
+        run_concurrent(call, requests[:args.warmup], args.concurrency)
+    with report.phase('run'):
+        results, errors, elapsed = run_concurrent(call, requests, args.concurrency)
+
+    summary = summarize(results, elapsed)
+    report.add('errors', errors)
+    for name, value in summary.items():
+        report.add(name, value)
+
+    print(f"Запросов: {len(requests)}, ошибок: {errors}, потоков: {args.concurrency}, режим: {args.mode}")
+    print_summary('все запросы', summary['overall'])
+    for name, value in summary['by_user_type'].items():
+        print_summary(f'  {name}', value)
+    for name, value in summary['by_stage'].items():
+        print_summary(f'  этап {name}', value)
+    for name, phase in report.data['phases'].items():
+        print(f"фаза {name:<10} {phase['seconds']:>8.2f} с   RSS: {phase['rss_mb']:>8.1f} МБ "
+              f"(+{phase['rss_delta_mb']:.1f})   пик: {phase['peak_rss_mb']:.1f} МБ")
+
+    report.save(args.out or os.path.join(RESULTS_DIR, f'recommender-{args.mode}.json'))
+    return 0 if errors == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
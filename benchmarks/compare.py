@@ -0,0 +1,75 @@
+'''
+Сравнение двух JSON-результатов бенчмарков (например, до и после коммита).
+
+    python -m benchmarks.compare old.json new.json --threshold 10
+
+Сравниваются все числовые метрики с одинаковым путём. Регрессией считается рост
+задержки/времени/памяти (*_ms, seconds, *_mb) или падение пропускной способности
+(rps, rows_per_sec) больше чем на threshold процентов; при регрессиях код возврата 1.
+'''
+import argparse
+import json
+import sys
+
+HIGHER_IS_BETTER = ('rps', 'rows_per_sec')
+LOWER_IS_BETTER = ('_ms', 'seconds', '_mb')
+
+
+def flatten(data, prefix=''):
+    values = {}
+    for key, value in data.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            values.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def direction(path):
+    name = path.rsplit('.', 1)[-1]
+    if name in HIGHER_IS_BETTER:
+        return 1
+    if name.endswith(LOWER_IS_BETTER) or name in LOWER_IS_BETTER:
+        return -1
+    return 0
+
+
+def compare(old, new, threshold):
+    '''Строки (путь, было, стало, изменение %, регрессия) по общим метрикам phases и metrics.'''
+    rows = []
+    old_values = flatten({'phases': old.get('phases', {}), 'metrics': old.get('metrics', {})})
+    new_values = flatten({'phases': new.get('phases', {}), 'metrics': new.get('metrics', {})})
+    for path in sorted(old_values.keys() & new_values.keys()):
+        before, after = old_values[path], new_values[path]
+        change = (after - before) / before * 100 if before else 0.0
+        sign = direction(path)
+        regression = sign != 0 and -sign * change > threshold
+        rows.append((path, before, after, change, regression))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение результатов бенчмарков")
+    parser.add_argument('old')
+    parser.add_argument('new')
+    parser.add_argument('--threshold', type=float, default=10.0, help="допустимое ухудшение, %%")
+    args = parser.parse_args()
+
+    with open(args.old, encoding='utf-8') as f:
+        old = json.load(f)
+    with open(args.new, encoding='utf-8') as f:
+        new = json.load(f)
+
+    print(f"{old['env'].get('commit')} → {new['env'].get('commit')} ({old['benchmark']})")
+    rows = compare(old, new, args.threshold)
+    for path, before, after, change, regression in rows:
+        mark = '  РЕГРЕССИЯ' if regression else ''
+        print(f"{path:<56} {before:>12.3f} → {after:>12.3f}  {change:>+8.1f}%{mark}")
+    regressions = sum(row[4] for row in rows)
+    print(f"Регрессий: {regressions}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,144 @@
+'''
+Общие части бенчмарков: сводка задержек (RPS, p50/p95/p99), замер времени и памяти
+по фазам, параллельный прогон запросов и сохранение результатов в JSON
+(с коммитом git), чтобы сравнивать их между версиями (benchmarks/compare.py).
+'''
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+
+def rss_mb():
+    '''Текущий RSS процесса (Linux — /proc, иначе пиковый RSS).'''
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss в КиБ на Linux и в байтах на macOS
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+def latency_summary(latencies, elapsed=None):
+    '''Сводка по задержкам (сек.): число, RPS (если задано время прогона) и перцентили в мс.'''
+    latencies = np.asarray(latencies, dtype=float)
+    if len(latencies) == 0:
+        return {'count': 0}
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    summary = {
+        'count': int(len(latencies)),
+        'mean_ms': round(float(latencies.mean() * 1000), 4),
+        'p50_ms': round(float(p50), 4),
+        'p95_ms': round(float(p95), 4),
+        'p99_ms': round(float(p99), 4),
+        'max_ms': round(float(latencies.max() * 1000), 4),
+    }
+    if elapsed:
+        summary['rps'] = round(len(latencies) / elapsed, 2)
+    return summary
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+class Report:
+    """Результаты одного бенчмарка: параметры, окружение, фазы (время и память) и метрики."""
+
+    def __init__(self, name, params):
+        self.data = {'benchmark': name, 'params': params, 'env': environment(), 'phases': {}, 'metrics': {}}
+
+    @contextmanager
+    def phase(self, name):
+        '''Время фазы, RSS после неё, прирост RSS и пиковый RSS процесса на её конец.'''
+        rss_before = rss_mb()
+        start = time.perf_counter()
+        yield
+        rss_after = rss_mb()
+        self.data['phases'][name] = {
+            'seconds': round(time.perf_counter() - start, 4),
+            'rss_mb': round(rss_after, 1),
+            'rss_delta_mb': round(rss_after - rss_before, 1),
+            'peak_rss_mb': round(peak_rss_mb(), 1),
+        }
+
+    def add(self, name, value):
+        self.data['metrics'][name] = value
+
+    def save(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2, default=str)
+        print(f"Результаты сохранены в {path}")
+
+
+def run_concurrent(func, items, concurrency=1):
+    '''
+    Выполняет func(item) для всех items в concurrency потоках.
+    Возвращает (результаты [(item, задержка, значение)], число ошибок, общее время).
+    '''
+    items = list(items)
+    position = iter(range(len(items)))
+    lock = threading.Lock()
+    results, errors = [], [0]
+
+    def worker():
+        local = []
+        while True:
+            with lock:
+                k = next(position, None)
+            if k is None:
+                break
+            start = time.perf_counter()
+            try:
+                value = func(items[k])
+            except Exception:
+                with lock:
+                    errors[0] += 1
+                continue
+            local.append((items[k], time.perf_counter() - start, value))
+        with lock:
+            results.extend(local)
+
+    start = time.perf_counter()
+    if concurrency <= 1:
+        worker()
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(worker) for _ in range(concurrency)]:
+                future.result()
+    return results, errors[0], time.perf_counter() - start
+
+
+def print_summary(title, summary):
+    if not summary.get('count'):
+        print(f"{title:<24} нет данных")
+        return
+    rps = f"{summary['rps']:>9.1f} rps   " if 'rps' in summary else ''
+    print(f"{title:<24} {rps}p50: {summary['p50_ms']:>8.3f} мс   p95: {summary['p95_ms']:>8.3f} мс   "
+          f"p99: {summary['p99_ms']:>8.3f} мс   n={summary['count']}")
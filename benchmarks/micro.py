@@ -0,0 +1,133 @@
+'''
+Микробенчмарки отдельных частей системы:
+- similar     — SimilarItemsCache: поиск соседей в Annoy (промах) и из кэша (попадание)
+- preprocess  — этапы utils.data_preprocessing.preprocess_data на копии CSV из --data-dir
+- populate_db — массовая загрузка parquet в SQLite (db/bulk_load.py) по таблицам
+
+    python -m benchmarks.micro all --data-dir model/data
+'''
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import config
+from benchmarks.harness import Report, latency_summary, print_summary
+from utils.tracing import tracing
+
+RESULTS_PATH = os.path.join('benchmarks', 'results', 'micro.json')
+RAW_FILES = ('events.csv', 'item_properties_part1.csv', 'item_properties_part2.csv', 'category_tree.csv')
+
+
+def _timed_calls(func, items):
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def bench_similar(report, args):
+    from annoy import AnnoyIndex
+    from utils.cache import SimilarItemsCache
+    from utils.item_catalogue import ItemCatalogue
+
+    with report.phase('similar_load'):
+        items_path = args.items or os.path.join(args.data_dir, 'items.parquet')
+        catalogue = ItemCatalogue.from_frame(pd.read_parquet(items_path).reset_index(drop=True))
+        index = AnnoyIndex(config.ANNOY_DIMS, metric=config.ANNOY_METRIC)
+        index.load(args.annoy_index)
+        cache = SimilarItemsCache(index, catalogue, catalogue.itemids, max_k=config.SIMILAR_MAX_K,
+                                  maxsize=config.SIMILAR_CACHE_SIZE)
+    rng = np.random.default_rng(args.seed)
+    n_items = min(len(catalogue), index.get_n_items())
+    itemids = catalogue.itemids[rng.choice(n_items, size=min(args.n, n_items), replace=False)].tolist()
+
+    with report.phase('similar_run'):
+        lookup = lambda itemid: cache.get_similar_items(itemid, top_n=2)
+        results = {
+            'miss': latency_summary(_timed_calls(lookup, itemids)),   # первый запрос товара — Annoy
+            'hit': latency_summary(_timed_calls(lookup, itemids)),    # повторный — из LRU-кэша
+        }
+    report.add('similar', results)
+    for name, value in results.items():
+        print_summary(f'similar {name}', value)
+
+
+def bench_preprocess(report, args):
+    from utils.data_preprocessing import preprocess_data
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench-preprocess-')
+    try:
+        for name in RAW_FILES:
+            shutil.copyfile(os.path.join(args.data_dir, name), os.path.join(tmp_dir, name))
+        with report.phase('preprocess'), tracing() as trace:
+            preprocess_data(tmp_dir, args.partitions, args.workers)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    stages = {name: round(seconds, 4) for name, seconds in trace.timings.items()}
+    report.add('preprocess_stages_seconds', stages)
+    for name, seconds in stages.items():
+        print(f"preprocess {name:<14} {seconds:>8.2f} с")
+
+
+def bench_populate_db(report, args):
+    from db.bulk_load import bulk_load
+    from db.db import db
+    from db.engine import create_db_engine
+    from db.users import User  # noqa: F401 — регистрирует модели в metadata
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench-db-')
+    try:
+        engine = create_db_engine(os.path.join(tmp_dir, 'users.db'))
+        db.metadata.create_all(engine)
+        with report.phase('populate_db'), tracing() as trace:
+            counts = bulk_load(engine, os.path.join(args.data_dir, 'cleaned_events.parquet'),
+                               os.path.join(args.data_dir, 'items.parquet'),
+                               os.path.join(args.data_dir, 'df_ranker.parquet'), progress=False)
+        engine.dispose()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    tables = {
+        name: {'rows': rows, 'seconds': round(trace.timings[name], 4),
+               'rows_per_sec': round(rows / trace.timings[name], 1) if trace.timings[name] else None}
+        for name, rows in counts.items()
+    }
+    report.add('populate_db', tables)
+    for name, value in tables.items():
+        print(f"populate_db {name:<12} {value['rows']:>10} строк   {value['seconds']:>7.2f} с   "
+              f"{value['rows_per_sec'] or 0:>10.0f} строк/с")
+
+
+BENCHMARKS = {'similar': bench_similar, 'preprocess': bench_preprocess, 'populate_db': bench_populate_db}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Микробенчмарки")
+    parser.add_argument('names', nargs='+', choices=list(BENCHMARKS) + ['all'])
+    parser.add_argument('--data-dir', default=os.path.dirname(config.ITEMS_PATH))
+    parser.add_argument('--items', help="items.parquet (по умолчанию из --data-dir)")
+    parser.add_argument('--annoy-index', default=config.ANNOY_INDEX_PATH)
+    parser.add_argument('--partitions', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--n', type=int, default=2_000, help="число товаров для similar")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default=RESULTS_PATH)
+    args = parser.parse_args()
+
+    names = list(BENCHMARKS) if 'all' in args.names else list(dict.fromkeys(args.names))
+    report = Report('micro', vars(args))
+    for name in names:
+        BENCHMARKS[name](report, args)
+    report.save(args.out)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
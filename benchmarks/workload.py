@@ -0,0 +1,85 @@
+'''
+Нагрузка для бенчмарков: смесь запросов рекомендаций новых, пассивных и активных
+посетителей, взятых из cleaned_events, либо готовый JSONL-файл для повторного проигрывания.
+
+Строка JSONL — один запрос: {"user_id": 123, "top_n": 3, "user_type": "active"}
+(user_type необязателен и нужен только для отчёта).
+
+    python -m benchmarks.workload --n 10000 --out benchmarks/mix.jsonl
+'''
+import argparse
+import json
+
+import numpy as np
+import pandas as pd
+
+import config
+from model.recommend_system import ACTIVE_MIN_ITEMS
+
+DEFAULT_MIX = {'new': 0.2, 'passive': 0.3, 'active': 0.5}
+
+
+def visitors_by_type(cleaned_events_path):
+    '''visitorid, разбитые по типу пользователя так же, как в HybridRecommender.get_user_type.'''
+    events = pd.read_parquet(cleaned_events_path, columns=['visitorid', 'itemid'])
+    unique_counts = events.drop_duplicates().groupby('visitorid').size()
+    max_visitorid = int(unique_counts.index.max()) if len(unique_counts) else 0
+    return {
+        'active': unique_counts.index[unique_counts >= ACTIVE_MIN_ITEMS].to_numpy(),
+        'passive': unique_counts.index[unique_counts < ACTIVE_MIN_ITEMS].to_numpy(),
+        # Новые — id, которых нет в истории
+        'new': np.arange(max_visitorid + 1, max_visitorid + 1 + 100_000),
+    }
+
+
+def synthesize_mix(cleaned_events_path, n, mix=None, top_n=3, seed=0):
+    '''n запросов: тип пользователя выбирается с вероятностями mix, пользователь — равновероятно внутри типа.'''
+    mix = mix or DEFAULT_MIX
+    visitors = visitors_by_type(cleaned_events_path)
+    types = [t for t in mix if len(visitors[t])]
+    weights = np.array([mix[t] for t in types], dtype=float)
+    rng = np.random.default_rng(seed)
+    drawn = rng.choice(len(types), size=n, p=weights / weights.sum())
+    requests = []
+    for k in drawn:
+        user_type = types[k]
+        requests.append({'user_id': int(rng.choice(visitors[user_type])), 'top_n': top_n, 'user_type': user_type})
+    return requests
+
+
+def parse_mix(text):
+    '''"new=0.2,passive=0.3,active=0.5" → словарь долей.'''
+    mix = {}
+    for part in text.split(','):
+        name, value = part.split('=')
+        mix[name.strip()] = float(value)
+    return mix
+
+
+def load_requests(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def save_requests(path, requests):
+    with open(path, 'w', encoding='utf-8') as f:
+        for request in requests:
+            f.write(json.dumps(request) + '\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Генерация смеси запросов рекомендаций")
+    parser.add_argument('--events', default=config.CLEANED_EVENTS_PATH)
+    parser.add_argument('--n', type=int, default=10_000)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX, help="например new=0.2,passive=0.3,active=0.5")
+    parser.add_argument('--top-n', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+    requests = synthesize_mix(args.events, args.n, args.mix, args.top_n, args.seed)
+    save_requests(args.out, requests)
+    print(f"Сохранено {len(requests)} запросов в {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+'''
+Массовая загрузка parquet-файлов в БД.
+
+Файлы читаются порциями (record batches) через pyarrow и вставляются через
+SQLAlchemy Core executemany — без ORM-объектов и построчного iterrows.
+Для SQLite на время загрузки включаются WAL и synchronous=OFF.
+
+    python -m db.bulk_load            # загрузка в config.DB_PATH
+'''
+import argparse
+import logging
+from contextlib import contextmanager
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from sqlalchemy import delete, insert, select
+from tqdm import tqdm
+
+import config
+from utils.tracing import stage
+from db.engine import create_db_engine
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50_000
+
+# Колонки parquet → колонки таблицы (если имена различаются)
+ITEM_COLUMNS = {'itemid': 'itemid', 'property': 'properties', 'value_length': 'value_length', 'depth': 'depth'}
+
+
+@contextmanager
+def sqlite_bulk_mode(connection):
+    '''WAL и synchronous=OFF на время загрузки; прежний synchronous восстанавливается.'''
+    if connection.dialect.name != 'sqlite':
+        yield
+        return
+    driver = connection.connection.driver_connection
+    previous = driver.execute("PRAGMA synchronous").fetchone()[0]
+    driver.execute("PRAGMA journal_mode=WAL")
+    driver.execute("PRAGMA synchronous=OFF")
+    try:
+        yield
+    finally:
+        driver.execute(f"PRAGMA synchronous={int(previous)}")
+
+
+def _to_timestamp(column):
+    '''Время события: целые — миллисекунды от эпохи, datetime оставляем как есть.'''
+    if pa.types.is_integer(column.type):
+        return pc.cast(column, pa.timestamp('ms'))
+    return column
+
+
+def _prepare(batch, columns):
+    '''Порция pyarrow → список словарей для executemany: переименование, типы Python, время.'''
+    arrays = {}
+    for source, target in columns.items():
+        column = batch.column(source)
+        if pa.types.is_dictionary(column.type):
+            column = column.dictionary_decode()
+        if source == 'timestamp':
+            column = _to_timestamp(column)
+        arrays[target] = column
+    return pa.Table.from_pydict(arrays).to_pylist()
+
+
+def _table_columns(table, path):
+    names = set(pq.read_schema(path).names)
+    return {c.name: c.name for c in table.columns if c.name in names}
+
+
+@contextmanager
+def without_indexes(connection, table):
+    '''Вторичные индексы удаляются на время вставки и строятся заново одним проходом.'''
+    indexes = list(table.indexes)
+    for index in indexes:
+        index.drop(bind=connection, checkfirst=True)
+    yield
+    for index in indexes:
+        index.create(bind=connection, checkfirst=True)
+
+
+def load_parquet(connection, table, path, columns=None, batch_size=BATCH_SIZE, progress=True):
+    '''Вставляет parquet-файл в таблицу порциями; columns — {колонка parquet: колонка таблицы}.'''
+    columns = columns or _table_columns(table, path)
+    parquet = pq.ParquetFile(path)
+    statement = insert(table)
+    inserted = 0
+    with tqdm(total=parquet.metadata.num_rows, desc=table.name, unit='rows', disable=not progress) as bar:
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=list(columns)):
+            rows = _prepare(batch, columns)
+            if rows:
+                connection.execute(statement, rows)
+            inserted += len(rows)
+            bar.update(len(rows))
+    logger.info("Таблица %s: загружено %d строк из %s", table.name, inserted, path)
+    return inserted
+
+
+def load_users(connection, table, events_path, batch_size=BATCH_SIZE, progress=True):
+    '''Уникальные visitorid из событий; файл читается только по одной колонке.'''
+    parquet = pq.ParquetFile(events_path)
+    visitorids = np.unique(np.concatenate([
+        batch.column('visitorid').to_numpy(zero_copy_only=False)
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=['visitorid'])
+    ] or [np.array([], dtype=np.int64)]))
+    statement = insert(table)
+    with tqdm(total=len(visitorids), desc=table.name, unit='rows', disable=not progress) as bar:
+        for start in range(0, len(visitorids), batch_size):
+            chunk = visitorids[start:start + batch_size]
+            connection.execute(statement, [{'visitorid': v} for v in chunk.tolist()])
+            bar.update(len(chunk))
+    logger.info("Таблица %s: загружено %d строк", table.name, len(visitorids))
+    return len(visitorids)
+
+
+def bulk_load(engine, events_path=config.CLEANED_EVENTS_PATH, items_path=config.ITEMS_PATH,
+              ranker_path=config.RANKER_DATA_PATH, batch_size=BATCH_SIZE, progress=True):
+    '''
+    Загружает пользователей, товары, действия и данные ранжировщика целиком одной транзакцией:
+    при ошибке на любой таблице БД остаётся пустой, и следующий запуск повторит загрузку.
+    '''
+    from db.users import User, Item, Action, RankerData
+
+    counts = {}
+    steps = [
+        (User, lambda conn: load_users(conn, User.__table__, events_path, batch_size, progress)),
+        (Item, lambda conn: load_parquet(conn, Item.__table__, items_path, ITEM_COLUMNS, batch_size, progress)),
+        (Action, lambda conn: load_parquet(conn, Action.__table__, events_path, None, batch_size, progress)),
+        (RankerData, lambda conn: load_parquet(conn, RankerData.__table__, ranker_path, None, batch_size, progress)),
+    ]
+    with engine.connect() as connection, sqlite_bulk_mode(connection), connection.begin():
+        for model, load in steps:
+            with stage(model.__tablename__), without_indexes(connection, model.__table__):
+                counts[model.__tablename__] = load(connection)
+    return counts
+
+
+def _models():
+    from db.users import User, Item, Action, RankerData
+    return User, Item, Action, RankerData
+
+
+def filled_tables(engine):
+    '''Имена таблиц, в которых уже есть строки.'''
+    with engine.connect() as connection:
+        return [model.__tablename__ for model in _models()
+                if connection.execute(select(model.id).limit(1)).first() is not None]
+
+
+def clear_tables(engine):
+    '''Удаляет строки всех таблиц (например, после прерванной загрузки старой версии).'''
+    with engine.begin() as connection:
+        for model in reversed(_models()):
+            connection.execute(delete(model.__table__))
+
+
+def prepare_load(engine):
+    '''
+    True, если данные нужно загружать. Частично заполненная БД (загрузка прервалась
+    на одной из таблиц) очищается, чтобы загрузка прошла заново целиком.
+    '''
+    filled = filled_tables(engine)
+    if not filled:
+        return True
+    if len(filled) == len(_models()):
+        return False
+    logger.warning("БД заполнена частично (%s), таблицы очищаются для повторной загрузки", ", ".join(filled))
+    clear_tables(engine)
+    return True
+
+
+def main():
+    from db.db import db
+    from db.users import User  # noqa: F401 — регистрирует модели в metadata
+
+    parser = argparse.ArgumentParser(description="Массовая загрузка parquet-файлов в БД")
+    parser.add_argument('--db', default=config.DB_PATH)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    engine = create_db_engine(args.db)
+    db.metadata.create_all(engine)
+    if not prepare_load(engine):
+        print("✅ Таблицы уже заполнены, загрузка данных пропущена.")
+        return
+    counts = bulk_load(engine, batch_size=args.batch_size)
+    print("[+] Данные успешно загружены в БД: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
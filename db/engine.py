@@ -0,0 +1,66 @@
+'''
+Настройка движка БД: URI (SQLite по пути или серверная БД из config.DATABASE_URL),
+пул соединений и PRAGMA для SQLite, выставляемые при каждом новом подключении.
+
+WAL позволяет читателям не ждать писателя, mmap и увеличенный кэш страниц
+сокращают системные вызовы на чтение, busy_timeout заменяет мгновенное
+"database is locked" ожиданием.
+'''
+from sqlalchemy import create_engine, event
+
+import config
+
+
+def database_uri(db_path=config.DB_PATH):
+    return config.DATABASE_URL or f"sqlite:///{db_path}"
+
+
+def sqlite_pragmas():
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',  # с WAL безопасно: теряются лишь последние транзакции при сбое ОС
+        'mmap_size': config.SQLITE_MMAP_SIZE,
+        'cache_size': -config.SQLITE_CACHE_SIZE_KB,  # отрицательное значение — в КиБ
+        'busy_timeout': config.SQLITE_BUSY_TIMEOUT_MS,
+        'temp_store': 'MEMORY',
+    }
+
+
+def engine_options(uri):
+    '''Параметры create_engine (и SQLALCHEMY_ENGINE_OPTIONS) для URI.'''
+    options = {'pool_size': config.DB_POOL_SIZE, 'max_overflow': config.DB_MAX_OVERFLOW}
+    if uri.startswith('sqlite'):
+        # Соединение может вернуться в пул из другого потока (gunicorn threads)
+        options['connect_args'] = {'check_same_thread': False, 'timeout': config.SQLITE_BUSY_TIMEOUT_MS / 1000}
+    else:
+        options['pool_pre_ping'] = True
+        options['pool_recycle'] = config.DB_POOL_RECYCLE
+    return options
+
+
+def _set_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in sqlite_pragmas().items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def tune_engine(engine):
+    '''Подключает PRAGMA к новым соединениям движка SQLite (для остальных диалектов ничего не делает).'''
+    if engine.dialect.name == 'sqlite' and not event.contains(engine, 'connect', _set_pragmas):
+        event.listen(engine, 'connect', _set_pragmas)
+    return engine
+
+
+def configure_app(app, db_path=config.DB_PATH):
+    '''URI и параметры пула для Flask-SQLAlchemy; вызывается до db.init_app.'''
+    uri = database_uri(db_path)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(uri)
+    return uri
+
+
+def create_db_engine(db_path=config.DB_PATH):
+    '''Настроенный движок вне Flask (CLI, бенчмарки).'''
+    uri = database_uri(db_path)
+    return tune_engine(create_engine(uri, **engine_options(uri)))
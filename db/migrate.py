@@ -0,0 +1,31 @@
+'''
+Миграция схемы существующей БД: создаёт отсутствующие индексы моделей из db/users.py.
+
+Запуск из корня проекта (повторный запуск ничего не меняет):
+    python -m db.migrate --db db/users.db
+
+На большой таблице actions построение индексов занимает время, поэтому его лучше
+выполнить до выкладки; init_db при старте делает то же самое через ensure_indexes.
+'''
+import argparse
+import time
+
+import config
+from db.engine import create_db_engine
+
+
+def main():
+    from db.db import ensure_indexes
+
+    parser = argparse.ArgumentParser(description="Создание отсутствующих индексов в существующей БД")
+    parser.add_argument('--db', default=config.DB_PATH)
+    args = parser.parse_args()
+
+    engine = create_db_engine(args.db)
+    start = time.time()
+    ensure_indexes(engine)
+    print(f"[+] Индексы проверены и созданы за {time.time() - start:.1f} сек.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+'''
+Лёгкие запросы к истории пользователей: только нужные колонки (без гидрации ORM-объектов),
+keyset-пагинация по (timestamp, id) и выборка по многим visitorid за один запрос.
+Запросы опираются на составные индексы из db/users.py.
+'''
+from sqlalchemy import select, tuple_
+
+from db.db import db
+
+# Колонки по умолчанию: то, что показывает страница пользователя
+ACTION_FIELDS = ('timestamp', 'event', 'itemid')
+PAGE_SIZE = 100
+# Ограничение SQLite на число параметров в одном запросе (с запасом)
+MAX_IN_PARAMS = 900
+
+
+def _columns(model, names):
+    return [getattr(model, name) for name in names]
+
+
+def _chunks(values, size=MAX_IN_PARAMS):
+    values = list(dict.fromkeys(int(v) for v in values))
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def user_actions(visitorid, columns=ACTION_FIELDS, limit=PAGE_SIZE, after=None, session=None):
+    '''
+    Страница действий пользователя в хронологическом порядке.
+    after — курсор (timestamp, id) последней строки предыдущей страницы.
+    Возвращает (строки, курсор следующей страницы или None).
+    '''
+    from db.users import Action
+
+    session = session or db.session
+    query = (select(Action.timestamp, Action.id, *_columns(Action, columns))
+             .where(Action.visitorid == visitorid)
+             .order_by(Action.timestamp, Action.id)
+             .limit(limit))
+    if after is not None:
+        query = query.where(tuple_(Action.timestamp, Action.id) > tuple_(*after))
+    rows = session.execute(query).all()
+    next_cursor = (rows[-1][0], rows[-1][1]) if len(rows) == limit else None
+    return [row[2:] for row in rows], next_cursor
+
+
+def users_actions(visitorids, columns=ACTION_FIELDS, session=None):
+    '''Действия многих пользователей: {visitorid: [строки по времени]}; один запрос на порцию id.'''
+    from db.users import Action
+
+    session = session or db.session
+    result = {}
+    for chunk in _chunks(visitorids):
+        query = (select(Action.visitorid, *_columns(Action, columns))
+                 .where(Action.visitorid.in_(chunk))
+                 .order_by(Action.visitorid, Action.timestamp, Action.id))
+        for row in session.execute(query):
+            result.setdefault(row[0], []).append(row[1:])
+    return result
+
+
+def ranker_rows(visitorids, columns, session=None):
+    '''Признаки ранжировщика для многих пользователей: список строк (visitorid, itemid, *columns).'''
+    from db.users import RankerData
+
+    session = session or db.session
+    rows = []
+    for chunk in _chunks(visitorids):
+        query = (select(RankerData.visitorid, RankerData.itemid, *_columns(RankerData, columns))
+                 .where(RankerData.visitorid.in_(chunk))
+                 .order_by(RankerData.visitorid, RankerData.itemid))
+        rows.extend(session.execute(query).all())
+    return rows
@@ -22,6 +22,10 @@ class Item(db.Model):
 # Таблица действий пользователей с товарами
 class Action(db.Model):
     __tablename__ = 'actions'
+    __table_args__ = (
+        db.Index('ix_actions_visitorid_timestamp', 'visitorid', 'timestamp'),  # история пользователя по времени
+        db.Index('ix_actions_itemid_timestamp', 'itemid', 'timestamp'),  # действия с товаром
+    )
     
     id = db.Column(db.Integer, primary_key=True)  # Идентификатор действия
     timestamp = db.Column(db.DateTime, nullable=False)  # Время события (timestamp)
@@ -50,6 +54,9 @@ class Action(db.Model):
 # Таблица для данных из df_ranker (для модели CatBoost)
 class RankerData(db.Model):
     __tablename__ = 'ranker_data'
+    __table_args__ = (
+        db.Index('ix_ranker_data_visitorid_itemid', 'visitorid', 'itemid'),  # признаки пар пользователя
+    )
     
     id = db.Column(db.Integer, primary_key=True)  # Идентификатор записи
     visitorid = db.Column(db.Integer, nullable=False)  # Идентификатор пользователя (visitorid)
@@ -0,0 +1,30 @@
+# Конфигурация gunicorn: gunicorn -c gunicorn.conf.py app:app
+import logging
+import os
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 4))
+threads = int(os.environ.get("GUNICORN_THREADS", 1))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+# Приложение (и вместе с ним AnnoyIndex, CatBoost и mmap-артефакты) загружается
+# один раз в мастер-процессе до fork: воркеры получают общие страницы памяти
+# вместо собственной копии данных. Фоновый поток загрузки не переживает fork,
+# поэтому при STAGED_STARTUP=1 каждый воркер загружается сам (mmap-артефакты
+# при этом всё равно общие через page cache).
+preload_app = os.environ.get("STAGED_STARTUP", "0") != "1"
+
+
+def post_fork(server, worker):
+    # Поток записи логов остался в мастере — запускаем свой в воркере
+    from utils.utils_logging import after_fork
+    after_fork()
+    # Соединения с БД, открытые в мастере, нельзя разделять между процессами
+    from app import app
+    from db.db import db
+    with app.app_context():
+        db.engine.dispose()
+    # Пул потоков CatBoost создан в мастере и в воркер не переходит — прогреваем заново
+    if app.recommender is not None:
+        app.recommender.ranker.after_fork()
+    logging.getLogger(__name__).info("Воркер %s запущен", worker.pid)
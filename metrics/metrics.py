@@ -34,7 +34,8 @@ def update_precision_metric():
     recommended = rec.get('items', [])
     hits = rec.get('hits', 0)
 
-    if user_id and recommended:
+    # Пока модель загружается (поэтапный старт), тип пользователя определить нельзя
+    if user_id and recommended and current_app.recommender is not None:
         user_type = current_app.recommender.get_user_type(user_id)
         precision = hits / min(len(recommended), 3)
 
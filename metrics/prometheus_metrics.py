@@ -19,6 +19,20 @@ REQUEST_LATENCY = Histogram('app_request_latency_seconds', 'Время обра
 RECOMMENDATION_REQUESTS = Counter('recommendation_requests_total', 'Запросы к рекомендательной системе')
 RECOMMENDATION_TYPE = Counter('recommendation_type_count', 'Тип пользователя в рекомендациях', ['user_type'])
 RECOMMENDATION_LENGTH = Histogram('recommendation_length', 'Длина списка рекомендаций')
+RECOMMENDATION_STAGE_LATENCY = Histogram(
+    'recommendation_stage_latency_seconds',
+    'Время этапов расчёта рекомендаций',
+    ['stage', 'user_type'],
+    buckets=(.0001, .00025, .0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5)
+)
+RANKER_BUDGET_FALLBACKS = Counter('ranker_budget_fallback_total',
+                                  'Ответы контентной моделью: ранжировщик не уложился в бюджет времени')
+
+# Метрики кэша похожих товаров
+SIMILAR_CACHE_HITS = Counter('similar_items_cache_hits_total', 'Попадания в кэш похожих товаров', ['source'])
+SIMILAR_CACHE_MISSES = Counter('similar_items_cache_misses_total', 'Промахи кэша похожих товаров (запросы к Annoy)')
+SIMILAR_CACHE_EVICTIONS = Counter('similar_items_cache_evictions_total', 'Вытеснения из кэша похожих товаров', ['reason'])
+SIMILAR_CACHE_SIZE = Gauge('similar_items_cache_size', 'Число товаров в кэше похожих товаров')
 
 # Метрики действий с товарами
 ITEM_VIEW = Counter('item_view_total', 'Просмотры товаров')
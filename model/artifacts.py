@@ -0,0 +1,129 @@
+"""
+Артефакты для раздачи рекомендаций в формате, пригодном для mmap.
+
+Parquet-файлы читаются один раз, построенные структуры сохраняются в каталог:
+    meta.json           — популярные товары активной группы, время сборки и размеры/mtime исходных файлов
+    catalogue/*.npy     — каталог товаров
+    user_index/*.npy    — индекс взаимодействий пользователей
+    ranker_store/*.npy  — признаки ранжировщика
+Воркеры открывают .npy через mmap и делят одну копию данных в page cache.
+Если исходные parquet-файлы или модель изменились после сборки (preprocess_data,
+utils/incremental), артефакты считаются устаревшими и не используются.
+
+Запуск из корня проекта:
+    python -m model.artifacts --out model/artifacts
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+
+import config
+from utils.item_catalogue import ItemCatalogue
+from utils.mmap_arrays import load_meta
+from utils.ranker_store import RankerFeatureStore
+from utils.user_index import UserInteractionIndex
+
+logger = logging.getLogger(__name__)
+
+CATALOGUE_DIR = 'catalogue'
+USER_INDEX_DIR = 'user_index'
+RANKER_STORE_DIR = 'ranker_store'
+
+
+def source_paths(model_path=config.MODEL_PATH, items_path=config.ITEMS_PATH,
+                 cleaned_events_path=config.CLEANED_EVENTS_PATH, ranker_data_path=config.RANKER_DATA_PATH):
+    '''Файлы, из которых строятся артефакты: {имя: путь}.'''
+    return {'model': model_path, 'items': items_path, 'cleaned_events': cleaned_events_path,
+            'ranker_data': ranker_data_path}
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def export_artifacts(out_dir, model_path=config.MODEL_PATH, items_path=config.ITEMS_PATH,
+                     cleaned_events_path=config.CLEANED_EVENTS_PATH, ranker_data_path=config.RANKER_DATA_PATH):
+    from model.recommend_system import HybridRecommender, build_components
+
+    start_time = time.time()
+    ranker = HybridRecommender._load_ranker(model_path)
+    components = build_components(items_path, cleaned_events_path, ranker_data_path, ranker)
+
+    # Пишем во временный каталог и подменяем целиком: уже запущенные воркеры
+    # продолжают читать старые файлы, пока не перезапустятся
+    tmp_dir = f'{out_dir}.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    components['catalogue'].save(os.path.join(tmp_dir, CATALOGUE_DIR))
+    components['user_index'].save(os.path.join(tmp_dir, USER_INDEX_DIR))
+    components['ranker_store'].save(os.path.join(tmp_dir, RANKER_STORE_DIR))
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump({
+            'popular_items_active': [int(item) for item in components['popular_items_active']],
+            'created_at': time.time(),
+            'sources': {name: _file_signature(path) for name, path in
+                        source_paths(model_path, items_path, cleaned_events_path, ranker_data_path).items()}
+        }, f, indent=2)
+
+    old_dir = f'{out_dir}.old'
+    shutil.rmtree(old_dir, ignore_errors=True)
+    if os.path.exists(out_dir):
+        os.replace(out_dir, old_dir)
+    os.replace(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    logger.info("Артефакты сохранены в %s за %.1f сек.", out_dir, time.time() - start_time)
+
+
+def load_components(artifacts_dir):
+    """Открывает артефакты; возвращает те же компоненты, что и build_components."""
+    meta = load_meta(artifacts_dir)
+    catalogue = ItemCatalogue.load(os.path.join(artifacts_dir, CATALOGUE_DIR))
+    user_index = UserInteractionIndex.load(os.path.join(artifacts_dir, USER_INDEX_DIR))
+    ranker_store = RankerFeatureStore.load(os.path.join(artifacts_dir, RANKER_STORE_DIR))
+    logger.info("Артефакты открыты через mmap: %d пользователей, %d строк ранжировщика",
+                len(user_index), len(ranker_store))
+    return {
+        'catalogue': catalogue,
+        'user_index': user_index,
+        'ranker_store': ranker_store,
+        'popular_items_active': meta['popular_items_active']
+    }
+
+
+def stale_sources(artifacts_dir, sources):
+    '''Исходные файлы, изменившиеся после сборки артефактов (или не записанные в meta.json).'''
+    recorded = load_meta(artifacts_dir).get('sources', {})
+    return [name for name, path in sources.items()
+            if not os.path.exists(path) or recorded.get(name) != _file_signature(path)]
+
+
+def artifacts_available(artifacts_dir, sources=None):
+    '''
+    Артефакты собраны и не устарели относительно sources (по умолчанию — пути из config).
+    Устаревшие артефакты не используются: в лог пишется предупреждение, данные читаются из parquet.
+    '''
+    if not artifacts_dir or not os.path.exists(os.path.join(artifacts_dir, 'meta.json')):
+        return False
+    stale = stale_sources(artifacts_dir, sources or source_paths())
+    if stale:
+        logger.warning("Артефакты %s устарели (изменились: %s), загрузка из parquet; "
+                       "пересоберите их: python -m model.artifacts", artifacts_dir, ", ".join(stale))
+        return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Экспорт артефактов рекомендателя для загрузки через mmap")
+    parser.add_argument('--out', default=config.ARTIFACTS_DIR, help="каталог артефактов")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    export_artifacts(args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Офлайн-расчёт матрицы k ближайших соседей для всех товаров AnnoyIndex.
+
+Запуск из корня проекта:
+    python -m model.build_neighbours --k 10 --workers 8
+
+Результат — .npy-матрица (n_items, K) int32: строка i содержит индексы Annoy
+соседей элемента i (без него самого), дополненные -1. HybridRecommender
+открывает её через mmap, и поиск похожих товаров сводится к индексации массива.
+Рядом сохраняется <out>.json с отпечатком индекса: матрица, построенная
+для другого индекса, при загрузке отклоняется.
+"""
+import argparse
+import logging
+import os
+import time
+from multiprocessing import Pool
+
+import numpy as np
+from annoy import AnnoyIndex
+
+import config
+from utils.cache import NO_NEIGHBOUR, annoy_fingerprint, write_store_meta
+
+logger = logging.getLogger(__name__)
+
+_index = None
+
+
+def _init_worker(index_path, dims, metric):
+    # Каждый процесс открывает индекс сам: Annoy загружает файл через mmap,
+    # поэтому память под индекс у процессов общая
+    global _index
+    _index = AnnoyIndex(dims, metric=metric)
+    _index.load(index_path)
+
+
+def _chunk_neighbours(args):
+    start, stop, k, search_k = args
+    rows = np.full((stop - start, k), NO_NEIGHBOUR, dtype=np.int32)
+    for idx in range(start, stop):
+        neighbours = [i for i in _index.get_nns_by_item(idx, k + 1, search_k=search_k) if i != idx][:k]
+        rows[idx - start, :len(neighbours)] = neighbours
+    return start, rows
+
+
+def build_neighbours(index_path, out_path, k=10, workers=None, chunk_size=2000, search_k=-1,
+                     dims=config.ANNOY_DIMS, metric=config.ANNOY_METRIC):
+    index = AnnoyIndex(dims, metric=metric)
+    index.load(index_path)
+    n_items = index.get_n_items()
+    index.unload()
+    fingerprint = annoy_fingerprint(index_path, n_items)
+
+    workers = workers or os.cpu_count()
+    logger.info("Расчёт %d соседей для %d товаров, процессов: %d", k, n_items, workers)
+
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    tmp_path = f'{out_path}.tmp'
+    matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int32, shape=(n_items, k))
+
+    tasks = [(start, min(start + chunk_size, n_items), k, search_k) for start in range(0, n_items, chunk_size)]
+    start_time = time.time()
+    with Pool(workers, initializer=_init_worker, initargs=(index_path, dims, metric)) as pool:
+        for done, (start, rows) in enumerate(pool.imap_unordered(_chunk_neighbours, tasks), 1):
+            matrix[start:start + len(rows)] = rows
+            if done % 10 == 0 or done == len(tasks):
+                logger.info("Готово %d/%d блоков за %.1f сек.", done, len(tasks), time.time() - start_time)
+
+    matrix.flush()
+    del matrix
+    os.replace(tmp_path, out_path)
+    write_store_meta(out_path, fingerprint, k)
+    logger.info("Матрица соседей сохранена в %s", out_path)
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Матрица k ближайших соседей для всех товаров AnnoyIndex")
+    parser.add_argument('--index', default=config.ANNOY_INDEX_PATH, help="путь к item_index.ann")
+    parser.add_argument('--out', default=config.NEIGHBOURS_PATH, help="куда сохранить .npy")
+    parser.add_argument('--k', type=int, default=config.SIMILAR_MAX_K, help="число соседей")
+    parser.add_argument('--workers', type=int, default=None, help="число процессов (по умолчанию — все ядра)")
+    parser.add_argument('--chunk-size', type=int, default=2000, help="товаров в одной задаче")
+    parser.add_argument('--search-k', type=int, default=-1, help="параметр search_k для Annoy")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    build_neighbours(args.index, args.out, k=args.k, workers=args.workers, chunk_size=args.chunk_size,
+                     search_k=args.search_k)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,63 +1,148 @@
+import json
+
 import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Допустимые политики для вещественных колонок: float16 теряет точность
+# (conversion, time_to_purchase и т.п.), поэтому ниже float32 не опускаемся
+FLOAT_POLICIES = ('float32', 'float64')
+
+UINT_TYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+INT_TYPES = (np.int8, np.int16, np.int32, np.int64)
+
+
+def column_stats(df):
+    """min/max всех числовых колонок за один проход (колонки — строки результата)."""
+    numeric = df.select_dtypes(include=[np.integer, np.floating])
+    if numeric.shape[1] == 0:
+        return pd.DataFrame(columns=['min', 'max'], dtype=float)
+    return numeric.agg(['min', 'max']).T
+
+
+def parquet_stats(paths):
+    """min/max числовых колонок по статистике row group-ов parquet — без чтения самих данных."""
+    mins, maxs = {}, {}
+    for path in paths:
+        metadata = pq.ParquetFile(path).metadata
+        for rg in range(metadata.num_row_groups):
+            row_group = metadata.row_group(rg)
+            for i in range(row_group.num_columns):
+                column = row_group.column(i)
+                name = column.path_in_schema
+                stats = column.statistics
+                if stats is None or not stats.has_min_max or isinstance(stats.min, (str, bytes)):
+                    # Без статистики колонку нельзя безопасно сузить
+                    mins[name] = maxs[name] = None
+                    continue
+                if name in mins and mins[name] is None:
+                    continue
+                mins[name] = stats.min if name not in mins else min(mins[name], stats.min)
+                maxs[name] = stats.max if name not in maxs else max(maxs[name], stats.max)
+    stats = pd.DataFrame({'min': pd.Series(mins, dtype=object), 'max': pd.Series(maxs, dtype=object)})
+    return stats.dropna()
+
+
+def _smallest_int(col_min, col_max):
+    candidates = UINT_TYPES if col_min >= 0 else INT_TYPES
+    for candidate in candidates:
+        info = np.iinfo(candidate)
+        if info.min <= col_min and col_max <= info.max:
+            return np.dtype(candidate).name
+    return None
+
+
+def plan_dtypes(dtypes, stats, float_dtype='float32'):
+    """
+    План приведения типов: {колонка: dtype}.
+    Целые — в наименьший подходящий (u)int, вещественные — в float_dtype, если значения помещаются,
+    строки — в category. Колонки без статистики и прочие типы остаются как есть.
+    """
+    if float_dtype not in FLOAT_POLICIES:
+        raise ValueError(f"float_dtype должен быть одним из {FLOAT_POLICIES}, получено {float_dtype!r}")
+
+    plan = {}
+    for col, dtype in dtypes.items():
+        planned = str(dtype)
+        if dtype == 'object' or pd.api.types.is_string_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype):
+            planned = 'category'
+        elif col in stats.index and pd.api.types.is_integer_dtype(dtype):
+            planned = _smallest_int(stats.at[col, 'min'], stats.at[col, 'max']) or planned
+        elif col in stats.index and pd.api.types.is_float_dtype(dtype):
+            info = np.finfo(float_dtype)
+            col_min, col_max = stats.at[col, 'min'], stats.at[col, 'max']
+            fits = pd.isna(col_min) or (info.min <= col_min and col_max <= info.max)
+            planned = float_dtype if fits and np.dtype(dtype).itemsize >= np.dtype(float_dtype).itemsize else planned
+        plan[col] = planned
+    return plan
+
+
+def downcast_plan(df, float_dtype='float32'):
+    """План приведения типов для DataFrame."""
+    return plan_dtypes(df.dtypes, column_stats(df), float_dtype)
+
+
+def arrow_schema(schema):
+    """Схема pyarrow для плана: её можно передать в pd.read_parquet(..., schema=...)."""
+    fields = []
+    for col, dtype in schema.items():
+        if dtype == 'category':
+            arrow_type = pa.dictionary(pa.int32(), pa.string())
+        elif dtype.startswith('datetime64'):
+            arrow_type = pa.timestamp(np.datetime_data(np.dtype(dtype))[0])
+        else:
+            arrow_type = pa.from_numpy_dtype(np.dtype(dtype))
+        fields.append((col, arrow_type))
+    return pa.schema(fields)
+
+
+def read_parquet(path, schema, columns=None):
+    """Читает parquet сразу в типы плана (приведение выполняет pyarrow при чтении)."""
+    columns = list(schema) if columns is None else columns
+    return pd.read_parquet(path, columns=columns, schema=arrow_schema({c: schema[c] for c in columns}))
+
+
+def read_csv(path, schema, **kwargs):
+    """Читает CSV сразу в типы плана; даты разбираются отдельно (parse_dates)."""
+    dtype = {col: t for col, t in schema.items() if not t.startswith('datetime64')}
+    return pd.read_csv(path, dtype=dtype, **kwargs)
+
+
+def schema_path(parquet_path):
+    """Файл плана типов рядом с parquet: cleaned_events.parquet → cleaned_events.schema.json."""
+    return parquet_path[:-len('.parquet')] + '.schema.json'
+
+
+def save_schema(path, schema):
+    with open(path, 'w') as f:
+        json.dump(schema, f, indent=2)
+
+
+def load_schema(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def optimize_memory_usage(df, float_dtype='float32', schema=None, verbose=True):
+    """
+    Функция для оптимизации использования памяти в DataFrame (используется в ноутбуках model/).
+    schema — готовый план (например, load_schema(schema_path(...))), иначе он строится по данным.
+    """
+    if verbose:
+        # Сохраняем начальный размер памяти
+        initial_memory = df.memory_usage(deep=True).sum()
+        print(f"Начальный размер памяти: {initial_memory / (1024 ** 2):.2f} MB")
+
+    plan = schema if schema is not None else downcast_plan(df, float_dtype)
+    changed = {col: dtype for col, dtype in plan.items() if col in df.columns and str(df[col].dtype) != dtype}
+    if changed:
+        df = df.astype(changed)
+
+    if verbose:
+        # Сохраняем конечный размер памяти
+        final_memory = df.memory_usage(deep=True).sum()
+        print(f"Конечный размер памяти: {final_memory / (1024 ** 2):.2f} MB")
+        print(f"Экономия памяти: {(initial_memory - final_memory) / (1024 ** 2):.2f} MB")
 
-def optimize_memory_usage(df):
-    """Функция для оптимизации использования памяти в DataFrame."""
-    
-    # Сохраняем начальный размер памяти
-    initial_memory = df.memory_usage(deep=True).sum()
-    print(f"Начальный размер памяти: {initial_memory / (1024 ** 2):.2f} MB")
-    
-    # Проходим по всем столбцам DataFrame
-    for col in df.columns:
-        col_type = df[col].dtype
-        
-        # Преобразование object, str в category
-        if col_type == 'object':
-            df[col] = df[col].astype('category')
-        elif col_type == 'string':
-            df[col] = df[col].astype('category')
-        
-        # Уменьшение числовых типов
-        elif col_type in ['int64', 'int32', 'int16', 'int8']:
-            # Если все значения положительные, пробуем преобразовать сразу в uint
-            if (df[col] >= 0).all():
-                # Пробуем уменьшить до uint8, если возможно
-                if df[col].max() <= np.iinfo(np.uint8).max:
-                    df[col] = df[col].astype(np.uint8)
-                # Пробуем уменьшить до uint16, если возможно
-                elif df[col].max() <= np.iinfo(np.uint16).max:
-                    df[col] = df[col].astype(np.uint16)
-                # Пробуем уменьшить до uint32, если возможно
-                elif df[col].max() <= np.iinfo(np.uint32).max:
-                    df[col] = df[col].astype(np.uint32)
-            else:
-                # Если есть отрицательные значения, пробуем уменьшить до меньшего знакового типа
-                if df[col].min() >= np.iinfo(np.int8).min and df[col].max() <= np.iinfo(np.int8).max:
-                    df[col] = df[col].astype(np.int8)
-                elif df[col].min() >= np.iinfo(np.int16).min and df[col].max() <= np.iinfo(np.int16).max:
-                    df[col] = df[col].astype(np.int16)
-                elif df[col].min() >= np.iinfo(np.int32).min and df[col].max() <= np.iinfo(np.int32).max:
-                    df[col] = df[col].astype(np.int32)
-        
-        elif col_type in ['uint32', 'uint16']:
-            # Уменьшение uint типов, если возможно
-            if df[col].max() <= np.iinfo(np.uint8).max:
-                df[col] = df[col].astype(np.uint8)
-            elif df[col].max() <= np.iinfo(np.uint16).max:
-                df[col] = df[col].astype(np.uint16)
-        
-        elif col_type in ['float64', 'float32']:
-            # Пробуем уменьшить до float16, если возможно
-            if df[col].min() >= np.finfo(np.float16).min and df[col].max() <= np.finfo(np.float16).max:
-                df[col] = df[col].astype(np.float16)
-            # Пробуем уменьшить др float32
-            elif df[col].min() >= np.finfo(np.float32).min and df[col].max() <= np.finfo(np.float32).max:
-                df[col] = df[col].astype(np.float32)
-
-
-    # Сохраняем конечный размер памяти
-    final_memory = df.memory_usage(deep=True).sum()
-    print(f"Конечный размер памяти: {final_memory / (1024 ** 2):.2f} MB")
-    print(f"Экономия памяти: {(initial_memory - final_memory) / (1024 ** 2):.2f} MB")
-    
-    return df
\ No newline at end of file
+    return df
@@ -0,0 +1,74 @@
+"""
+Офлайн-расчёт рекомендаций для всех известных пользователей.
+
+Запуск из корня проекта:
+    python -m model.precompute --top-n 3 --alpha 0.7 --batch-size 10000
+
+Результат записывается новой версией в config.PRECOMPUTED_DIR, после чего
+файл CURRENT атомарно переключается на неё — работающие воркеры подхватят
+таблицу при следующей проверке. Таблица отвечает только на запросы с теми же
+top_n и alpha, остальные считаются на лету.
+"""
+import argparse
+from datetime import datetime
+import logging
+import os
+import time
+
+import config
+from model.recommend_system import HybridRecommender
+from utils.precomputed import RecommendationTable, cleanup_versions, publish_version
+
+logger = logging.getLogger(__name__)
+
+
+def precompute(recommender, out_dir, top_n=3, alpha=0.7, batch_size=10000, keep=2):
+    user_ids = recommender.user_index.user_ids.tolist()
+    logger.info("Предрасчёт рекомендаций для %d пользователей, top_n=%d, alpha=%s", len(user_ids), top_n, alpha)
+
+    start_time = time.time()
+    results = {}
+    for start in range(0, len(user_ids), batch_size):
+        results.update(recommender.get_recommendations_batch(user_ids[start:start + batch_size], top_n=top_n,
+                                                                  alpha=alpha))
+        logger.info("Обработано %d/%d пользователей за %.1f сек.", min(start + batch_size, len(user_ids)),
+                    len(user_ids), time.time() - start_time)
+
+    os.makedirs(out_dir, exist_ok=True)
+    # Микросекунды и pid: два запуска в одну секунду не должны совпасть по имени версии
+    version = f"{datetime.now().strftime('v%Y%m%d%H%M%S%f')}-{os.getpid()}"
+    tmp_path = os.path.join(out_dir, f'.tmp-{version}')
+    RecommendationTable.write(tmp_path, results, top_n, alpha)
+    os.replace(tmp_path, os.path.join(out_dir, version))
+    publish_version(out_dir, version)
+    cleanup_versions(out_dir, keep=keep)
+    logger.info("Опубликована версия %s в %s", version, out_dir)
+    return version
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Предрасчёт рекомендаций для всех известных visitorid")
+    parser.add_argument('--out', default=config.PRECOMPUTED_DIR, help="каталог с версиями таблицы")
+    parser.add_argument('--top-n', type=int, default=3, help="длина списка рекомендаций")
+    parser.add_argument('--alpha', type=float, default=0.7, help="вес ранжировщика при смешивании для активных")
+    parser.add_argument('--batch-size', type=int, default=10000, help="пользователей в одном пакете")
+    parser.add_argument('--keep', type=int, default=2, help="сколько последних версий хранить")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    recommender = HybridRecommender(
+        model_path=config.MODEL_PATH,
+        annoy_index_path=config.ANNOY_INDEX_PATH,
+        items_path=config.ITEMS_PATH,
+        cleaned_events_path=config.CLEANED_EVENTS_PATH,
+        ranker_data_path=config.RANKER_DATA_PATH,
+        ranker_thread_count=-1,  # офлайн-расчёт: CatBoost использует все ядра
+        # Те же кандидаты, что и при расчёте на лету, иначе таблица и живой путь разойдутся в top-N
+        candidate_budget=config.CANDIDATE_BUDGET,
+        candidate_options=config.CANDIDATE_OPTIONS
+    )
+    precompute(recommender, args.out, top_n=args.top_n, alpha=args.alpha, batch_size=args.batch_size, keep=args.keep)
+
+
+if __name__ == '__main__':
+    main()
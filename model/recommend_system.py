@@ -1,133 +1,381 @@
+import numpy as np
 import pandas as pd
 from annoy import AnnoyIndex
 from catboost import CatBoostRanker
 from collections import Counter
 import logging
-import logging.handlers
 import random
 import time
 import os
 
-from utils.cache import SimilarItemsCache
+from utils.cache import SimilarItemsCache, SharedNeighbourStore, annoy_fingerprint
+from utils.user_index import UserInteractionIndex
+from utils.ranker_store import RankerFeatureStore, resolve_feature_names
+from utils.ranker_inference import RankerInference
+from utils.candidates import CandidateGenerator
+from utils.precomputed import PrecomputedRecommendations
+from utils.item_catalogue import ItemCatalogue
+from utils.coalesce import RequestCoalescer
+from utils.tracing import stage, tracing
+from metrics.prometheus_metrics import RECOMMENDATION_STAGE_LATENCY, RANKER_BUDGET_FALLBACKS
+import config
 
-if not os.path.exists('logs'):
-    os.makedirs('logs')
+# Обработчики настраивает utils.utils_logging.setup_logging; строки «на каждый запрос»
+# идут в отдельный логгер, который прореживается (config.LOG_SAMPLE_RATES)
+logger = logging.getLogger(__name__)
+request_logger = logging.getLogger(__name__ + '.requests')
 
-log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-log_file = 'logs/recommender.log'
-log_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024, backupCount=5)
-log_handler.setFormatter(log_formatter)
+# Минимальное число уникальных товаров, начиная с которого пользователь считается активным
+ACTIVE_MIN_ITEMS = 3
 
-logger = logging.getLogger(__name__)
-logger.setLevel(logging.INFO)
-logger.addHandler(log_handler)
 
-logger.info("Логирование для рекомендательной системы настроено.")
+def build_components(items_path, cleaned_events_path, ranker_data_path, ranker):
+    """
+    Читает parquet-файлы и строит структуры, нужные для раздачи рекомендаций:
+    каталог товаров, индекс взаимодействий, хранилище признаков ранжировщика
+    и популярные товары активной группы.
+    """
+    # Каталог товаров: строка каталога совпадает с индексом товара в AnnoyIndex
+    catalogue = ItemCatalogue.from_frame(pd.read_parquet(items_path).reset_index(drop=True))
+    logger.info("Каталог товаров построен: %d товаров", len(catalogue))
+
+    cleaned_events = pd.read_parquet(cleaned_events_path)
+
+    # Индекс взаимодействий: все запросы по истории пользователя — срезы массивов
+    user_index = UserInteractionIndex.from_events(cleaned_events)
+    logger.info("Индекс взаимодействий построен: %d пользователей", len(user_index))
+
+    # Признаки ранжировщика: float32-матрица с диапазонами строк по пользователям
+    ranker_data = pd.read_parquet(ranker_data_path)
+    feature_names = resolve_feature_names(ranker, ranker_data.columns)
+    ranker_store = RankerFeatureStore.from_frame(ranker_data, feature_names, user_index)
+    del ranker_data
+    logger.info("Хранилище признаков ранжировщика построено: %d строк, %d признаков",
+                len(ranker_store), len(feature_names))
+
+    filtered_users = user_index.user_ids[user_index.unique_counts >= ACTIVE_MIN_ITEMS]
+    active_set = cleaned_events[cleaned_events['visitorid'].isin(filtered_users)]
+    popular_items_active = active_set['itemid'].value_counts().head(2).index.tolist()
+
+    return {
+        'catalogue': catalogue,
+        'user_index': user_index,
+        'ranker_store': ranker_store,
+        'popular_items_active': popular_items_active
+    }
 
 
 class HybridRecommender:
-    def __init__(self, model_path, annoy_index_path, items_path, cleaned_events_path, ranker_data_path):
+    def __init__(self, model_path, annoy_index_path, items_path, cleaned_events_path, ranker_data_path, **options):
         logger.info("Инициализация гибридной рекомендательной системы...")
+        ranker = self._load_ranker(model_path)
+        components = build_components(items_path, cleaned_events_path, ranker_data_path, ranker)
+        self._setup(ranker, annoy_index_path, **components, **options)
 
-        self.items = pd.read_parquet(items_path).reset_index(drop=True)
-        self.cleaned_events = pd.read_parquet(cleaned_events_path)
-        self.ranker_data = pd.read_parquet(ranker_data_path)
+    @classmethod
+    def from_artifacts(cls, artifacts_dir, model_path, annoy_index_path, **options):
+        """
+        Загружает рекомендатель из каталога, подготовленного model/artifacts.py.
+        Большие массивы открываются через mmap, поэтому воркеры gunicorn делят
+        одну копию данных в page cache вместо собственной копии pandas-фреймов.
+        """
+        logger.info("Инициализация гибридной рекомендательной системы из артефактов %s...", artifacts_dir)
+        from model.artifacts import load_components
 
-        self.ranker = CatBoostRanker()
-        self.ranker.load_model(model_path)
+        recommender = cls.__new__(cls)
+        ranker = recommender._load_ranker(model_path)
+        recommender._setup(ranker, annoy_index_path, **load_components(artifacts_dir), **options)
+        return recommender
 
-        self.annoy_index = AnnoyIndex(602, metric='angular')
+    @staticmethod
+    def _load_ranker(model_path):
+        ranker = CatBoostRanker()
+        ranker.load_model(model_path)
+        return ranker
+
+    def _setup(self, ranker, annoy_index_path, catalogue, user_index, ranker_store, popular_items_active,
+               precomputed_dir=None, precomputed_reload_interval=30,
+               similar_max_k=10, similar_cache_size=10000, similar_cache_ttl=None, similar_store_path=None,
+               neighbours_path=None, trace_stages=False, ranker_thread_count=1, ranker_time_budget=None,
+               candidate_budget=0, candidate_options=None):
+        # Признаки подаются в порядке хранилища; прогрев — до первого запроса
+        self.ranker = RankerInference(ranker, ranker_store.feature_names, thread_count=ranker_thread_count,
+                                      time_budget=ranker_time_budget)
+        self.ranker.warm_up()
+        # Гистограммы длительности этапов (RECOMMENDATION_STAGE_LATENCY) для каждого запроса
+        self.trace_stages = trace_stages
+        self.catalogue = catalogue
+        self.user_index = user_index
+        self.ranker_store = ranker_store
+        self.popular_items_active = popular_items_active
+
+        self.annoy_index = AnnoyIndex(config.ANNOY_DIMS, metric=config.ANNOY_METRIC)
         self.annoy_index.load(annoy_index_path)
 
-        self.itemid_to_index = dict(zip(self.items['itemid'], self.items.index))
-        self.index_to_itemid = dict(zip(self.items.index, self.items['itemid']))
+        # Отображения itemid ↔ индекс Annoy без python-словарей на весь каталог
+        self.itemid_to_index = self.catalogue
+        self.index_to_itemid = self.catalogue.itemids
+
+        # Предрассчитанная матрица соседей имеет приоритет над заполняемым на лету хранилищем
+        neighbour_store = None
+        fingerprint = annoy_fingerprint(annoy_index_path, self.annoy_index.get_n_items())
+        if neighbours_path and os.path.exists(neighbours_path):
+            neighbour_store = SharedNeighbourStore(neighbours_path, writable=False)
+            # После пересборки индекса строки матрицы указывали бы на другие товары
+            problem = neighbour_store.mismatch(self.annoy_index.get_n_items(), similar_max_k, fingerprint)
+            if problem is None:
+                logger.info("Матрица соседей загружена через mmap: %s, K=%d", neighbours_path, neighbour_store.k)
+            else:
+                logger.error("Матрица соседей %s не подходит индексу (%s) и не используется; пересоберите её: "
+                             "python -m model.build_neighbours", neighbours_path, problem)
+                neighbour_store = None
+        if neighbour_store is None and similar_store_path:
+            # Хранилище переживает пересборку индекса — отпечаток индекса проверяется при открытии
+            neighbour_store = SharedNeighbourStore(similar_store_path, n_items=self.annoy_index.get_n_items(),
+                                                   k=similar_max_k, fingerprint=fingerprint)
+        self.sim_cache = SimilarItemsCache(self.annoy_index, self.itemid_to_index, self.index_to_itemid,
+                                           max_k=similar_max_k, maxsize=similar_cache_size, ttl=similar_cache_ttl,
+                                           store=neighbour_store)
+
+        # Первый этап для активных: ограниченный набор кандидатов вместо всех строк df_ranker
+        self.candidate_generator = None
+        if candidate_budget:
+            self.candidate_generator = CandidateGenerator.build(
+                user_index, ranker_store, self.sim_cache, ACTIVE_MIN_ITEMS, budget=candidate_budget,
+                **(candidate_options or {}))
+            logger.info("Генератор кандидатов: бюджет %d, совместная встречаемость для %d товаров",
+                        candidate_budget, len(self.candidate_generator.cooccurrence.item_ids))
 
-        self.sim_cache = SimilarItemsCache(self.annoy_index, self.itemid_to_index, self.index_to_itemid)
+        # Одновременные одинаковые запросы рекомендаций считаются один раз
+        self.coalescer = RequestCoalescer()
 
-        user_unique_items = self.cleaned_events.groupby('visitorid')['itemid'].nunique()
-        filtered_users = user_unique_items[user_unique_items >= 3].index
-        self.active_set = self.cleaned_events[self.cleaned_events['visitorid'].isin(filtered_users)]
-        self.popular_items_active = self.active_set['itemid'].value_counts().head(2).index.tolist()
-        self.active_users_set = set(filtered_users)
+        # Режим раздачи предрассчитанных рекомендаций (см. model/precompute.py)
+        self.precomputed = None
+        if precomputed_dir:
+            self.precomputed = PrecomputedRecommendations(precomputed_dir, reload_interval=precomputed_reload_interval)
 
-        logger.info(f"AnnoyIndex содержит {self.annoy_index.get_n_items()} элементов")
+        logger.info("AnnoyIndex содержит %d элементов", self.annoy_index.get_n_items())
         logger.info("Гибридная рекомендательная система готова к работе.")
 
     def get_user_type(self, user_id):
-        if user_id in self.active_users_set:
+        unique_items = self.user_index.unique_items_count(user_id)
+        if unique_items is None:
+            return "new"
+        if unique_items >= ACTIVE_MIN_ITEMS:
             return "active"
+        return "passive"
 
-        user_events = self.cleaned_events[self.cleaned_events['visitorid'] == user_id]
-        if user_events.empty:
-            return "new"
-        else:
-            return "passive"
+    def get_item(self, item_id):
+        """Поля товара (itemid, property, value_length, depth) или None, если товара нет."""
+        return self.catalogue.get(item_id)
 
-    def get_recommendations(self, user_id, top_n=3, alpha=0.7):
-        start_time = time.time()
-        logger.info(f"Запрос рекомендаций для пользователя: {user_id}")
+    def get_items(self, item_ids):
+        """Поля товаров в порядке item_ids; отсутствующие товары пропускаются."""
+        return self.catalogue.get_many(item_ids)
 
-        user_type = self.get_user_type(user_id)
-        logger.info(f"Пользователь {user_id} классифицирован как {user_type}")
+    def get_user_history(self, user_id):
+        """Уникальные пары (itemid, event) пользователя в порядке первого появления."""
+        return self.user_index.history(user_id)
 
-        if user_type == "new":
-            popular_items = self.popular_items_active
+    def _recommend_new(self):
+        popular_items = self.popular_items_active
+        with stage('similar'):
             similar_item_for_popular = self.sim_cache.get_similar_items(popular_items[0], top_n=1)
-            recommendations = popular_items + similar_item_for_popular
+        return popular_items + similar_item_for_popular
 
-        elif user_type == "passive":
-            user_items = list(set(self.cleaned_events[self.cleaned_events['visitorid'] == user_id]['itemid'].tolist()))
+    def _recommend_passive(self, user_id):
+        with stage('history'):
+            user_items = self.user_index.seen_items(user_id).tolist()
             random.shuffle(user_items)
 
-            similar_items = []
+        similar_items = []
+        with stage('similar'):
             for item in user_items:
                 if item in self.itemid_to_index:
                     similar_items = self.sim_cache.get_similar_items(item, top_n=2)
                     if similar_items:
                         break
 
-            if not similar_items:
-                logger.warning(f"[passive] Не удалось найти похожих товаров ни для одного из {len(user_items)} itemid.")
-                popular_items = self.popular_items_active
-                similar_item_for_popular = self.sim_cache.get_similar_items(popular_items[0], top_n=1)
-                recommendations = popular_items + similar_item_for_popular
-            else:
-                recommendations = similar_items + self.popular_items_active
+        if not similar_items:
+            request_logger.warning("[passive] Не удалось найти похожих товаров ни для одного из %d itemid.", len(user_items))
+            return self._recommend_new()
+        return similar_items + self.popular_items_active
 
-        elif user_type == "active":
-            seen_items = set(self.cleaned_events[self.cleaned_events['visitorid'] == user_id]['itemid'].tolist())
-            user_data = self.ranker_data[self.ranker_data['visitorid'] == user_id]
-            user_data = user_data[~user_data['itemid'].isin(seen_items)]
+    def _rank_candidates(self, candidate_items, scores, top_n):
+        """Top-N itemid по убыванию скора ранжировщика."""
+        ranked = np.argsort(-scores, kind='stable')[:top_n]
+        return candidate_items[ranked].tolist()
 
-            if user_data.empty:
-                logger.warning(f"Пользователь {user_id} уже видел все товары.")
-                recommendations = self.items['itemid'].head(top_n).tolist()
-            else:
-                features = [col for col in user_data.columns if col not in ['label', 'visitorid', 'itemid']]
-                user_data['score'] = self.ranker.predict(user_data[features])
-                ranker_items = user_data.sort_values('score', ascending=False)['itemid'].head(top_n).tolist()
+    def _blend_active(self, ranker_items, neighbours, top_n, alpha):
+        """Взвешивает товары ранжировщика и похожие на них товары контентной модели."""
+        content_recommendations = []
+        for rec_item in ranker_items:
+            content_recommendations.extend(neighbours[rec_item])
 
-                content_recommendations = []
-                for rec_item in ranker_items:
-                    content_recommendations.extend(self.sim_cache.get_similar_items(rec_item, top_n=2))
+        weighted_scores = Counter()
+        for i, item in enumerate(ranker_items):
+            weighted_scores[item] += alpha * (top_n - i)
+        for i, item in enumerate(content_recommendations):
+            weighted_scores[item] += (1 - alpha) * (top_n - i)
 
-                weighted_scores = Counter()
-                for i, item in enumerate(ranker_items):
-                    weighted_scores[item] += alpha * (top_n - i)
-                for i, item in enumerate(content_recommendations):
-                    weighted_scores[item] += (1 - alpha) * (top_n - i)
+        return [item for item, _ in weighted_scores.most_common()]
 
-                recommendations = [item for item, _ in weighted_scores.most_common()]
+    def _candidates(self, user_id):
+        if self.candidate_generator is not None:
+            return self.candidate_generator.candidates(user_id)
+        return self.ranker_store.candidates(user_id)
 
-        else:
-            recommendations = []
+    def _recommend_active(self, user_id, top_n, alpha):
+        with stage('candidates'):
+            candidate_items, candidate_features = self._candidates(user_id)
 
-        # Финальная обработка: убираем дубликаты и обрезаем
-        unique_recommendations = list(dict.fromkeys(recommendations))[:top_n]
-        logger.info(f"Итоговые рекомендации (len={len(unique_recommendations)}): {unique_recommendations}")
-        logger.info(f"Рекомендации сгенерированы за {time.time() - start_time:.2f} сек.")
+        if len(candidate_items) == 0:
+            request_logger.warning("Пользователь %s уже видел все товары.", user_id)
+            return self.catalogue.itemids[:top_n].tolist()
+
+        with stage('predict'):
+            scores = self.ranker.predict_within(candidate_features)
+        if scores is None:
+            # Ранжировщик не уложился в бюджет времени — отвечаем контентной моделью
+            RANKER_BUDGET_FALLBACKS.inc()
+            request_logger.warning("Ранжировщик не уложился в %.3f сек. для %s, контентные рекомендации",
+                                   self.ranker.time_budget, user_id)
+            return self._recommend_passive(user_id)
+        with stage('rank'):
+            ranker_items = self._rank_candidates(candidate_items, scores, top_n)
+        with stage('similar'):
+            neighbours = {item: self.sim_cache.get_similar_items(item, top_n=2) for item in ranker_items}
+        with stage('blend'):
+            return self._blend_active(ranker_items, neighbours, top_n, alpha)
 
+    @staticmethod
+    def _finalize(user_type, recommendations, top_n):
+        # Финальная обработка: убираем дубликаты и обрезаем
         return {
             "status": user_type,
-            "recommendations": unique_recommendations
-        }
\ No newline at end of file
+            "recommendations": list(dict.fromkeys(recommendations))[:top_n]
+        }
+
+    def get_recommendations(self, user_id, top_n=3, alpha=0.7, trace=False):
+        """
+        Рекомендации для пользователя. При trace=True в результат добавляется
+        разбивка времени по этапам (timings, мс), она же пишется в лог.
+        """
+        with tracing(self.trace_stages or trace) as current:
+            with stage('total'):
+                result = self._get_recommendations(user_id, top_n, alpha)
+            if current is None:
+                return result
+            current.user_type = result['status']
+            if self.trace_stages:
+                current.observe(RECOMMENDATION_STAGE_LATENCY)
+            if trace:
+                timings = current.breakdown()
+                logger.info("Этапы расчёта для %s (%s), мс: %s", user_id, current.user_type, timings,
+                            extra={'user_id': user_id, 'user_type': current.user_type, 'timings': timings})
+                result = {**result, 'timings': timings}
+        return result
+
+    def _get_recommendations(self, user_id, top_n, alpha):
+        start_time = time.time()
+
+        if self.precomputed is not None:
+            with stage('precomputed'):
+                result = self.precomputed.get(user_id, top_n, alpha)
+            if result is not None:
+                request_logger.info("Рекомендации для %s взяты из предрассчитанной таблицы: %s",
+                                    user_id, result['recommendations'])
+                return result
+
+        with stage('user_type'):
+            user_type = self.get_user_type(user_id)
+
+        if user_type == "new":
+            recommendations = self._recommend_new()
+        elif user_type == "passive":
+            recommendations = self._recommend_passive(user_id)
+        elif user_type == "active":
+            recommendations = self._recommend_active(user_id, top_n, alpha)
+        else:
+            recommendations = []
+
+        with stage('finalize'):
+            result = self._finalize(user_type, recommendations, top_n)
+        elapsed = time.time() - start_time
+        request_logger.info("Рекомендации для %s (%s) за %.3f сек.: %s", user_id, user_type, elapsed,
+                            result["recommendations"], extra={'user_id': user_id, 'user_type': user_type,
+                                                               'elapsed': elapsed})
+
+        return result
+
+    def get_recommendations_coalesced(self, user_id, top_n=3, alpha=0.7, trace=False):
+        """
+        То же, что get_recommendations, но одновременные запросы с одинаковыми
+        параметрами обслуживаются одним вычислением. Каждый вызывающий получает
+        собственную копию результата.
+        """
+        result = self.coalescer.run((user_id, top_n, alpha, trace),
+                                    lambda: self.get_recommendations(user_id, top_n=top_n, alpha=alpha, trace=trace))
+        copy = {"status": result["status"], "recommendations": list(result["recommendations"])}
+        if "timings" in result:
+            copy["timings"] = dict(result["timings"])
+        return copy
+
+    def get_recommendations_batch(self, user_ids, top_n=3, alpha=0.7):
+        """
+        Пакетная версия get_recommendations для офлайн-расчётов.
+
+        Пользователи группируются по типу, кандидаты всех активных пользователей
+        скорятся одним вызовом ranker.predict, а поиск соседей в Annoy выполняется
+        один раз на уникальный товар. Результаты совпадают с get_recommendations
+        (для пассивных пользователей — с точностью до случайного выбора товара).
+
+        Возвращает словарь {user_id: {"status": ..., "recommendations": [...]}}.
+        """
+        start_time = time.time()
+        user_ids = list(dict.fromkeys(user_ids))
+        groups = {"new": [], "passive": [], "active": []}
+        for user_id in user_ids:
+            groups[self.get_user_type(user_id)].append(user_id)
+        logger.info("Пакетный запрос рекомендаций: %d пользователей (new=%d, passive=%d, active=%d)",
+                    len(user_ids), len(groups['new']), len(groups['passive']), len(groups['active']))
+
+        results = {}
+        if groups["new"]:
+            new_result = self._finalize("new", self._recommend_new(), top_n)
+            for user_id in groups["new"]:
+                results[user_id] = {"status": "new", "recommendations": list(new_result["recommendations"])}
+
+        for user_id in groups["passive"]:
+            results[user_id] = self._finalize("passive", self._recommend_passive(user_id), top_n)
+
+        # Активные: собираем кандидатов всех пользователей в одну матрицу
+        scored_users, blocks_items, blocks_features = [], [], []
+        for user_id in groups["active"]:
+            candidate_items, candidate_features = self._candidates(user_id)
+            if len(candidate_items) == 0:
+                request_logger.warning("Пользователь %s уже видел все товары.", user_id)
+                results[user_id] = self._finalize("active", self.catalogue.itemids[:top_n].tolist(), top_n)
+                continue
+            scored_users.append(user_id)
+            blocks_items.append(candidate_items)
+            blocks_features.append(candidate_features)
+
+        if scored_users:
+            scores = self.ranker.predict(np.concatenate(blocks_features))
+            bounds = np.cumsum([0] + [len(items) for items in blocks_items])
+            ranker_items = {
+                user_id: self._rank_candidates(items, scores[bounds[k]:bounds[k + 1]], top_n)
+                for k, (user_id, items) in enumerate(zip(scored_users, blocks_items))
+            }
+
+            # Соседей ищем один раз на каждый уникальный товар во всём пакете
+            unique_items = dict.fromkeys(item for items in ranker_items.values() for item in items)
+            neighbours = {item: self.sim_cache.get_similar_items(item, top_n=2) for item in unique_items}
+
+            for user_id in scored_users:
+                recommendations = self._blend_active(ranker_items[user_id], neighbours, top_n, alpha)
+                results[user_id] = self._finalize("active", recommendations, top_n)
+
+        logger.info("Пакетные рекомендации сгенерированы за %.2f сек.", time.time() - start_time)
+        return results
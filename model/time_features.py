@@ -1,31 +1,88 @@
+from functools import lru_cache
+
 import holidays
+import numpy as np
 import pandas as pd
-def generate_time_features(df, col='timestamp', holidays_year=2015):
-    df['dayofmonth'] = df[col].dt.day    # день месяца
-    df['month'] = df[col].dt.month       # месяц
-    df['dayofweek'] = df[col].dt.dayofweek # день недели как порядковый номер
-    df['dayofweek_str'] = df[col].dt.day_name() # название дня недели
-    df['week_of_year'] = df[col].dt.isocalendar().week # номер недели в году
-    
-    df['is_weekend'] = df['dayofweek'].isin([5, 6])  # выходные дни (суббота-воскресенье)
-    russian_holidays = holidays.RU(years=holidays_year)  # праздники в 2015 году
-    df['is_holiday'] = df[col].dt.date.isin(russian_holidays.keys()) # праздничные дни
-    
-    df['hour'] = df[col].dt.hour # час дня
-    def part_of_day(hour):
-        if 6 <= hour < 12:
-            return 'Morning'
-        elif 12 <= hour < 18:
-            return 'Afternoon'
-        elif 18 <= hour < 22:
-            return 'Evening'
-        else:
-            return 'Night'
-    df['part_of_day'] = df['hour'].apply(part_of_day) # группировка часов по времени дня
-    
+
+DAY_NAMES = np.array(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'], dtype=object)
+PARTS_OF_DAY = np.array(['Night', 'Morning', 'Afternoon', 'Evening'], dtype=object)
+
+# Время суток для каждого часа: 6-12 Morning, 12-18 Afternoon, 18-22 Evening, иначе Night
+_HOURS = np.arange(24)
+HOUR_PART_CODES = np.select(
+    [(6 <= _HOURS) & (_HOURS < 12), (12 <= _HOURS) & (_HOURS < 18), (18 <= _HOURS) & (_HOURS < 22)],
+    [1, 2, 3],
+    default=0
+).astype(np.uint8)
+
+
+@lru_cache(maxsize=None)
+def holiday_day_numbers(years):
+    '''Отсортированные номера дней (от 1970-01-01) праздников РФ за годы years.'''
+    days = sorted(holidays.RU(years=list(years)).keys())
+    return np.array(days, dtype='datetime64[D]').astype(np.int64)
+
+
+def generate_time_features(df, col='timestamp', holidays_year=None, compact=False):
+    '''
+    Добавляет временные признаки по колонке col.
+    Праздники берутся за все годы, встречающиеся в данных (или за holidays_year, если он задан).
+    compact=True пропускает неиспользуемые строковые колонки (dayofweek_str),
+    part_of_day делает категориальной, а целочисленные признаки — uint8.
+    '''
+    ts = df[col]
+    values = ts.to_numpy(dtype='datetime64[ns]')
+    days = values.astype('datetime64[D]')
+    day_numbers = days.astype(np.int64)
+
+    df['dayofmonth'] = ts.dt.day    # день месяца
+    df['month'] = ts.dt.month       # месяц
+    dayofweek = ((day_numbers + 3) % 7).astype(np.uint8)  # 1970-01-01 — четверг
+    df['dayofweek'] = dayofweek if compact else dayofweek.astype(np.int32)  # день недели как порядковый номер
+    if not compact:
+        df['dayofweek_str'] = DAY_NAMES[dayofweek]  # название дня недели
+    df['week_of_year'] = ts.dt.isocalendar().week  # номер недели в году
+
+    df['is_weekend'] = dayofweek >= 5  # выходные дни (суббота-воскресенье)
+    if holidays_year is not None:
+        years = (holidays_year,)
+    elif len(values):
+        years = tuple(range(ts.min().year, ts.max().year + 1))
+    else:
+        years = ()
+    df['is_holiday'] = np.isin(day_numbers, holiday_day_numbers(years))  # праздничные дни
+
+    hour = ((values - days) // np.timedelta64(1, 'h')).astype(np.uint8)
+    df['hour'] = hour if compact else hour.astype(np.int32)  # час дня
+    part_codes = HOUR_PART_CODES[hour]  # группировка часов по времени дня
+    if compact:
+        df['dayofmonth'] = df['dayofmonth'].astype(np.uint8)
+        df['month'] = df['month'].astype(np.uint8)
+        df['week_of_year'] = df['week_of_year'].astype(np.uint8)
+        df['part_of_day'] = pd.Categorical.from_codes(part_codes, PARTS_OF_DAY)
+    else:
+        df['part_of_day'] = PARTS_OF_DAY[part_codes]
+
     '''
     Разница во времени между текущим и предыдущим событием. Это может помочь выявить, как часто происходят события.
     '''
-    df['time_diff_ms'] = df[col].diff().dt.total_seconds()*1000 # разница в миллисекундах
-    
-    return df
\ No newline at end of file
+    df['time_diff_ms'] = ts.diff().dt.total_seconds()*1000 # разница в миллисекундах
+
+    return df
+
+
+def context_features(timestamp_ms):
+    '''
+    dayofweek, is_weekend, is_holiday и hour для одного момента (мс от эпохи, UTC, как timestamp в events.csv) —
+    те же значения, что generate_time_features дал бы строке с этим временем.
+    '''
+    value = np.datetime64(int(timestamp_ms), 'ms')
+    day = value.astype('datetime64[D]')
+    day_number = int(day.astype(np.int64))
+    dayofweek = (day_number + 3) % 7  # 1970-01-01 — четверг
+    return {
+        'dayofweek': dayofweek,
+        'is_weekend': dayofweek >= 5,
+        'is_holiday': bool(np.isin(day_number, holiday_day_numbers((day.astype(object).year,)))),
+        'hour': int((value - day) // np.timedelta64(1, 'h')),
+    }
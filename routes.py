@@ -1,4 +1,4 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, current_app, jsonify, abort
 from metrics.prometheus_metrics import (
     REQUEST_COUNT, REQUEST_LATENCY,
     RECOMMENDATION_REQUESTS, RECOMMENDATION_TYPE, RECOMMENDATION_LENGTH,
@@ -16,6 +16,38 @@ logger = logging.getLogger(__name__)
 # Создание Blueprint
 routes = Blueprint('routes', __name__)
 
+# Максимальная длина списка рекомендаций в JSON API
+MAX_API_TOP_N = 50
+
+# Результат формы /recommendations живёт в сессии только до перехода на страницу пользователя
+PENDING_KEY = 'pending_recommendations'
+PENDING_TTL = 30  # секунд
+
+def get_recommender():
+    """Загруженная модель или быстрый ответ 503, пока идёт поэтапный старт."""
+    recommender = current_app.recommender
+    if recommender is None:
+        abort(current_app.response_class("Сервис загружается, повторите запрос позже.", status=503,
+                                         headers={'Retry-After': '5'}))
+    return recommender
+
+@routes.before_request
+def drop_pending_recommendations():
+    # Любая другая страница после формы — результат больше не нужен и не должен всплыть позже
+    if request.endpoint != 'routes.user_page' and PENDING_KEY in session:
+        session.pop(PENDING_KEY, None)
+
+# Проверка живости процесса: отвечает сразу после старта сервера
+@routes.route('/healthz')
+def healthz():
+    return jsonify({'status': 'ok'})
+
+# Проверка готовности: 200 только после загрузки БД и модели
+@routes.route('/readyz')
+def readyz():
+    status = current_app.startup.status()
+    return jsonify(status), 200 if current_app.startup.ready else 503
+
 # Главная страница
 @routes.route('/')
 def index():
@@ -38,8 +70,8 @@ def recommendations_view():
                 session.pop('cart', None)
             # Сохраняем ID пользователя в сессии
             session['user_id'] = user_id
-            recommender = current_app.recommender
-            recommendations = recommender.get_recommendations(user_id)
+            recommender = get_recommender()
+            recommendations = recommender.get_recommendations_coalesced(user_id)
 
             # METRICS
             RECOMMENDATION_REQUESTS.inc()
@@ -50,6 +82,8 @@ def recommendations_view():
 
             # Track recommendations for future precision calculation
             track_recommendations(user_id, recommendations['recommendations'])
+            # Передаём результат странице пользователя, чтобы она не считала его повторно
+            session[PENDING_KEY] = {'user_id': user_id, 'created_at': time.time(), **recommendations}
 
             if not recommendations:
                 flash("Рекомендации для данного пользователя не найдены.", 'warning')
@@ -58,6 +92,31 @@ def recommendations_view():
             flash("Неверный формат ID пользователя. Введите числовой ID.", 'error')
             return redirect(url_for('routes.index'))
 
+# JSON API рекомендаций: один расчёт на запрос, одновременные одинаковые запросы схлопываются
+@routes.route('/api/v1/recommendations/<int:user_id>')
+def api_recommendations(user_id):
+    start_time = time.time()
+    try:
+        top_n = int(request.args.get('top_n', 3))
+    except ValueError:
+        top_n = None
+    if top_n is None or not 1 <= top_n <= MAX_API_TOP_N:
+        return jsonify({'error': f"top_n должен быть целым числом от 1 до {MAX_API_TOP_N}"}), 400
+
+    # ?trace=1 — разбивка времени расчёта по этапам в ответе (timings, мс)
+    trace = request.args.get('trace') == '1'
+
+    recommender = get_recommender()
+    recommendations = recommender.get_recommendations_coalesced(user_id, top_n=top_n, trace=trace)
+
+    RECOMMENDATION_REQUESTS.inc()
+    RECOMMENDATION_TYPE.labels(user_type=recommendations['status']).inc()
+    RECOMMENDATION_LENGTH.observe(len(recommendations['recommendations']))
+    REQUEST_COUNT.labels(method='GET', endpoint='/api/v1/recommendations').inc()
+    REQUEST_LATENCY.labels(endpoint='/api/v1/recommendations').observe(time.time() - start_time)
+
+    return jsonify({'user_id': user_id, **recommendations})
+
 @routes.route('/search_item', methods=['POST'])
 def search_item():
     item_id = request.form.get('item_id')
@@ -75,13 +134,12 @@ def search_item():
 # Страница товара
 @routes.route('/item/<int:item_id>', methods=['GET', 'POST'])
 def item_view(item_id):
-    recommender = current_app.recommender
-    item_row = recommender.items[recommender.items['itemid'] == item_id]
-    if item_row.empty:
+    recommender = get_recommender()
+    item = recommender.get_item(item_id)
+    if item is None:
         flash("Товар не найден.", 'error')
         return redirect(url_for('routes.index'))
 
-    item = item_row.iloc[0].to_dict()
     item['item_id'] = item['itemid']
     item['properties_list'] = item['property'].split()
 
@@ -119,20 +177,28 @@ def cart_view():
 # Страница пользователя
 @routes.route('/user/<int:user_id>')
 def user_page(user_id):
-    recommender = current_app.recommender
-    rec = recommender.get_recommendations(user_id)
+    start_time = time.time()
+    recommender = get_recommender()
+    # Если пользователь пришёл из формы /recommendations, рекомендации уже посчитаны
+    pending = session.pop(PENDING_KEY, None)
+    if pending and pending.get('user_id') == user_id and time.time() - pending.get('created_at', 0) <= PENDING_TTL:
+        rec = {'status': pending['status'], 'recommendations': pending['recommendations']}
+    else:
+        rec = recommender.get_recommendations_coalesced(user_id)
     if not rec or not rec.get("recommendations"):
         flash("Пользователь не найден или рекомендации отсутствуют.", 'error')
         return redirect(url_for('routes.index'))
 
     itemids = list(dict.fromkeys(rec["recommendations"]))[:3]
-    recommended_items = recommender.items[recommender.items['itemid'].isin(itemids)].to_dict(orient='records')
-    user_actions = recommender.cleaned_events[recommender.cleaned_events['visitorid'] == user_id][['itemid', 'event']].drop_duplicates()
+    recommended_items = recommender.get_items(itemids)
     event_map = {'view': 'просмотрен', 'addtocart': 'добавлен в корзину', 'transaction': 'куплен'}
-    user_actions['event'] = user_actions['event'].map(event_map)
-    actions = user_actions.to_dict(orient='records')
+    actions = [{'itemid': itemid, 'event': event_map.get(event)}
+               for itemid, event in recommender.get_user_history(user_id)]
 
-    return render_template('user_page.html', user={"visitorid": user_id}, actions=actions, recommended_items=recommended_items)
+    page = render_template('user_page.html', user={"visitorid": user_id}, actions=actions, recommended_items=recommended_items)
+    REQUEST_COUNT.labels(method='GET', endpoint='/user').inc()
+    REQUEST_LATENCY.labels(endpoint='/user').observe(time.time() - start_time)
+    return page
 
 @routes.route('/cart/update/<int:item_id>/<action>', methods=['POST'])
 def update_quantity(item_id, action):
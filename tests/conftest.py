@@ -0,0 +1,135 @@
+import os
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import config  # noqa: E402
+from utils.data_preprocessing import preprocess_data  # noqa: E402
+
+N_ITEMS = 120
+N_PARTITIONS = 4
+TS0 = 1433221332000
+RAW_FILES = ('events.csv', 'category_tree.csv', 'item_properties_part1.csv', 'item_properties_part2.csv')
+
+
+def make_raw(data_dir, seed=0):
+    """Генерирует маленький набор сырых CSV в формате исходного датасета."""
+    rng = np.random.default_rng(seed)
+    n_events = 2000
+    events = pd.DataFrame({
+        'timestamp': TS0 + rng.integers(0, 3600 * 1000 * 24 * 120, n_events),
+        # Небольшое ядро частых посетителей и длинный хвост разовых
+        'visitorid': np.where(rng.random(n_events) < 0.8, rng.integers(0, 60, n_events),
+                              rng.integers(60, 800, n_events)),
+        'event': rng.choice(['view', 'addtocart', 'transaction'], n_events, p=[.8, .15, .05]),
+        'itemid': rng.integers(0, N_ITEMS, n_events),
+    })
+    events['transactionid'] = np.where(events['event'] == 'transaction', rng.integers(0, 500, n_events), np.nan)
+    events.to_csv(os.path.join(data_dir, 'events.csv'), index=False)
+
+    categories = pd.DataFrame({'categoryid': np.arange(30),
+                               'parentid': [np.nan if i < 4 else rng.integers(0, i) for i in range(30)]})
+    categories.to_csv(os.path.join(data_dir, 'category_tree.csv'), index=False)
+
+    rows = []
+    for itemid in range(N_ITEMS):
+        for _ in range(rng.integers(1, 6)):
+            prop = rng.choice(['categoryid', 'available', str(rng.integers(0, 40))])
+            if prop == 'categoryid':
+                value = str(rng.integers(0, 30))
+            else:
+                value = ' '.join('n%d.000' % rng.integers(0, 999) for _ in range(rng.integers(1, 4)))
+            rows.append((TS0 + int(rng.integers(0, 1e9)), itemid, prop, value))
+    props = pd.DataFrame(rows, columns=['timestamp', 'itemid', 'property', 'value'])
+    props.iloc[:len(props) // 2].to_csv(os.path.join(data_dir, 'item_properties_part1.csv'), index=False)
+    props.iloc[len(props) // 2:].to_csv(os.path.join(data_dir, 'item_properties_part2.csv'), index=False)
+
+
+def copy_raw(src, dst, events=None):
+    """Копирует сырые CSV в новый каталог, при необходимости подменяя события."""
+    os.makedirs(dst, exist_ok=True)
+    for name in RAW_FILES:
+        if name == 'events.csv' and events is not None:
+            events.to_csv(os.path.join(dst, name), index=False)
+        else:
+            shutil.copy(os.path.join(src, name), dst)
+
+
+@pytest.fixture(scope='session')
+def raw_dir(tmp_path_factory):
+    path = tmp_path_factory.mktemp('raw')
+    make_raw(str(path))
+    return str(path)
+
+
+@pytest.fixture(scope='session')
+def data_dir(raw_dir, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('data'))
+    copy_raw(raw_dir, path)
+    preprocess_data(path, N_PARTITIONS)
+    return path
+
+
+@pytest.fixture(scope='session')
+def model_paths(data_dir, tmp_path_factory):
+    """Крошечный ранкер и индекс Annoy со случайными векторами поверх data_dir."""
+    from annoy import AnnoyIndex
+    from catboost import CatBoostRanker, Pool
+
+    path = str(tmp_path_factory.mktemp('model'))
+    rng = np.random.default_rng(1)
+    ranker_data = pd.read_parquet(os.path.join(data_dir, 'df_ranker.parquet'))
+    # Добавляем пары с непросмотренными товарами, иначе у активных пользователей нет кандидатов
+    extra = ranker_data.sample(frac=0.7, random_state=0).copy()
+    extra['itemid'] = rng.integers(0, N_ITEMS, len(extra)).astype(ranker_data['itemid'].dtype)
+    ranker_data = pd.concat([ranker_data, extra], ignore_index=True)
+    # В настоящем df_ranker пара (visitorid, itemid) встречается один раз
+    ranker_data = ranker_data.drop_duplicates(['visitorid', 'itemid']).reset_index(drop=True)
+    ranker_data_path = os.path.join(path, 'df_ranker.parquet')
+    ranker_data.to_parquet(ranker_data_path)
+
+    train = ranker_data.sort_values('visitorid')
+    features = [c for c in train.columns if c not in ('label', 'visitorid', 'itemid')]
+    model = CatBoostRanker(iterations=10, verbose=False, thread_count=1, random_seed=0,
+                           allow_writing_files=False)
+    model.fit(Pool(train[features], train['label'], group_id=train['visitorid']))
+    model_path = os.path.join(path, 'catboost_ranker.bin')
+    model.save_model(model_path)
+
+    n_items = len(pd.read_parquet(os.path.join(data_dir, 'items.parquet')))
+    index = AnnoyIndex(config.ANNOY_DIMS, metric=config.ANNOY_METRIC)
+    for i in range(n_items):
+        index.add_item(i, rng.standard_normal(config.ANNOY_DIMS).tolist())
+    index.build(5)
+    annoy_path = os.path.join(path, 'item_index.ann')
+    index.save(annoy_path)
+
+    return {
+        'model_path': model_path,
+        'annoy_index_path': annoy_path,
+        'items_path': os.path.join(data_dir, 'items.parquet'),
+        'cleaned_events_path': os.path.join(data_dir, 'cleaned_events.parquet'),
+        'ranker_data_path': ranker_data_path,
+    }
+
+
+@pytest.fixture(scope='session')
+def recommender(model_paths):
+    from model.recommend_system import HybridRecommender
+
+    return HybridRecommender(**model_paths)
+
+
+@pytest.fixture(scope='session')
+def users(recommender):
+    """Пользователи всех трёх типов плюс неизвестные."""
+    user_ids = [int(u) for u in recommender.user_index.user_ids] + [10 ** 9, 10 ** 9 + 1]
+    types = {recommender.get_user_type(u) for u in user_ids}
+    assert types == {'new', 'passive', 'active'}
+    return user_ids
+
@@ -0,0 +1,11 @@
+import random
+
+
+def test_batch_equals_single(recommender, users):
+    # Пассивные пользователи получают случайный товар — одинаковое зерно даёт ту же последовательность
+    random.seed(0)
+    batch = recommender.get_recommendations_batch(users, top_n=5)
+    random.seed(0)
+    for user_id in users:
+        single = recommender.get_recommendations(user_id, top_n=5)
+        assert batch[user_id] == {'status': single['status'], 'recommendations': single['recommendations']}
@@ -0,0 +1,35 @@
+import numpy as np
+
+from model.recommend_system import HybridRecommender
+
+
+def test_zero_budget_scores_full_store(model_paths, recommender, users):
+    limited = HybridRecommender(**model_paths, candidate_budget=0)
+    assert limited.candidate_generator is None
+    active = [u for u in users if recommender.get_user_type(u) == 'active']
+    for user_id in active:
+        items, features = limited._candidates(user_id)
+        expected_items, expected_features = recommender.ranker_store.candidates(user_id)
+        np.testing.assert_array_equal(items, expected_items)
+        np.testing.assert_array_equal(features, expected_features)
+        assert (limited.get_recommendations(user_id, top_n=5)['recommendations']
+                == recommender.get_recommendations(user_id, top_n=5)['recommendations'])
+
+
+def test_candidates_keep_store_features(model_paths, users):
+    budget = 20
+    limited = HybridRecommender(**model_paths, candidate_budget=budget)
+    generator, store = limited.candidate_generator, limited.ranker_store
+    context = [store.feature_names.index(name) for name in generator._context_names]
+    other = [i for i in range(len(store.feature_names)) if i not in context]
+    for user_id in [u for u in users if limited.get_user_type(u) == 'active']:
+        items, features = generator.candidates(user_id)
+        assert len(items) <= budget
+        assert len(set(items.tolist())) == len(items)
+        assert not set(items.tolist()) & set(limited.get_user_history(user_id))
+        # Пары из df_ranker сохраняют свои признаки, кроме контекста момента запроса
+        rows = store._slice(user_id)
+        stored = dict(zip(store.itemids[rows].tolist(), np.asarray(store.features[rows])))
+        for item, row in zip(items.tolist(), features):
+            if item in stored:
+                np.testing.assert_array_equal(row[other], stored[item][other])
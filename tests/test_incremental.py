@@ -0,0 +1,59 @@
+import os
+
+import pandas as pd
+import pytest
+
+import utils.incremental as incremental
+from tests.conftest import N_PARTITIONS, copy_raw
+from utils.data_preprocessing import preprocess_data
+
+
+def _read_sorted(data_dir, name):
+    df = pd.read_parquet(os.path.join(data_dir, name))
+    return df.sort_values(list(df.columns[:4])).reset_index(drop=True).astype(str)
+
+
+@pytest.fixture
+def split_events(raw_dir, tmp_path):
+    """Каталог, обработанный по первой части событий, и CSV с остальными."""
+    events = pd.read_csv(os.path.join(raw_dir, 'events.csv')).sort_values('timestamp', kind='stable')
+    cut = len(events) * 2 // 3
+    data_dir = str(tmp_path / 'incremental')
+    copy_raw(raw_dir, data_dir, events=events.iloc[:cut])
+    preprocess_data(data_dir, N_PARTITIONS)
+    batch_path = str(tmp_path / 'batch.csv')
+    events.iloc[cut:].to_csv(batch_path, index=False)
+    return data_dir, batch_path
+
+
+def _assert_same_as_full(data_dir, full_dir):
+    for name in ('cleaned_events.parquet', 'df_ranker.parquet'):
+        assert _read_sorted(data_dir, name).equals(_read_sorted(full_dir, name)), name
+
+
+def test_incremental_equals_full_rebuild(data_dir, split_events):
+    inc_dir, batch_path = split_events
+    incremental.apply_events(batch_path, inc_dir)
+    _assert_same_as_full(inc_dir, data_dir)
+
+
+def test_incremental_recovers_after_crash(data_dir, split_events, monkeypatch):
+    inc_dir, batch_path = split_events
+    publish = incremental._publish
+
+    def crash(*args):
+        raise RuntimeError('crash')
+
+    # Падение до фиксации: незавершённый staging отбрасывается, пакет применяется заново
+    monkeypatch.setattr(incremental, '_commit', crash)
+    with pytest.raises(RuntimeError):
+        incremental.apply_events(batch_path, inc_dir)
+    monkeypatch.undo()
+
+    # Падение после фиксации: recover() дописывает опубликованное состояние
+    monkeypatch.setattr(incremental, '_publish', crash)
+    with pytest.raises(RuntimeError):
+        incremental.apply_events(batch_path, inc_dir)
+    monkeypatch.setattr(incremental, '_publish', publish)
+    incremental.apply_events(batch_path, inc_dir)
+    _assert_same_as_full(inc_dir, data_dir)
@@ -0,0 +1,23 @@
+import logging
+import random
+
+from utils.utils_logging import SamplingFilter, _LocalQueueHandler
+
+
+def test_sampling_keeps_global_random():
+    record = logging.LogRecord('x', logging.INFO, __file__, 0, 'msg', (), None)
+    sampling = SamplingFilter(0.5)
+    random.seed(0)
+    expected = random.random()
+    random.seed(0)
+    for _ in range(10):
+        sampling.filter(record)
+    assert random.random() == expected
+
+
+def test_queued_message_fixed_at_call():
+    values = [1]
+    record = logging.LogRecord('x', logging.INFO, __file__, 0, 'values %s', (values,), None)
+    prepared = _LocalQueueHandler(None).prepare(record)
+    values.append(2)
+    assert prepared.getMessage() == 'values [1]'
@@ -0,0 +1,18 @@
+import pytest
+
+HUGE_IDS = (2 ** 63, 2 ** 70, -1)
+
+
+@pytest.mark.parametrize('user_id', HUGE_IDS)
+def test_out_of_range_user_is_new(recommender, user_id):
+    assert recommender.get_user_type(user_id) == 'new'
+    assert recommender.get_user_history(user_id) == []
+    assert recommender.ranker_store._slice(user_id) == slice(0, 0)
+    assert recommender.get_recommendations(user_id)['status'] == 'new'
+
+
+@pytest.mark.parametrize('item_id', HUGE_IDS)
+def test_out_of_range_item_missing(recommender, item_id):
+    assert recommender.get_item(item_id) is None
+    known = int(recommender.catalogue.itemids[0])
+    assert [item['itemid'] for item in recommender.get_items([item_id, known])] == [known]
@@ -0,0 +1,20 @@
+import os
+
+from model.optimize_memory_usage import load_schema, read_csv, read_parquet, schema_path
+
+
+def test_saved_plan_loads_compact_types(data_dir, tmp_path):
+    for name in ('cleaned_events.parquet', 'df_ranker.parquet'):
+        path = os.path.join(data_dir, name)
+        schema = load_schema(schema_path(path))
+        df = read_parquet(path, schema)
+        assert {col: str(dtype) for col, dtype in df.dtypes.items()} == schema
+
+        # Выгрузка в CSV читается обратно в те же типы
+        csv_path = str(tmp_path / name.replace('.parquet', '.csv'))
+        df.to_csv(csv_path, index=False)
+        dates = [col for col, dtype in schema.items() if dtype.startswith('datetime64')]
+        restored = read_csv(csv_path, schema, parse_dates=dates)
+        for col, dtype in schema.items():
+            if not dtype.startswith('datetime64'):
+                assert str(restored[col].dtype) == dtype, col
@@ -0,0 +1,17 @@
+import os
+
+from tests.conftest import N_PARTITIONS, copy_raw
+from utils.data_preprocessing import preprocess_data
+
+OUTPUTS = ('items.parquet', 'cleaned_events.parquet', 'df_ranker.parquet')
+
+
+def test_parallel_output_identical(raw_dir, tmp_path):
+    serial, parallel = str(tmp_path / 'serial'), str(tmp_path / 'parallel')
+    copy_raw(raw_dir, serial)
+    copy_raw(raw_dir, parallel)
+    preprocess_data(serial, N_PARTITIONS, workers=1)
+    preprocess_data(parallel, N_PARTITIONS, workers=2)
+    for name in OUTPUTS:
+        with open(os.path.join(serial, name), 'rb') as a, open(os.path.join(parallel, name), 'rb') as b:
+            assert a.read() == b.read(), name
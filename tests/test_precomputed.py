@@ -0,0 +1,18 @@
+from model.precompute import precompute
+from model.recommend_system import HybridRecommender
+
+
+def test_table_matches_live_scoring(model_paths, recommender, users, tmp_path):
+    out_dir = str(tmp_path / 'recommendations')
+    precompute(recommender, out_dir, top_n=3, alpha=0.7)
+    served = HybridRecommender(**model_paths, precomputed_dir=out_dir)
+    table = served.precomputed.table
+    # Пассивные получают случайный товар — сравниваем детерминированные типы
+    checked = [u for u in users if recommender.get_user_type(u) != 'passive']
+    for user_id in checked:
+        for top_n, alpha in ((3, 0.7), (1, 0.7), (2, 0.7), (3, 0.3)):
+            if (top_n, alpha) != (3, 0.7):
+                assert table.get(user_id, top_n, alpha) is None
+            live = recommender.get_recommendations(user_id, top_n=top_n, alpha=alpha)
+            assert served.get_recommendations(user_id, top_n=top_n, alpha=alpha) == live
+    assert any(table.get(u, 3, 0.7) is not None for u in checked)
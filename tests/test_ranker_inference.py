@@ -0,0 +1,20 @@
+import pytest
+from catboost import CatBoostRanker
+
+from utils.ranker_inference import RankerInference
+
+
+@pytest.fixture(scope='module')
+def ranker(model_paths):
+    model = CatBoostRanker()
+    model.load_model(model_paths['model_path'])
+    return model
+
+
+def test_feature_order_checked_at_load(ranker, recommender):
+    names = recommender.ranker_store.feature_names
+    assert RankerInference(ranker, names).feature_names == list(ranker.feature_names_)
+    with pytest.raises(ValueError):
+        RankerInference(ranker, names[::-1])
+    with pytest.raises(ValueError):
+        RankerInference(ranker, names[:-1])
@@ -0,0 +1,57 @@
+import os
+
+import pytest
+from flask import Flask
+
+from routes import PENDING_KEY, routes
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def client(recommender):
+    app = Flask(__name__, template_folder=os.path.join(ROOT, 'templates'))
+    app.config['SECRET_KEY'] = 'test'
+    app.register_blueprint(routes)
+    app.recommender = recommender
+    return app.test_client()
+
+
+@pytest.fixture
+def active_user(recommender, users):
+    return next(u for u in users if recommender.get_user_type(u) == 'active')
+
+
+def test_pending_used_once_by_user_page(client, active_user):
+    client.post('/recommendations', data={'user_id': active_user})
+    with client.session_transaction() as session:
+        assert session[PENDING_KEY]['user_id'] == active_user
+    assert client.get(f'/user/{active_user}').status_code == 200
+    with client.session_transaction() as session:
+        assert PENDING_KEY not in session
+
+
+def test_pending_dropped_by_other_pages(client, active_user):
+    client.post('/recommendations', data={'user_id': active_user})
+    client.get('/')
+    with client.session_transaction() as session:
+        assert PENDING_KEY not in session
+
+
+def test_stale_pending_ignored(client, recommender, active_user, monkeypatch):
+    with client.session_transaction() as session:
+        session[PENDING_KEY] = {'user_id': active_user, 'created_at': 0, 'status': 'active',
+                                'recommendations': [-1]}
+    calls = []
+    live = recommender.get_recommendations_coalesced
+
+    def tracked(user_id, *args, **kwargs):
+        calls.append(user_id)
+        return live(user_id, *args, **kwargs)
+
+    # Просроченный результат не используется — рекомендации считаются заново
+    monkeypatch.setattr(recommender, 'get_recommendations_coalesced', tracked)
+    assert client.get(f'/user/{active_user}').status_code == 200
+    assert calls == [active_user]
+    with client.session_transaction() as session:
+        assert PENDING_KEY not in session
@@ -1,34 +1,280 @@
-from functools import lru_cache
+from collections import OrderedDict
+import hashlib
+import json
 import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from metrics.prometheus_metrics import (
+    SIMILAR_CACHE_HITS, SIMILAR_CACHE_MISSES, SIMILAR_CACHE_EVICTIONS, SIMILAR_CACHE_SIZE
+)
+from utils.startup import file_lock
+
+logger = logging.getLogger(__name__)
+
+# Значения в строках общего хранилища соседей
+NOT_COMPUTED = -2  # строка ещё не заполнена
+NO_NEIGHBOUR = -1  # соседей меньше, чем K
+
+
+def annoy_fingerprint(index_path, n_items, sample=1 << 20):
+    '''
+    Отпечаток файла AnnoyIndex: число элементов, размер и sha1 начала и конца файла.
+    Матрица соседей, построенная для другого индекса, по нему не совпадёт.
+    '''
+    size = os.path.getsize(index_path)
+    digest = hashlib.sha1()
+    with open(index_path, 'rb') as f:
+        digest.update(f.read(sample))
+        if size > sample:
+            f.seek(max(size - sample, sample))
+            digest.update(f.read())
+    return {'n_items': int(n_items), 'size': size, 'sha1': digest.hexdigest()}
+
+
+class NeighbourCache:
+    """
+    Ограниченный по размеру LRU-кэш с необязательным TTL.
+    Ведёт счётчики попаданий, промахов и вытеснений; попадания и вытеснения
+    экспортируются в Prometheus, промахом там считается только запрос к Annoy.
+    """
+
+    def __init__(self, maxsize=10000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.monotonic() - stored_at < self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    SIMILAR_CACHE_HITS.labels(source='memory').inc()
+                    return value
+                del self._data[key]
+                self.evictions += 1
+                SIMILAR_CACHE_EVICTIONS.labels(reason='ttl').inc()
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+                SIMILAR_CACHE_EVICTIONS.labels(reason='size').inc()
+            SIMILAR_CACHE_SIZE.set(len(self._data))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            SIMILAR_CACHE_SIZE.set(0)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+
+class SharedNeighbourStore:
+    """
+    Общее для всех воркеров хранилище соседей: .npy-матрица (n_items, K) int32,
+    открытая через mmap. Строка i — индексы Annoy соседей элемента i без него самого,
+    дополненные NO_NEIGHBOUR; NOT_COMPUTED в первой ячейке означает, что строка не заполнена.
+
+    Воркер, не нашедший строку, считает её сам и записывает: сначала хвост строки,
+    затем первую ячейку, поэтому читатель видит либо NOT_COMPUTED, либо готовую строку.
+    Матрица, построенная model/build_neighbours.py, открывается с writable=False.
+
+    Рядом с матрицей лежит <path>.json с отпечатком AnnoyIndex (annoy_fingerprint) и K.
+    Записываемое хранилище, не совпавшее с текущим индексом или K, пересоздаётся;
+    открытие и пересоздание выполняются под файловой блокировкой, чтобы воркеры
+    не подменяли файл, который другой воркер уже отобразил в память.
+    """
+
+    def __init__(self, path, n_items=None, k=None, writable=True, fingerprint=None):
+        self.path = path
+        if writable:
+            if n_items is None or k is None:
+                raise ValueError("Для записываемого хранилища нужны n_items и k")
+            with file_lock(f'{path}.lock'):
+                self._open_or_create(n_items, k, fingerprint)
+        else:
+            if not os.path.exists(path):
+                raise FileNotFoundError(path)
+            self._open(writable=False)
+
+    def _open(self, writable):
+        self.matrix = np.load(self.path, mmap_mode='r+' if writable else 'r')
+        self.writable = writable
+        self.k = self.matrix.shape[1]
+        self.meta = read_store_meta(self.path)
+
+    def _open_or_create(self, n_items, k, fingerprint):
+        if os.path.exists(self.path):
+            self._open(writable=True)
+            problem = self.mismatch(n_items, k, fingerprint) or (f"K={self.k}, ожидалось {k}" if self.k != k else None)
+            if problem is None:
+                return
+            logger.warning("Хранилище соседей %s не подходит текущему индексу (%s), пересоздаётся", self.path, problem)
+            del self.matrix
+        self._create(self.path, n_items, k, fingerprint)
+        self._open(writable=True)
+
+    @staticmethod
+    def _create(path, n_items, k, fingerprint=None):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        matrix = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int32, shape=(n_items, k))
+        matrix[:] = NOT_COMPUTED
+        matrix.flush()
+        del matrix
+        os.replace(tmp_path, path)
+        write_store_meta(path, fingerprint, k)
+
+    def mismatch(self, n_items, k, fingerprint=None):
+        '''Почему матрица не подходит индексу из n_items элементов и запросам до k соседей; None — подходит.'''
+        if self.matrix.shape[0] != n_items:
+            return f"строк {self.matrix.shape[0]}, элементов в индексе {n_items}"
+        if self.k < k:
+            return f"K={self.k} меньше требуемого {k}"
+        if fingerprint is not None and self.meta.get('index') != fingerprint:
+            return "построена для другого AnnoyIndex"
+        return None
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def get(self, idx):
+        """Соседи элемента idx (массив индексов Annoy) или None, если строка не заполнена."""
+        if idx >= self.matrix.shape[0]:
+            return None
+        row = self.matrix[idx]
+        if row[0] == NOT_COMPUTED:
+            return None
+        return row[row >= 0]
+
+    def put(self, idx, neighbours):
+        if not self.writable or idx >= self.matrix.shape[0]:
+            return
+        row = np.full(self.k, NO_NEIGHBOUR, dtype=np.int32)
+        row[:min(len(neighbours), self.k)] = neighbours[:self.k]
+        self.matrix[idx, 1:] = row[1:]
+        self.matrix[idx, 0] = row[0]
+
+
+def _store_meta_path(path):
+    return f'{path}.json'
+
+
+def write_store_meta(path, fingerprint, k):
+    '''Отпечаток индекса и K рядом с матрицей соседей (атомарная замена файла).'''
+    tmp_path = f'{_store_meta_path(path)}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'index': fingerprint, 'k': int(k)}, f, indent=2)
+    os.replace(tmp_path, _store_meta_path(path))
+
+
+def read_store_meta(path):
+    try:
+        with open(_store_meta_path(path), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
 
 class SimilarItemsCache:
-    def __init__(self, annoy_index, itemid_to_index, index_to_itemid):
+    """
+    Поиск похожих товаров по AnnoyIndex с кэшированием.
+
+    Для каждого товара один раз запрашиваются max_k соседей, запросы с любым
+    top_n <= max_k обслуживаются срезом этого списка. Сначала проверяется
+    общее хранилище соседей (если задано), затем локальный LRU-кэш, и только
+    потом выполняется запрос к Annoy. С полностью предрассчитанной матрицей
+    (model/build_neighbours.py) поиск сводится к индексации массива.
+    """
+
+    def __init__(self, annoy_index, itemid_to_index, index_to_itemid, max_k=10, maxsize=10000, ttl=None,
+                 store=None):
         self.annoy_index = annoy_index
         self.itemid_to_index = itemid_to_index
         self.index_to_itemid = index_to_itemid
+        self.max_k = max_k
+        self.cache = NeighbourCache(maxsize=maxsize, ttl=ttl)
+        # Из хранилища с K < max_k запросы с top_n между ними получали бы урезанный список
+        if store is not None and store.k < max_k:
+            logger.warning("Хранилище соседей %s: K=%d меньше max_k=%d, не используется", store.path, store.k, max_k)
+            store = None
+        self.store = store
+
+    def _query_neighbours(self, idx, k):
+        neighbors = self.annoy_index.get_nns_by_item(idx, k + 1)
+        return np.array([i for i in neighbors if i != idx][:k], dtype=np.int32)
+
+    def _neighbours(self, idx):
+        # Чтение строки из mmap-хранилища не дороже LRU, поэтому оно проверяется первым
+        if self.store is not None:
+            neighbours = self.store.get(idx)
+            if neighbours is not None:
+                SIMILAR_CACHE_HITS.labels(source='store').inc()
+                return neighbours
+
+        neighbours = self.cache.get(idx)
+        if neighbours is not None:
+            return neighbours
+
+        SIMILAR_CACHE_MISSES.inc()
+        neighbours = self._query_neighbours(idx, self.max_k)
+        logger.debug("Поиск похожих для index=%s → соседи=%s", idx, neighbours)
+        if self.store is not None:
+            self.store.put(idx, neighbours)
+        self.cache.put(idx, neighbours)
+        return neighbours
 
-    @lru_cache(maxsize=10000)
     def get_similar_items(self, itemid, top_n=3):
         try:
             if itemid not in self.itemid_to_index:
-                logging.warning(f"itemid {itemid} не найден в itemid_to_index.")
+                logger.warning("itemid %s не найден в itemid_to_index.", itemid)
                 return []
             idx = self.itemid_to_index[itemid]
             if idx >= self.annoy_index.get_n_items():
-                logging.error(f"Annoy index out of bounds: idx={idx}, max={self.annoy_index.get_n_items()} (itemid={itemid})")
+                logger.error("Annoy index out of bounds: idx=%s, max=%s (itemid=%s)",
+                             idx, self.annoy_index.get_n_items(), itemid)
                 return []
-            neighbors = self.annoy_index.get_nns_by_item(idx, top_n + 1)
-            logging.info(f"Поиск похожих для itemid={itemid}, index={idx} → соседи={neighbors}")
-            return [self.index_to_itemid[i] for i in neighbors if i != idx]
+            if top_n > self.max_k:
+                neighbours = self._query_neighbours(idx, top_n)
+            else:
+                neighbours = self._neighbours(idx)[:top_n]
+            return [int(self.index_to_itemid[i]) for i in neighbours.tolist()]
         except Exception as e:
-            logging.exception(f"Ошибка при поиске похожих товаров для itemid={itemid}")
+            logger.exception("Ошибка при поиске похожих товаров для itemid=%s", itemid)
             return []
 
     def get_similar_by_vector(self, vector, top_n=3):
         try:
             neighbors = self.annoy_index.get_nns_by_vector(vector, top_n)
-            logging.info(f"Поиск похожих по вектору → соседи={neighbors}")
-            return [self.index_to_itemid[i] for i in neighbors]
+            logger.debug("Поиск похожих по вектору → соседи=%s", neighbors)
+            return [int(self.index_to_itemid[i]) for i in neighbors]
         except Exception as e:
-            logging.exception("Ошибка при поиске похожих товаров по вектору")
+            logger.exception("Ошибка при поиске похожих товаров по вектору")
             return []
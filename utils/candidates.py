@@ -0,0 +1,244 @@
+import logging
+import time
+
+import numpy as np
+
+from model.time_features import context_features
+from utils.mmap_arrays import find_sorted
+
+logger = logging.getLogger(__name__)
+
+# Группы признаков ранжировщика (см. utils/feature_engine, model/time_features). Строка для кандидата,
+# которого нет в df_ranker пользователя, собирается по группам: контекст — момент запроса,
+# признаки товара — из строк этого товара, признаки пользователя — из его строк,
+# признаки пары — значения для пары без взаимодействий (в feature_engine пропуски тоже заполняются нулём)
+CONTEXT_FEATURES = ('dayofweek', 'is_weekend', 'is_holiday', 'hour')
+ITEM_FEATURES = ('view_count', 'addtocart_count', 'purchase_count', 'conversion',
+                 'avg_time_view', 'avg_time_addtocart', 'avg_time_transaction')
+USER_FEATURES = ('total_events', 'items_count', 'purchases', 'session')
+USER_ITEM_DEFAULTS = {'itemevents_by_visitor': 0, 'itemviews_before_purchase': 0, 'time_to_purchase': 0}
+
+
+def _csr(keys, values):
+    '''Группирует values по отсортированным keys: (уникальные ключи, смещения, значения).'''
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.array([], dtype=np.int64)
+    return keys[starts], np.append(starts, len(keys)).astype(np.int64), values
+
+
+class CooccurrenceIndex:
+    """
+    Совместная встречаемость товаров: для каждого товара — top_k товаров, которые
+    чаще всего встречаются рядом с ним (не дальше window шагов) в истории одного пользователя.
+    Хранится в формате CSR, поиск — бинарный поиск по itemid.
+    """
+
+    def __init__(self, item_ids, offsets, neighbours):
+        self.item_ids = item_ids
+        self.offsets = offsets
+        self.neighbours = neighbours
+
+    @classmethod
+    def from_user_index(cls, user_index, window=3, top_k=20):
+        visitors = np.repeat(user_index.user_ids, np.diff(user_index.offsets))
+        items = np.asarray(user_index.itemids, dtype=np.int64)
+        # Подряд идущие события с одним товаром (просмотр → корзина → покупка) — один шаг
+        keep = np.r_[True, (visitors[1:] != visitors[:-1]) | (items[1:] != items[:-1])] if len(items) else []
+        visitors, items = visitors[keep], items[keep]
+
+        base = int(items.max()) + 1 if len(items) else 1
+        keys = []
+        for d in range(1, window + 1):
+            same = (visitors[d:] == visitors[:-d]) & (items[d:] != items[:-d])
+            a, b = items[:-d][same], items[d:][same]
+            keys.extend([a * base + b, b * base + a])
+        if not keys or not sum(len(k) for k in keys):
+            empty = np.array([], dtype=np.int64)
+            return cls(empty, np.zeros(1, dtype=np.int64), empty)
+
+        pairs, counts = np.unique(np.concatenate(keys), return_counts=True)
+        first, second = pairs // base, pairs % base
+        order = np.lexsort((-counts, first))
+        first, second = first[order], second[order]
+        item_ids, offsets, _ = _csr(first, second)
+        rank = np.arange(len(first)) - np.repeat(offsets[:-1], np.diff(offsets))
+        top = rank < top_k
+        item_ids, offsets, neighbours = _csr(first[top], second[top])
+        return cls(item_ids, offsets, neighbours)
+
+    def get(self, itemid, n):
+        pos = find_sorted(self.item_ids, itemid)
+        if pos is not None:
+            return self.neighbours[self.offsets[pos]:min(self.offsets[pos] + n, self.offsets[pos + 1])]
+        return self.neighbours[:0]
+
+
+def _row_users(offsets):
+    '''Номер пользователя для каждой строки CSR.'''
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def _sorted_within(offsets, values):
+    '''Перестановка строк CSR, упорядочивающая values внутри каждого пользователя.'''
+    return np.lexsort((np.asarray(values), _row_users(offsets)))
+
+
+def _contains(sorted_values, values):
+    '''Маска values, найденных в отсортированном массиве sorted_values.'''
+    idx = np.searchsorted(sorted_values, values)
+    found = idx < len(sorted_values)
+    found[found] = sorted_values[idx[found]] == values[found]
+    return found
+
+
+def latest_items(user_index, users_mask, n):
+    '''
+    Последние n уникальных товаров (от новых к старым) пользователей из users_mask
+    в формате CSR по позициям user_index: (offsets, itemids).
+    '''
+    rows = np.flatnonzero(np.repeat(users_mask, np.diff(user_index.offsets)))
+    users = _row_users(user_index.offsets)[rows]
+    items = np.asarray(user_index.itemids, dtype=np.int64)[rows]
+    timestamps = np.asarray(user_index.timestamps).astype(np.int64)[rows]
+    # От новых к старым; при равном времени первым идёт событие, записанное позже
+    order = np.lexsort((-np.arange(len(rows)), -timestamps, users))
+    users, items = users[order], items[order]
+    base = int(items.max()) + 1 if len(items) else 1
+    _, first = np.unique(users * base + items, return_index=True)
+    first.sort()
+    users, items = users[first], items[first]
+    keep = np.arange(len(users)) - np.searchsorted(users, users) < n
+    users, items = users[keep], items[keep]
+    return np.searchsorted(users, np.arange(len(user_index.user_ids) + 1)).astype(np.int64), items
+
+
+def popular_items(user_index, min_unique_items, n):
+    '''n самых популярных товаров среди пользователей, взаимодействовавших минимум с min_unique_items товарами.'''
+    active = np.repeat(user_index.unique_counts >= min_unique_items, np.diff(user_index.offsets))
+    items, counts = np.unique(np.asarray(user_index.itemids)[active], return_counts=True)
+    return items[np.argsort(-counts, kind='stable')[:n]]
+
+
+class CandidateGenerator:
+    """
+    Первый этап для активных пользователей: ограниченный набор кандидатов для ранжировщика.
+
+    Источники по приоритету: похожие (Annoy) на последние товары пользователя,
+    совместная встречаемость с ними, популярные товары активной группы. Просмотренные
+    товары исключаются, набор обрезается до budget — время ранжирования не зависит
+    от длины истории пользователя.
+
+    Последние товары, отсортированная история и строки df_ranker, упорядоченные по itemid
+    внутри пользователя, готовятся один раз при создании: на запрос остаются срезы
+    и бинарный поиск кандидатов, без сортировки истории.
+    """
+
+    def __init__(self, user_index, ranker_store, sim_cache, cooccurrence, popular, recent, budget=200,
+                 neighbours_per_item=10, cooccurrence_per_item=10):
+        self.user_index = user_index
+        self.ranker_store = ranker_store
+        self.sim_cache = sim_cache
+        self.cooccurrence = cooccurrence
+        self.popular = np.asarray(popular, dtype=np.int64)
+        self._recent_offsets, self._recent_items = recent
+        self.budget = budget
+        self.neighbours_per_item = neighbours_per_item
+        self.cooccurrence_per_item = cooccurrence_per_item
+
+        itemids = np.asarray(user_index.itemids, dtype=np.int64)
+        self._history = itemids[_sorted_within(user_index.offsets, itemids)]
+        self._store_order = _sorted_within(ranker_store.offsets, ranker_store.itemids)
+        self._store_items = np.asarray(ranker_store.itemids, dtype=np.int64)[self._store_order]
+
+        names = list(ranker_store.feature_names)
+        self._context_names = [c for c in CONTEXT_FEATURES if c in names]
+        self._context_columns = [names.index(c) for c in self._context_names]
+        self._item_columns = [names.index(c) for c in ITEM_FEATURES if c in names]
+        self._user_columns = [names.index(c) for c in USER_FEATURES if c in names]
+        self._default_columns = [names.index(c) for c in USER_ITEM_DEFAULTS if c in names]
+        self._default_values = np.array([USER_ITEM_DEFAULTS[names[j]] for j in self._default_columns], dtype=np.float32)
+        unknown = set(names) - set(CONTEXT_FEATURES) - set(ITEM_FEATURES) - set(USER_FEATURES) - set(USER_ITEM_DEFAULTS)
+        if unknown:
+            logger.warning("Признаки %s не относятся ни к одной группе: у новых кандидатов они равны 0",
+                           ", ".join(sorted(unknown)))
+        # Признаки товара одинаковы во всех его строках df_ranker — берём первую
+        self.item_ids, first_rows = np.unique(np.asarray(ranker_store.itemids), return_index=True)
+        self.item_features = np.asarray(ranker_store.features)[first_rows][:, self._item_columns]
+        self._context_cache = (None, None)
+
+    @classmethod
+    def build(cls, user_index, ranker_store, sim_cache, min_unique_items, budget=200, recent_items=5,
+              neighbours_per_item=10, cooccurrence_per_item=10, cooccurrence_window=3, cooccurrence_top_k=20,
+              popular_items_count=100):
+        cooccurrence = CooccurrenceIndex.from_user_index(user_index, cooccurrence_window, cooccurrence_top_k)
+        popular = popular_items(user_index, min_unique_items, popular_items_count)
+        recent = latest_items(user_index, user_index.unique_counts >= min_unique_items, recent_items)
+        return cls(user_index, ranker_store, sim_cache, cooccurrence, popular, recent, budget,
+                   neighbours_per_item, cooccurrence_per_item)
+
+    def recent(self, user_id):
+        '''Последние уникальные товары активного пользователя, от новых к старым.'''
+        pos = self.user_index._position(user_id)
+        if pos is None:
+            return []
+        return self._recent_items[self._recent_offsets[pos]:self._recent_offsets[pos + 1]].tolist()
+
+    def generate(self, user_id):
+        '''itemid кандидатов (не больше budget) в порядке приоритета источников.'''
+        pos = self.user_index._position(user_id)
+        if pos is None:
+            return np.empty(0, dtype=np.int64)
+        recent = self.recent(user_id)
+        sources = np.array(
+            [item for r in recent for item in self.sim_cache.get_similar_items(r, top_n=self.neighbours_per_item)]
+            + [item for r in recent for item in self.cooccurrence.get(r, self.cooccurrence_per_item).tolist()]
+            + self.popular.tolist(),
+            dtype=np.int64
+        )
+        _, first = np.unique(sources, return_index=True)
+        candidates = sources[np.sort(first)]
+        history = self._history[self.user_index.offsets[pos]:self.user_index.offsets[pos + 1]]
+        return candidates[~_contains(history, candidates)][:self.budget]
+
+    def context(self, now_ms=None):
+        '''Контекстные признаки момента запроса в порядке колонок; значения меняются раз в час.'''
+        now_ms = time.time() * 1000 if now_ms is None else now_ms
+        hour, values = self._context_cache
+        if hour != now_ms // 3_600_000:
+            features = context_features(now_ms)
+            values = np.array([features[name] for name in self._context_names], dtype=np.float32)
+            self._context_cache = (now_ms // 3_600_000, values)
+        return values
+
+    def candidates(self, user_id, now_ms=None):
+        '''
+        (itemid, матрица признаков) для ранжировщика, как у RankerFeatureStore.candidates.
+        Для пар из df_ranker берутся их признаки, остальные строки собираются по группам признаков;
+        контекст у всех кандидатов — момент запроса now_ms. Кандидаты без признаков товара отбрасываются.
+        '''
+        store = self.ranker_store
+        rows = store._slice(user_id)
+        if rows.stop == rows.start:
+            return store.candidates(user_id)
+        items = self.generate(user_id)
+        if len(items) == 0:
+            # Источники ничего не дали — ранжируем строки df_ranker пользователя в пределах бюджета
+            items, features = store.candidates(user_id)
+            return items[:self.budget], features[:self.budget]
+
+        # Строки пользователя в df_ranker упорядочены по itemid заранее — только бинарный поиск
+        block = self._store_items[rows]
+        in_store = _contains(block, items)
+        item_pos = np.minimum(np.searchsorted(self.item_ids, items), max(len(self.item_ids) - 1, 0))
+        keep = in_store | (self.item_ids[item_pos] == items)
+        items, in_store, item_pos = items[keep], in_store[keep], item_pos[keep]
+
+        features = np.zeros((len(items), len(store.feature_names)), dtype=np.float32)
+        store_rows = self._store_order[rows.start + np.searchsorted(block, items[in_store])]
+        features[in_store] = np.asarray(store.features[store_rows])
+        composed = ~in_store
+        features[np.ix_(composed, self._item_columns)] = self.item_features[item_pos[composed]]
+        # Признаки пользователя одинаковы во всех его строках df_ranker
+        features[np.ix_(composed, self._user_columns)] = np.asarray(store.features[rows.start])[self._user_columns]
+        features[np.ix_(composed, self._default_columns)] = self._default_values
+        features[:, self._context_columns] = self.context(now_ms)
+        return items, features
@@ -0,0 +1,48 @@
+import threading
+
+
+class _InFlightCall:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestCoalescer:
+    """
+    Объединяет одновременные одинаковые запросы в одно вычисление (single-flight).
+
+    Первый поток с данным ключом выполняет функцию, остальные ждут и получают
+    тот же результат (или то же исключение). После завершения ключ удаляется,
+    то есть результат не кэшируется — схлопываются только запросы «в полёте».
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self.coalesced = 0
+
+    def run(self, key, func):
+        with self._lock:
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _InFlightCall()
+            else:
+                self.coalesced += 1
+
+        if leader:
+            try:
+                call.result = func()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    del self._in_flight[key]
+                call.done.set()
+        else:
+            call.done.wait()
+
+        if call.error is not None:
+            raise call.error
+        return call.result
@@ -1,177 +1,252 @@
 import sys
 import os
+import shutil
 sys.path.append(os.path.abspath("E:/Skillfactory_2/DIPLOMA"))
 
+import argparse
+import glob
+import json
+
 import pandas as pd
 import numpy as np
-import dask.dataframe as dd 
-from model.optimize_memory_usage import optimize_memory_usage
+import pyarrow.parquet as pq
+from model.optimize_memory_usage import plan_dtypes, parquet_stats, arrow_schema, save_schema, schema_path
 from model.time_features import generate_time_features
+from utils.feature_engine import EVENT_TYPES, ITEM_KEY, USER_ITEM_KEY, event_state, merge_states, item_factors, \
+    add_factors
+from utils.ingest import ingest_events, ingest_properties
+from utils.item_properties import category_depth, depth_counts, median_from_counts, build_items, read_properties
+from utils.parallel import parallel_map
+from utils.tracing import stage
+
+DATA_DIR = 'model/data'
+N_PARTITIONS = 16
+
+# Промежуточные данные внутри data_dir. Секции во всех каталогах называются
+# одинаково (part-XXX.parquet) и соответствуют секциям событий по visitorid.
+EVENTS_PARTS = 'events_parts'
+PROPERTIES_PARTS = 'properties_parts'
+CLEANED_PARTS = 'cleaned_parts'
+RANKER_PARTS = 'ranker_parts'
+STATE_DIR = 'state'                     # items.parquet, user_items/part-XXX.parquet, meta.json
+PENDING_DIR = '.pending'                # неопубликованная порция инкрементального обновления
+
+# Для обучения ранжирующей модели берутся пользователи, взаимодействовавшие минимум с 4 товарами
+MIN_UNIQUE_ITEMS = 4
+EVENT_PRIORITY = {'view': 0, 'addtocart': 1, 'transaction': 2}
+
+# Схема секций cleaned_events одна для всех секций, чтобы их можно было склеивать в один файл;
+# итоговый файл приводится к компактным типам по статистике (см. assemble_outputs)
+CLEANED_EVENTS_DTYPES = {
+    'timestamp': 'datetime64[ns]',
+    'visitorid': 'uint32',
+    'event': pd.CategoricalDtype(list(EVENT_TYPES)),
+    'itemid': 'uint32',
+    'dayofweek': 'uint8',
+    'is_weekend': 'bool',
+    'is_holiday': 'bool',
+    'hour': 'uint8',
+    'view_count': 'uint32',
+    'addtocart_count': 'uint32',
+    'purchase_count': 'uint32',
+    'conversion': 'float32',
+    'first_seen': 'datetime64[ns]',
+    'last_seen': 'datetime64[ns]',
+    'avg_time_view': 'float32',
+    'avg_time_addtocart': 'float32',
+    'avg_time_transaction': 'float32',
+    'total_events': 'uint32',
+    'items_count': 'uint32',
+    'purchases': 'uint32',
+    'session': 'float32',
+    'itemevents_by_visitor': 'uint32',
+    'itemviews_before_purchase': 'uint32',
+    'time_to_purchase': 'float32'
+}
+
+
+# Колонки события, не зависящие от агрегатов: при пересчёте признаков остальные колонки строятся заново
+BASE_COLUMNS = ['timestamp', 'visitorid', 'event', 'itemid', 'dayofweek', 'is_weekend', 'is_holiday', 'hour']
+
+
+def read_events(path):
+    events = pd.read_parquet(path)
+    events['timestamp'] = pd.to_datetime(events['timestamp'], unit='ms')
+    return events
+
+
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    state.to_parquet(path)
+
 
-def preprocess_data():
+def load_state(path):
+    return pd.read_parquet(path)
+
+
+def item_state_path(data_dir):
+    return os.path.join(data_dir, STATE_DIR, 'items.parquet')
+
+
+def user_item_state_path(data_dir, name):
+    return os.path.join(data_dir, STATE_DIR, 'user_items', name)
+
+
+def read_meta(data_dir):
+    with open(os.path.join(data_dir, STATE_DIR, 'meta.json')) as f:
+        return json.load(f)
+
+
+def write_meta(data_dir, meta):
+    with open(os.path.join(data_dir, STATE_DIR, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+
+def build_event_features(events, item_factors_df, user_item_state):
+    '''
+    Признаки событий одной секции по visitorid: признаки товаров общие для всех секций,
+    признаки пользователя и пары пользователь-товар — из состояния пар этой секции.
+    '''
+    add_factors(events, item_factors_df, user_item_state)
+    return events[list(CLEANED_EVENTS_DTYPES)].astype(CLEANED_EVENTS_DTYPES)
+
+
+def build_ranker_data(cleaned):
+    '''Строки для обучения CatBoost Ranker: события пользователей минимум с MIN_UNIQUE_ITEMS товарами.'''
+    ranker = cleaned[cleaned['items_count'] >= MIN_UNIQUE_ITEMS].copy()
+    ranker['label'] = ranker['event'].map(EVENT_PRIORITY).astype(np.int64)
+    return ranker.drop(columns=['first_seen', 'last_seen', 'event', 'timestamp'])
+
+
+def write_partition(data_dir, name, cleaned):
+    '''Сохраняет признаки секции и строки ранжировщика для неё.'''
+    cleaned.to_parquet(os.path.join(data_dir, CLEANED_PARTS, name), index=False)
+    build_ranker_data(cleaned).to_parquet(os.path.join(data_dir, RANKER_PARTS, name), index=False)
+
+
+def _concat_parquet(paths, out_path, schema):
+    '''
+    Склеивает секции одной схемы в один файл, по row group на секцию; файл заменяется атомарно.
+    Колонки приводятся к типам schema при чтении.
+    '''
+    tmp_path = f'{out_path}.tmp'
+    target = arrow_schema(schema)
+    with pq.ParquetWriter(tmp_path, target) as writer:
+        for path in paths:
+            writer.write_table(pq.read_table(path, schema=target))
+    os.replace(tmp_path, out_path)
+
+
+def output_schema(paths, float_dtype='float32'):
+    '''Компактные типы для склеенного файла: план по статистике row group-ов всех секций.'''
+    dtypes = pq.read_schema(paths[0]).empty_table().to_pandas().dtypes
+    return plan_dtypes(dtypes, parquet_stats(paths), float_dtype)
+
+
+def assemble_outputs(data_dir):
+    '''
+    Собирает cleaned_events.parquet и df_ranker.parquet из секций в компактных типах.
+    План типов сохраняется рядом (<name>.schema.json): read_parquet/read_csv из model.optimize_memory_usage
+    читают по нему данные сразу в компактных типах, в том числе выгрузки этих таблиц в CSV.
+    '''
+    for parts, out_name in ((CLEANED_PARTS, 'cleaned_events.parquet'), (RANKER_PARTS, 'df_ranker.parquet')):
+        paths = sorted(glob.glob(os.path.join(data_dir, parts, 'part-*.parquet')))
+        if not paths:
+            continue
+        schema = output_schema(paths)
+        out_path = os.path.join(data_dir, out_name)
+        _concat_parquet(paths, out_path, schema)
+        save_schema(schema_path(out_path), schema)
+
+
+def _reset_dir(path):
+    os.makedirs(path, exist_ok=True)
+    for old in glob.glob(os.path.join(path, 'part-*.parquet')):
+        os.remove(old)
+
+
+def _build_items_part(path, depth_table, default_depth):
+    return build_items(read_properties(path), depth_table, default_depth)
+
+
+def build_items_table(data_dir, n_partitions, workers=1):
+    '''Свойства товаров → items.parquet, агрегация по секциям itemid.'''
+    depth_table = category_depth(os.path.join(data_dir, 'category_tree.csv'))
+    # Пропуски глубины заполняются медианой по всем строкам свойств, как в исходной реализации:
+    # гистограмма глубин копится по блокам CSV до удаления повторов (itemid, property)
+    counts = []
+    property_paths = ingest_properties(
+        [os.path.join(data_dir, f'item_properties_part{i}.csv') for i in (1, 2)],
+        os.path.join(data_dir, PROPERTIES_PARTS), n_partitions, workers=workers,
+        on_block=lambda table: counts.append(depth_counts(table['property'].to_numpy(), depth_table))
+    )
+    default_depth = median_from_counts(pd.concat(counts).groupby(level=0).sum())
+    grouped_items = pd.concat(
+        parallel_map(_build_items_part, property_paths, workers, depth_table=depth_table, default_depth=default_depth),
+        ignore_index=True
+    )
+    # Порядок строк items.parquet задаёт индексы товаров в AnnoyIndex
+    grouped_items.sort_values('itemid').reset_index(drop=True).to_parquet(os.path.join(data_dir, 'items.parquet'))
+
+
+def _item_state(path):
+    return event_state(read_events(path), ITEM_KEY)
+
+
+def _build_partition(path, data_dir, factors):
+    '''Признаки одной секции событий: состояние пар и строки cleaned_events/df_ranker.'''
+    name = os.path.basename(path)
+    events = generate_time_features(read_events(path), compact=True)
+    user_item_state = event_state(events, USER_ITEM_KEY)
+    save_state(user_item_state_path(data_dir, name), user_item_state)
+    write_partition(data_dir, name, build_event_features(events, factors, user_item_state))
+
+
+def preprocess_data(data_dir=DATA_DIR, n_partitions=N_PARTITIONS, workers=1):
     '''
     Выполняет полную предобработку данных:
-    - Загружает: events.csv, item_properties_part1.csv, item_properties_part2.csv, category_tree.csv
+    - Потоково загружает events.csv и item_properties_part*.csv в секционированный parquet, category_tree.csv
     - Вычисляет признаки взаимодействия пользователей с товарами, временные и категориальные признаки
-    - Сохраняет два parquet-файла:
-        - users_items.parquet — данные событий пользователей с признаками
-        - items_properties.parquet — агрегированные свойства товаров
-        - data_ranker.parquet — подготовленные данные для обучения CatBoost Ranker
+      по секциям, так что в памяти одновременно находится только одна секция
+    - Сохраняет состояние агрегатов (data_dir/state) для инкрементального обновления (utils/incremental.py)
+    - Сохраняет три parquet-файла:
+        - cleaned_events.parquet — данные событий пользователей с признаками
+        - df_ranker.parquet — подготовленные данные для обучения CatBoost Ranker
+        - items.parquet — агрегированные свойства товаров
+    workers > 1 — секции обрабатываются параллельно в пуле процессов; результат тот же, что и при workers=1.
     '''
-    with open('model/data/events.csv', 'r') as f:  
-        users_items = pd.read_csv(f)
-    users_items = optimize_memory_usage(users_items)
-
-    users_items.rename(columns={'transactionid': 'transaction'}, inplace=True)
-    users_items['transaction'] = users_items['transaction'].apply(lambda x: 0 if pd.isna(x) else 1).astype('uint8')
-    users_items.drop_duplicates(inplace=True)
-    users_items['timestamp'] = pd.to_datetime(users_items['timestamp'], unit='ms')
-    users_items = users_items.sort_values(by='timestamp').reset_index(drop=True)
-    
-    generate_time_features(users_items)
-    users_items = optimize_memory_usage(users_items)
-
-    # Вычисляем item-based признаки: число просмотров, добавлений в корзину и покупок, а также конверсию
-    item_factors = users_items.groupby('itemid').agg(
-        view_count=('event', lambda x: (x == 'view').count()),
-        addtocart_count=('event', lambda x: (x == 'addtocart').count()),
-        purchase_count=('transaction', 'sum')).reset_index()
-    item_factors['conversion'] = item_factors['purchase_count'] / item_factors['view_count'].replace(0, np.nan)
-    item_factors['conversion'] = item_factors['conversion'].fillna(0)
-    users_items = users_items.merge(item_factors, on='itemid', how='left')
-
-    # Генерация средних временных признаков по каждому типу события (view, addtocart, transaction)
-    lst_df = []
-    event_types = ['view', 'addtocart', 'transaction']
-    for e in event_types:
-        df = users_items[users_items['event'] == e].copy()
-        df.sort_values(by=['itemid', 'timestamp'], inplace=True)
-        df['time_diff'] = df.groupby('itemid')['timestamp'].diff()
-        avg_time_event = df.groupby('itemid')['time_diff'].mean()
-        avg_time_event = avg_time_event.fillna(pd.Timedelta(seconds=0)).dt.total_seconds() / 3600
-        avg_time_event = avg_time_event.round(2).rename(f'avg_time_{e}')
-        lst_df.append(avg_time_event)
-
-    first_seen = users_items.groupby('itemid')['timestamp'].min().rename("first_seen")
-    last_seen = users_items.groupby('itemid')['timestamp'].max().rename("last_seen")
-
-    # Генерация признаков времени для itemid: первое и последнее появление + среднее время между событиями
-    time_item_factors = pd.concat([first_seen, last_seen] + lst_df, axis=1).fillna(0.0)
-    users_items = users_items.merge(time_item_factors, on="itemid", how="left")
-
-    # Вычисляем признаки активности и лояльности пользователей:
-    # - общее количество событий, количество уникальных товаров, количество покупок
-    total_events = users_items.groupby('visitorid').size().rename('total_events')
-    items_count = users_items.groupby('visitorid')['itemid'].nunique().rename('items_count')
-    purchases = users_items.groupby('visitorid')['transaction'].sum().rename('purchases')
-    user_factors = pd.concat([total_events, items_count, purchases], axis=1).reset_index()
-    users_items = users_items.merge(user_factors, on="visitorid", how="left")
-
-    events_sorted = users_items.sort_values(by=['visitorid', 'timestamp'])
-    events_sorted['session_diff'] = events_sorted.groupby('visitorid')['timestamp'].diff()
-    session_avg = events_sorted.groupby('visitorid')['session_diff'].mean()
-    session_avg = session_avg.fillna(pd.Timedelta(seconds=0)).dt.total_seconds() / 3600
-    session_avg = session_avg.round(2)
-    users_items = users_items.merge(session_avg.rename('session'), on='visitorid', how='left')
-
-    # Генерация признаков пользовательского поведения по связке (user_id, item_id):
-    # - сколько раз пользователь взаимодействовал с товаром
-    # - сколько раз просматривал до покупки
-    # - сколько времени прошло до покупки
-    item_events = users_items.groupby(['visitorid', 'itemid'])['event'].count().rename('itemevents_by_visitor')
-    views = users_items[users_items['event'] == 'view']
-    views_before_purchase = views.groupby(['visitorid', 'itemid'])['event'].count().rename('itemviews_before_purchase')
-    first_view = views.groupby(['visitorid', 'itemid'])['timestamp'].min().rename('first_view')
-    time_purchase = users_items[users_items['event'] == 'transaction'].groupby(['visitorid', 'itemid'])['timestamp'].max().rename('time_purchase')
-    time_to_purchase = pd.concat([first_view, time_purchase], axis=1)
-    time_to_purchase['time_to_purchase'] = (time_to_purchase['time_purchase'] - time_to_purchase['first_view'])\
-                                              .fillna(pd.Timedelta(seconds=0)).dt.total_seconds() / 3600
-    time_to_purchase['time_to_purchase'] = time_to_purchase['time_to_purchase'].round(2)
-    user_item_factors = pd.concat([item_events, views_before_purchase, time_to_purchase], axis=1).fillna(0).reset_index()
-    users_items = users_items.merge(
-        user_item_factors.drop(['first_view', 'time_purchase'], axis=1, errors='ignore'),
-        on=['visitorid', 'itemid'],
-        how='left'
-    )
-    users_items = optimize_memory_usage(users_items)
-    users_items = users_items[['timestamp', 'visitorid', 'event', 'itemid', 'dayofweek', 'is_weekend', 'is_holiday',
-                               'hour', 'view_count', 'addtocart_count', 'purchase_count', 'conversion', 'first_seen', 
-                               'last_seen', 'avg_time_view', 'avg_time_addtocart', 'avg_time_transaction', 'total_events',
-                               'items_count', 'purchases', 'session', 'itemevents_by_visitor',
-                               'itemviews_before_purchase', 'time_to_purchase']].copy()
-
-    users_items.to_parquet('model/data/cleaned_events.parquet')
-
-    # Отфильтровываем пользователей, взаимодействовавших минимум с 4 товарами
-    # Это важно для обучения ранжирующей модели
-    user_unique_items = users_items.groupby('visitorid')['itemid'].nunique()
-    min_unique_items = 4
-    filtered_users = user_unique_items[user_unique_items >= min_unique_items].index
-    filtered_df = users_items[users_items['visitorid'].isin(filtered_users)].copy()
-    event_priority = {'view': 0, 'addtocart': 1, 'transaction': 2}
-    filtered_df.loc[:, 'label'] = filtered_df['event'].map(event_priority)
-    filtered_df = filtered_df.drop(columns=['first_seen', 'last_seen', 'event'], errors='ignore')
-    filtered_df = filtered_df.sort_values('timestamp')
-    filtered_df = filtered_df.drop(columns=['timestamp'])
-    filtered_df.to_parquet('model/data/df_ranker.parquet')
-
-    dtypes = {
-        "timestamp": "uint64",
-        "itemid": "uint32"
-    }
-    with open("model/data/item_properties_part1.csv", 'r') as f:    
-        properties1 = pd.read_csv(f, dtype=dtypes)
-    with open("model/data/item_properties_part2.csv", 'r') as f:    
-        properties2 = pd.read_csv(f, dtype=dtypes)
-    properties = pd.concat([properties1, properties2], axis=0, ignore_index=True)
-    properties = optimize_memory_usage(properties)
-    properties["timestamp"] = pd.to_datetime(properties["timestamp"], unit="ms")
-    properties['property'] = properties['property'].astype(str).replace({'categoryid': '226', 'available': '474'})
-    properties['property'] = properties['property'].astype('uint16')
-    properties['value'] = properties['value'].astype('string')
-    properties['value'] = properties['value'].str.replace('n', '', regex=False).str.replace('Ifiity', '', regex=False).str.strip()
-    properties['value'] = properties['value'].astype('category')
-    ddf = dd.from_pandas(properties, npartitions=10)
-    properties = ddf.sort_values('timestamp').compute()
-    property_count = properties.groupby('itemid')['property'].nunique().rename('property_count')
-    properties = properties.merge(property_count, on='itemid', how='left')
-
-    with open("model/data/category_tree.csv", 'r') as f:      
-        tree = pd.read_csv(f)
-    tree['parentid'] = tree['parentid'].fillna(-1).astype(int)
-    category_dict = dict(zip(tree['categoryid'], tree['parentid']))
-
-    def get_depth(category_id, depth_cache={}):
-        if category_id in depth_cache:
-            return depth_cache[category_id]
-        if category_id == -1:
-            return 0
-        parent_id = category_dict.get(category_id, -1)
-        depth_cache[category_id] = 1 + get_depth(parent_id, depth_cache)
-        return depth_cache[category_id]
-
-    tree['depth'] = tree['categoryid'].map(lambda x: get_depth(x))
-    tree['categoryid'] = tree['categoryid'].astype('uint16')
-    properties_df = properties.merge(tree[['categoryid', 'depth']], 
-                                     left_on='property', right_on='categoryid', 
-                                     how='left')
-    properties_df.drop(columns=['categoryid'], inplace=True)
-    properties_df['depth'] = properties_df['depth'].fillna(properties_df['depth'].median()).astype('uint8')
-    properties_df = optimize_memory_usage(properties_df)
-    items = properties_df.drop_duplicates(subset=['itemid', 'property']).copy()
-    items['value'] = items['value'].apply(lambda x: str(x))
-    items['value_length'] = items['value'].apply(lambda x: len(x.split()))
-    # Финальная агрегация по itemid:
-    # - объединяем уникальные свойства
-    # - суммируем длину значений
-    # - берём медиану глубины категории
-    grouped_items = items.groupby('itemid').agg({
-        'property': lambda x: ' '.join(str(p) for p in set(x)),
-        'value_length': 'sum',
-        'depth': 'median'
-    }).reset_index()
-    grouped_items.to_parquet('model/data/items.parquet')
+    # Незавершённая порция инкрементального обновления относится к старым данным
+    shutil.rmtree(os.path.join(data_dir, PENDING_DIR), ignore_errors=True)
+    # Этапы размечены для бенчмарков (utils/tracing); без включённой трассировки разметка ничего не стоит
+    with stage('ingest_events'):
+        event_paths = ingest_events(os.path.join(data_dir, 'events.csv'),
+                                    os.path.join(data_dir, EVENTS_PARTS), n_partitions, workers=workers)
+    with stage('item_state'):
+        item_state = merge_states(parallel_map(_item_state, event_paths, workers))
+        factors = item_factors(item_state)
+
+    with stage('partitions'):
+        for parts in (CLEANED_PARTS, RANKER_PARTS, os.path.join(STATE_DIR, 'user_items')):
+            _reset_dir(os.path.join(data_dir, parts))
+        parallel_map(_build_partition, event_paths, workers, data_dir=data_dir, factors=factors)
+
+    with stage('assemble'):
+        save_state(item_state_path(data_dir), item_state)
+        write_meta(data_dir, {'n_partitions': n_partitions})
+        assemble_outputs(data_dir)
+
+    with stage('items'):
+        build_items_table(data_dir, n_partitions, workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Полная предобработка данных")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    parser.add_argument('--partitions', type=int, default=N_PARTITIONS, help="число секций по visitorid/itemid")
+    parser.add_argument('--workers', type=int, default=1, help="число процессов для обработки секций")
+    args = parser.parse_args()
+    preprocess_data(args.data_dir, args.partitions, args.workers)
 
 
 if __name__ == '__main__':
-    preprocess_data()
\ No newline at end of file
+    main()
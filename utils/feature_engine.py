@@ -0,0 +1,157 @@
+'''
+Векторизованный расчёт агрегатных признаков для preprocess_data.
+
+Все признаки строятся из одного и того же «состояния» по ключу (itemid, visitorid
+или паре visitorid-itemid): для каждого типа события — число событий, первое и
+последнее время, плюс сумма флага transaction. Состояние считается одним groupby
+и объединяется между частями данных (суммы и min/max), поэтому его можно
+считать по частям, параллельно или инкрементально.
+
+Среднее время между соседними событиями группы, отсортированными по времени,
+равно (последнее − первое) / (n − 1): сумма разностей телескопически
+сокращается, и пересортировка под каждый тип события не нужна.
+'''
+import numpy as np
+import pandas as pd
+
+EVENT_TYPES = ('view', 'addtocart', 'transaction')
+
+ITEM_KEY = ['itemid']
+USER_KEY = ['visitorid']
+USER_ITEM_KEY = ['visitorid', 'itemid']
+
+COUNT_COLUMNS = [f'n_{e}' for e in EVENT_TYPES] + ['purchases']
+MIN_COLUMNS = [f'min_{e}' for e in EVENT_TYPES]
+MAX_COLUMNS = [f'max_{e}' for e in EVENT_TYPES]
+STATE_COLUMNS = COUNT_COLUMNS + MIN_COLUMNS + MAX_COLUMNS
+
+
+def event_state(events, keys):
+    '''
+    Состояние по ключу keys: n_<event>, min_<event>, max_<event> для каждого
+    типа события и purchases — сумма флага transaction. Один groupby по (keys, event).
+    '''
+    grouped = events.groupby(keys + ['event'], observed=True, sort=False).agg(
+        n=('timestamp', 'size'),
+        ts_min=('timestamp', 'min'),
+        ts_max=('timestamp', 'max'),
+        purchases=('transaction', 'sum')
+    )
+    wide = grouped.unstack('event')
+
+    state = pd.DataFrame(index=wide.index)
+    for e in EVENT_TYPES:
+        has_event = ('n', e) in wide.columns
+        state[f'n_{e}'] = wide[('n', e)].fillna(0).astype(np.int64) if has_event else 0
+        state[f'min_{e}'] = wide[('ts_min', e)] if has_event else pd.NaT
+        state[f'max_{e}'] = wide[('ts_max', e)] if has_event else pd.NaT
+    state['purchases'] = wide['purchases'].fillna(0).sum(axis=1).astype(np.int64)
+    return state[STATE_COLUMNS]
+
+
+def _aggregate(state, level):
+    aggregations = {**{c: 'sum' for c in COUNT_COLUMNS}, **{c: 'min' for c in MIN_COLUMNS},
+                    **{c: 'max' for c in MAX_COLUMNS}}
+    return state.groupby(level=level).agg(aggregations)[STATE_COLUMNS]
+
+
+def merge_states(states):
+    '''Объединяет состояния, посчитанные по разным частям данных.'''
+    states = [s for s in states if len(s)]
+    if not states:
+        return pd.DataFrame(columns=STATE_COLUMNS)
+    if len(states) == 1:
+        return states[0]
+    combined = pd.concat(states)
+    return _aggregate(combined, list(range(combined.index.nlevels)))
+
+
+def update_state(state, delta):
+    '''Применяет состояние новой порции событий: пересчитываются только ключи, попавшие в delta.'''
+    if not len(delta):
+        return state
+    affected = state.index.isin(delta.index)
+    return pd.concat([state[~affected], merge_states([state[affected], delta])])
+
+
+def rollup_state(state, level):
+    '''Состояние по более крупному ключу, например пользователя — из состояния пар пользователь-товар.'''
+    return _aggregate(state, level)
+
+
+def _total_events(state):
+    return state[[f'n_{e}' for e in EVENT_TYPES]].sum(axis=1)
+
+
+def _hours(delta):
+    return (delta.fillna(pd.Timedelta(seconds=0)).dt.total_seconds() / 3600).round(2)
+
+
+def _avg_gap_hours(first, last, n):
+    '''Среднее время между соседними событиями в часах (0, если событий меньше двух).'''
+    gaps = (n - 1).where(n > 1)
+    return _hours((last - first) / gaps)
+
+
+def item_factors(state):
+    '''Признаки товара: счётчики событий, конверсия, first/last_seen и средние интервалы по типам событий.'''
+    factors = pd.DataFrame(index=state.index)
+    factors['view_count'] = state['n_view']
+    factors['addtocart_count'] = state['n_addtocart']
+    factors['purchase_count'] = state['purchases']
+    factors['conversion'] = (state['purchases'] / state['n_view'].replace(0, np.nan)).fillna(0)
+    factors['first_seen'] = state[MIN_COLUMNS].min(axis=1)
+    factors['last_seen'] = state[MAX_COLUMNS].max(axis=1)
+    for e in EVENT_TYPES:
+        factors[f'avg_time_{e}'] = _avg_gap_hours(state[f'min_{e}'], state[f'max_{e}'], state[f'n_{e}'])
+    return factors
+
+
+def user_factors(user_item_state):
+    '''
+    Признаки пользователя: число событий, уникальных товаров, покупок и средний интервал между событиями.
+    Состояние пользователя сворачивается из состояния пар пользователь-товар.
+    '''
+    state = rollup_state(user_item_state, 'visitorid')
+    factors = pd.DataFrame(index=state.index)
+    total = _total_events(state)
+    factors['total_events'] = total
+    factors['items_count'] = user_item_state.groupby(level='visitorid').size().reindex(state.index).astype(np.int64)
+    factors['purchases'] = state['purchases']
+    factors['session'] = _avg_gap_hours(state[MIN_COLUMNS].min(axis=1), state[MAX_COLUMNS].max(axis=1), total)
+    return factors
+
+
+def user_item_factors(state):
+    '''Признаки пары пользователь-товар: число событий, просмотров и время от первого просмотра до покупки.'''
+    factors = pd.DataFrame(index=state.index)
+    factors['itemevents_by_visitor'] = _total_events(state)
+    factors['itemviews_before_purchase'] = state['n_view']
+    factors['time_to_purchase'] = _hours(state['max_transaction'] - state['min_view'])
+    return factors
+
+
+def attach_factors(events, factors, keys):
+    '''
+    Добавляет колонки factors к событиям по ключу keys без merge:
+    позиции находятся через get_indexer, значения берутся индексацией массивов.
+    '''
+    if len(keys) == 1:
+        positions = factors.index.get_indexer(events[keys[0]])
+    else:
+        positions = factors.index.get_indexer(pd.MultiIndex.from_arrays([events[k] for k in keys]))
+    for col in factors.columns:
+        events[col] = factors[col].to_numpy()[positions]
+    return events
+
+
+def add_factors(events, item_factors_df, user_item_state):
+    '''
+    Добавляет к событиям признаки товара, пользователя и пары пользователь-товар.
+    Признаки товаров общие для всех данных, признаки пользователей и пар считаются
+    по user_item_state — для секции по visitorid достаточно состояния этой секции.
+    '''
+    attach_factors(events, item_factors_df, ITEM_KEY)
+    attach_factors(events, user_factors(user_item_state), USER_KEY)
+    attach_factors(events, user_item_factors(user_item_state), USER_ITEM_KEY)
+    return events
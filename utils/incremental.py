@@ -0,0 +1,193 @@
+'''
+Инкрементальное обновление cleaned_events.parquet и df_ranker.parquet новой порцией событий.
+
+Работает поверх данных, подготовленных preprocess_data: секций событий по visitorid
+и сохранённого состояния агрегатов (см. utils/feature_engine). Состояние хранит
+для каждого ключа счётчики, первое и последнее время по типам событий — этого
+достаточно для сумм интервалов, first_seen/last_seen, first_view и последней покупки,
+поэтому порция событий просто сливается с состоянием.
+
+Пересчитываются только затронутые ключи: секции, куда попали новые события,
+пересобираются без повторного расчёта временных признаков старых строк;
+в остальных секциях обновляются лишь признаки товаров, если эти товары
+встретились в новой порции. Секции без таких товаров не перезаписываются.
+
+Все файлы порции (секции событий, состояние, секции признаков) сначала пишутся
+в data_dir/.pending и публикуются вместе после записи метки COMMITTED. Если процесс
+упал до метки, следующий запуск отбрасывает .pending и порция применяется заново;
+если после — досрочно опубликованная порция дописывается до конца.
+'''
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+
+import pandas as pd
+
+from model.time_features import generate_time_features
+from utils.data_preprocessing import (DATA_DIR, EVENTS_PARTS, CLEANED_PARTS, RANKER_PARTS, PENDING_DIR,
+                                      BASE_COLUMNS, CLEANED_EVENTS_DTYPES,
+                                      read_meta, load_state, save_state, item_state_path, user_item_state_path,
+                                      build_event_features, write_partition, assemble_outputs)
+from utils.feature_engine import ITEM_KEY, USER_ITEM_KEY, event_state, merge_states, update_state, item_factors, \
+    attach_factors
+from utils.ingest import ingest_events
+
+COMMITTED = 'COMMITTED'
+
+
+def _row_keys(df):
+    return pd.MultiIndex.from_frame(df.astype({'event': str}))
+
+
+def _new_rows(batch, existing):
+    '''Строки порции, которых ещё нет в секции (повторная загрузка тех же событий ничего не меняет).'''
+    if existing is None:
+        return batch
+    return batch[~_row_keys(batch).isin(_row_keys(existing))]
+
+
+def _staging_dir(data_dir):
+    '''Пустой каталог для файлов порции с подкаталогами секций.'''
+    staging = os.path.join(data_dir, PENDING_DIR)
+    shutil.rmtree(staging, ignore_errors=True)
+    for parts in (EVENTS_PARTS, CLEANED_PARTS, RANKER_PARTS):
+        os.makedirs(os.path.join(staging, parts))
+    return staging
+
+
+def _commit(staging):
+    '''Метка готовности порции: после неё .pending публикуется целиком, даже после сбоя.'''
+    tmp_path = os.path.join(staging, f'{COMMITTED}.tmp')
+    open(tmp_path, 'w').close()
+    os.replace(tmp_path, os.path.join(staging, COMMITTED))
+
+
+def _publish(data_dir, staging):
+    '''Переносит файлы порции на их места в data_dir (os.replace каждого файла) и удаляет .pending.'''
+    for root, _, files in os.walk(staging):
+        for name in files:
+            if name == COMMITTED:
+                continue
+            path = os.path.join(root, name)
+            target = os.path.join(data_dir, os.path.relpath(path, staging))
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(path, target)
+    shutil.rmtree(staging)
+
+
+def recover(data_dir=DATA_DIR):
+    '''
+    Завершает прерванное обновление: опубликованная меткой порция дописывается,
+    неподтверждённая — отбрасывается. Возвращает True, если данные изменились.
+    '''
+    staging = os.path.join(data_dir, PENDING_DIR)
+    if not os.path.isdir(staging):
+        return False
+    if not os.path.exists(os.path.join(staging, COMMITTED)):
+        shutil.rmtree(staging)
+        return False
+    _publish(data_dir, staging)
+    assemble_outputs(data_dir)
+    return True
+
+
+def _merge_batch(batch_paths, events_dir, staged_dir):
+    '''
+    Дописывает новые события к секциям events_dir, результат пишет в staged_dir;
+    возвращает {секция: новые строки} только для изменившихся секций.
+    '''
+    new_events = {}
+    for path in batch_paths:
+        name = os.path.basename(path)
+        part_path = os.path.join(events_dir, name)
+        existing = pd.read_parquet(part_path) if os.path.exists(part_path) else None
+        batch = _new_rows(pd.read_parquet(path), existing)
+        if batch.empty:
+            continue
+        combined = batch if existing is None else pd.concat([existing, batch], ignore_index=True)
+        combined.sort_values('timestamp', kind='stable').to_parquet(os.path.join(staged_dir, name), index=False)
+
+        batch = batch.reset_index(drop=True)
+        batch['timestamp'] = pd.to_datetime(batch['timestamp'], unit='ms')
+        new_events[name] = batch
+    return new_events
+
+
+def _rebuild_partition(data_dir, staging, name, batch, factors):
+    '''Секция с новыми событиями: состояние пар обновляется порцией, признаки пересобираются в staging.'''
+    batch = generate_time_features(batch, compact=True)
+    state_path = user_item_state_path(data_dir, name)
+    delta = event_state(batch, USER_ITEM_KEY)
+    user_item_state = update_state(load_state(state_path), delta) if os.path.exists(state_path) else delta
+    save_state(user_item_state_path(staging, name), user_item_state)
+
+    rows = batch[BASE_COLUMNS]
+    cleaned_path = os.path.join(data_dir, CLEANED_PARTS, name)
+    if os.path.exists(cleaned_path):
+        rows = pd.concat([pd.read_parquet(cleaned_path, columns=BASE_COLUMNS), rows], ignore_index=True)
+        rows = rows.sort_values('timestamp', kind='stable').reset_index(drop=True)
+    write_partition(staging, name, build_event_features(rows, factors, user_item_state))
+
+
+def _refresh_item_factors(staging, path, factors, affected_items):
+    '''Секция без новых событий: обновляются только признаки изменившихся товаров.'''
+    cleaned = pd.read_parquet(path)
+    if not cleaned['itemid'].isin(affected_items).any():
+        return False
+    attach_factors(cleaned, factors, ITEM_KEY)
+    write_partition(staging, os.path.basename(path), cleaned.astype(CLEANED_EVENTS_DTYPES))
+    return True
+
+
+def apply_events(csv_path, data_dir=DATA_DIR):
+    '''
+    Применяет порцию событий из csv_path (формат events.csv) к данным в data_dir.
+    Возвращает число новых событий и список перезаписанных секций.
+    '''
+    recover(data_dir)
+    n_partitions = read_meta(data_dir)['n_partitions']
+    staging = _staging_dir(data_dir)
+    tmp_dir = tempfile.mkdtemp(prefix='.batch-', dir=data_dir)
+    try:
+        batch_paths = ingest_events(csv_path, tmp_dir, n_partitions)
+        new_events = _merge_batch(batch_paths, os.path.join(data_dir, EVENTS_PARTS),
+                                  os.path.join(staging, EVENTS_PARTS))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    if not new_events:
+        shutil.rmtree(staging)
+        return {'new_events': 0, 'partitions': []}
+
+    item_delta = merge_states([event_state(batch, ITEM_KEY) for batch in new_events.values()])
+    item_state = update_state(load_state(item_state_path(data_dir)), item_delta)
+    factors = item_factors(item_state)
+
+    rewritten = []
+    for name, batch in sorted(new_events.items()):
+        _rebuild_partition(data_dir, staging, name, batch, factors)
+        rewritten.append(name)
+    for path in sorted(glob.glob(os.path.join(data_dir, CLEANED_PARTS, 'part-*.parquet'))):
+        name = os.path.basename(path)
+        if name not in new_events and _refresh_item_factors(staging, path, factors, item_delta.index):
+            rewritten.append(name)
+
+    save_state(item_state_path(staging), item_state)
+    _commit(staging)
+    _publish(data_dir, staging)
+    assemble_outputs(data_dir)
+    return {'new_events': sum(len(batch) for batch in new_events.values()), 'partitions': sorted(rewritten)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Инкрементальное обновление признаков новой порцией событий")
+    parser.add_argument('events', help="CSV с новыми событиями в формате events.csv")
+    parser.add_argument('--data-dir', default=DATA_DIR)
+    args = parser.parse_args()
+    result = apply_events(args.events, args.data_dir)
+    print(f"Новых событий: {result['new_events']}, перезаписано секций: {len(result['partitions'])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+'''
+Потоковая загрузка исходных CSV в секционированный parquet.
+
+CSV читаются блоками через pyarrow с заданными типами, поэтому в памяти
+одновременно находится только один блок. Строки раскладываются по секциям по
+хэшу ключа (visitorid для событий, itemid для свойств товаров): все события
+одного пользователя и все свойства одного товара попадают в одну секцию,
+и дальнейшие агрегации можно считать по секциям независимо.
+'''
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pv
+import pyarrow.parquet as pq
+
+from utils.parallel import parallel_map
+
+BLOCK_SIZE = 64 << 20
+
+EVENT_COLUMN_TYPES = {
+    'timestamp': pa.int64(),
+    'visitorid': pa.uint32(),
+    'event': pa.string(),
+    'itemid': pa.uint32(),
+    'transactionid': pa.float64()
+}
+
+PROPERTY_COLUMN_TYPES = {
+    'timestamp': pa.int64(),
+    'itemid': pa.uint32(),
+    'property': pa.string(),
+    'value': pa.string()
+}
+
+# Нечисловые свойства заменяются кодами, чтобы колонка property была uint16
+PROPERTY_CODES = {'categoryid': '226', 'available': '474'}
+
+
+def partition_paths(root):
+    return sorted(glob.glob(os.path.join(root, 'part-*.parquet')))
+
+
+def _partition_path(root, part):
+    return os.path.join(root, f'part-{part:03d}.parquet')
+
+
+def _read_blocks(csv_path, column_types, block_size):
+    reader = pv.open_csv(
+        csv_path,
+        read_options=pv.ReadOptions(block_size=block_size),
+        convert_options=pv.ConvertOptions(column_types=column_types)
+    )
+    for batch in reader:
+        yield pa.Table.from_batches([batch])
+
+
+class _PartitionWriter:
+    '''Раскладывает таблицы по секциям по остатку key % n_partitions и дописывает их в parquet.'''
+
+    def __init__(self, root, key, n_partitions):
+        self.root = root
+        self.key = key
+        self.n_partitions = n_partitions
+        self._writers = {}
+        os.makedirs(root, exist_ok=True)
+        for path in partition_paths(root):
+            os.remove(path)
+
+    def write(self, table):
+        parts = table[self.key].to_numpy() % self.n_partitions
+        order = np.argsort(parts, kind='stable')
+        table = table.take(pa.array(order))
+        bounds = np.searchsorted(parts[order], np.arange(self.n_partitions + 1))
+        for part in range(self.n_partitions):
+            start, end = bounds[part], bounds[part + 1]
+            if start == end:
+                continue
+            chunk = table.slice(start, end - start)
+            writer = self._writers.get(part)
+            if writer is None:
+                writer = self._writers[part] = pq.ParquetWriter(_partition_path(self.root, part), chunk.schema)
+            writer.write_table(chunk)
+
+    def close(self):
+        for writer in self._writers.values():
+            writer.close()
+        self._writers = {}
+
+
+def _key_column(column):
+    '''Числовой ключ колонки для поиска дубликатов: для словарных колонок — индексы общего словаря.'''
+    column = column.combine_chunks()
+    if pa.types.is_dictionary(column.type):
+        column = column.indices
+    return column.to_numpy(zero_copy_only=False)
+
+
+def _compact(path, subset=None):
+    '''Сортирует секцию по времени и удаляет дубликаты (остаётся самая ранняя строка).'''
+    table = pq.read_table(path).unify_dictionaries()
+    table = table.take(pc.sort_indices(table, [('timestamp', 'ascending')]))
+    keys = pd.DataFrame({name: _key_column(table[name]) for name in (subset or table.column_names)})
+    table = table.filter(pa.array(~keys.duplicated().to_numpy()))
+    pq.write_table(table, path)
+
+
+def _events_block(table):
+    # transactionid нужен только как флаг покупки
+    transaction = pc.cast(pc.is_valid(table['transactionid']), pa.uint8())
+    return pa.table({
+        'timestamp': table['timestamp'],
+        'visitorid': table['visitorid'],
+        'event': pc.dictionary_encode(table['event']),
+        'itemid': table['itemid'],
+        'transaction': transaction
+    })
+
+
+def ingest_events(csv_path, out_dir, n_partitions, block_size=BLOCK_SIZE, workers=1):
+    '''
+    events.csv → out_dir/part-XXX.parquet, секции по visitorid.
+    Внутри секции дубликаты удалены, строки отсортированы по timestamp.
+    '''
+    writer = _PartitionWriter(out_dir, 'visitorid', n_partitions)
+    try:
+        for table in _read_blocks(csv_path, EVENT_COLUMN_TYPES, block_size):
+            writer.write(_events_block(table))
+    finally:
+        writer.close()
+
+    paths = partition_paths(out_dir)
+    parallel_map(_compact, paths, workers)
+    return paths
+
+
+def _properties_block(table):
+    prop = table['property']
+    for name, code in PROPERTY_CODES.items():
+        prop = pc.if_else(pc.equal(prop, name), code, prop)
+    value = pc.replace_substring(table['value'], 'n', '')
+    value = pc.utf8_trim_whitespace(pc.replace_substring(value, 'Ifiity', ''))
+    return pa.table({
+        'timestamp': table['timestamp'],
+        'itemid': table['itemid'],
+        'property': pc.cast(prop, pa.uint16()),
+        'value': pc.dictionary_encode(value)
+    })
+
+
+def ingest_properties(csv_paths, out_dir, n_partitions, block_size=BLOCK_SIZE, workers=1, on_block=None):
+    '''
+    item_properties_part*.csv → out_dir/part-XXX.parquet, секции по itemid.
+    Для каждой пары (itemid, property) остаётся самое раннее значение.
+    on_block(table) вызывается для каждого подготовленного блока до дедупликации.
+    '''
+    writer = _PartitionWriter(out_dir, 'itemid', n_partitions)
+    try:
+        for csv_path in csv_paths:
+            for table in _read_blocks(csv_path, PROPERTY_COLUMN_TYPES, block_size):
+                table = _properties_block(table)
+                if on_block is not None:
+                    on_block(table)
+                writer.write(table)
+    finally:
+        writer.close()
+
+    paths = partition_paths(out_dir)
+    parallel_map(_compact, paths, workers, subset=['itemid', 'property'])
+    return paths
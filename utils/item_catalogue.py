@@ -0,0 +1,102 @@
+import numpy as np
+
+from utils.mmap_arrays import save_arrays, load_arrays, find_sorted, id_in_range
+
+ARRAY_NAMES = ('itemids', 'sorted_ids', 'sorted_rows', 'property_data', 'property_offsets', 'value_length', 'depth')
+
+
+class ItemCatalogue:
+    """
+    Каталог товаров с индексом itemid → строка и колоночным хранением.
+
+    Строки идут в порядке items.parquet, то есть номер строки совпадает с индексом
+    товара в AnnoyIndex. Поиск — бинарный поиск по отсортированной копии itemid,
+    поэтому каталог заодно служит отображением itemid → индекс Annoy.
+    Строки property хранятся одним буфером utf-8 со смещениями, чтобы все
+    колонки можно было открыть через mmap.
+    """
+
+    def __init__(self, itemids, sorted_ids, sorted_rows, property_data, property_offsets, value_length, depth):
+        self.itemids = itemids
+        self.sorted_ids = sorted_ids
+        self.sorted_rows = sorted_rows
+        self.property_data = property_data
+        self.property_offsets = property_offsets
+        self.value_length = value_length
+        self.depth = depth
+
+    @classmethod
+    def from_frame(cls, items):
+        itemids = items['itemid'].to_numpy(dtype=np.int64)
+        sorted_rows = np.argsort(itemids, kind='stable')
+
+        encoded = [str(p).encode('utf-8') for p in items['property'].tolist()]
+        property_offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(p) for p in encoded], out=property_offsets[1:])
+        property_data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+        return cls(
+            itemids,
+            itemids[sorted_rows],
+            sorted_rows,
+            property_data,
+            property_offsets,
+            items['value_length'].to_numpy(),
+            items['depth'].to_numpy()
+        )
+
+    def save(self, path):
+        save_arrays(path, {name: getattr(self, name) for name in ARRAY_NAMES})
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Открывает каталог, сохранённый save(); по умолчанию массивы отображаются через mmap."""
+        arrays = load_arrays(path, ARRAY_NAMES, mmap_mode=mmap_mode)
+        return cls(*(arrays[name] for name in ARRAY_NAMES))
+
+    def __len__(self):
+        return len(self.itemids)
+
+    def row(self, itemid):
+        """Номер строки (он же индекс в AnnoyIndex) или None, если товара нет."""
+        pos = find_sorted(self.sorted_ids, itemid)
+        return None if pos is None else int(self.sorted_rows[pos])
+
+    def rows(self, itemids):
+        """Номера строк для списка itemid; отсутствующие товары пропускаются."""
+        itemids = np.asarray([i for i in itemids if id_in_range(i, self.sorted_ids)], dtype=np.int64)
+        pos = np.searchsorted(self.sorted_ids, itemids)
+        pos = np.minimum(pos, len(self.sorted_ids) - 1)
+        found = self.sorted_ids[pos] == itemids if len(self.sorted_ids) else np.zeros(len(itemids), dtype=bool)
+        return self.sorted_rows[pos[found]]
+
+    # Протокол отображения itemid → индекс Annoy (используется SimilarItemsCache)
+    def __contains__(self, itemid):
+        return self.row(itemid) is not None
+
+    def __getitem__(self, itemid):
+        row = self.row(itemid)
+        if row is None:
+            raise KeyError(itemid)
+        return row
+
+    def property_at(self, row):
+        start, end = self.property_offsets[row], self.property_offsets[row + 1]
+        return self.property_data[start:end].tobytes().decode('utf-8')
+
+    def record(self, row):
+        """Словарь с полями товара — те же ключи, что у строки items.parquet."""
+        return {
+            'itemid': int(self.itemids[row]),
+            'property': self.property_at(row),
+            'value_length': self.value_length[row].item(),
+            'depth': self.depth[row].item()
+        }
+
+    def get(self, itemid):
+        row = self.row(itemid)
+        return None if row is None else self.record(row)
+
+    def get_many(self, itemids):
+        """Записи для списка itemid в порядке запроса; отсутствующие товары пропускаются."""
+        return [self.record(row) for row in self.rows(itemids).tolist()]
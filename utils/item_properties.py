@@ -0,0 +1,130 @@
+'''
+Агрегация свойств товаров для items.parquet: глубина категории, длина значений
+и список свойств товара. Всё считается над массивами NumPy/Arrow, без Python-циклов по строкам.
+'''
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+
+def resolve_depths(categoryids, parentids):
+    '''
+    Глубина каждой категории: 1 для корня, 1 + глубина родителя для остальных.
+    Родитель, которого нет в дереве, считается корнем (глубина 1). Вместо рекурсии
+    все категории поднимаются по указателям на родителя одновременно — по шагу за итерацию.
+    '''
+    categoryids = np.asarray(categoryids, dtype=np.int64)
+    parentids = np.asarray(parentids, dtype=np.int64)
+    order = np.argsort(categoryids, kind='stable')
+    sorted_ids = categoryids[order]
+
+    pos = np.minimum(np.searchsorted(sorted_ids, parentids), max(len(sorted_ids) - 1, 0))
+    known = (parentids != -1) & (sorted_ids[pos] == parentids) if len(sorted_ids) else parentids != -1
+    parent_idx = np.where(known, order[pos], -1)
+
+    # Отсутствующий в дереве родитель добавляет один уровень
+    depth = np.where((parentids != -1) & ~known, 2, 1).astype(np.int64)
+    current = parent_idx.copy()
+    for _ in range(len(categoryids)):
+        active = current >= 0
+        if not active.any():
+            break
+        depth[active] += np.where(known[current[active]] | (parentids[current[active]] == -1), 1, 2)
+        current[active] = parent_idx[current[active]]
+    else:
+        if (current >= 0).any():
+            raise ValueError("В дереве категорий есть цикл")
+    return depth
+
+
+def category_depth(tree_path):
+    '''Таблица глубин: depth_table[categoryid] — глубина категории, NaN для отсутствующих id.'''
+    with open(tree_path, 'r') as f:
+        tree = pd.read_csv(f)
+    categoryids = tree['categoryid'].to_numpy(dtype=np.int64)
+    depth = resolve_depths(categoryids, tree['parentid'].fillna(-1).to_numpy(dtype=np.int64))
+    table = np.full(categoryids.max() + 1 if len(categoryids) else 0, np.nan)
+    table[categoryids] = depth
+    return table
+
+
+def lookup_depth(properties, depth_table):
+    '''Глубина категории для каждого значения property (NaN, если такой категории нет).'''
+    properties = np.asarray(properties, dtype=np.int64)
+    depth = np.full(len(properties), np.nan)
+    inside = properties < len(depth_table)
+    depth[inside] = depth_table[properties[inside]]
+    return depth
+
+
+def depth_counts(properties, depth_table):
+    '''Гистограмма глубин по строкам свойств (для медианы по всем секциям).'''
+    return pd.Series(lookup_depth(properties, depth_table)).value_counts()
+
+
+def median_from_counts(counts):
+    '''Медиана по гистограмме {значение: число строк}, как у pandas.Series.median.'''
+    counts = counts.sort_index()
+    total = counts.sum()
+    if total == 0:
+        return 0
+    cumulative = counts.cumsum().to_numpy()
+    # Значения на позициях (total - 1) // 2 и total // 2 — для нечётного total они совпадают
+    lower, upper = counts.index[np.searchsorted(cumulative, [(total - 1) // 2 + 1, total // 2 + 1])]
+    return (lower + upper) / 2
+
+
+def _word_counts(strings):
+    trimmed = pc.utf8_trim_whitespace(strings)
+    counts = pc.list_value_length(pc.utf8_split_whitespace(trimmed))
+    # split пустой строки даёт один пустой элемент, str.split() — ни одного
+    return pc.if_else(pc.equal(pc.utf8_length(trimmed), 0), 0, counts)
+
+
+def value_lengths(values):
+    '''Число слов в каждом значении (как len(str.split())); для словарной колонки считается по словарю.'''
+    values = values.combine_chunks() if isinstance(values, pa.ChunkedArray) else values
+    if pa.types.is_dictionary(values.type):
+        return pc.take(_word_counts(values.dictionary), values.indices).to_numpy(zero_copy_only=False)
+    return _word_counts(values).to_numpy(zero_copy_only=False)
+
+
+def build_items(properties, depth_table, default_depth):
+    '''
+    Финальная агрегация свойств одной секции (pyarrow.Table) по itemid:
+    - объединяем уникальные свойства (через пробел, по возрастанию)
+    - суммируем длину значений
+    - берём медиану глубины категории
+    '''
+    itemids = properties['itemid'].to_numpy()
+    props = properties['property'].to_numpy()
+    depth = lookup_depth(props, depth_table)
+    depth = np.where(np.isnan(depth), default_depth, depth).astype(np.uint8)
+    lengths = value_lengths(properties['value'])
+
+    order = np.lexsort((props, itemids))
+    itemids, props, depth, lengths = itemids[order], props[order], depth[order], lengths[order]
+    # Пары (itemid, property) уже уникальны после загрузки, но повторы не должны попасть в строку свойств
+    first = np.ones(len(itemids), dtype=bool)
+    first[1:] = (itemids[1:] != itemids[:-1]) | (props[1:] != props[:-1])
+
+    starts = np.flatnonzero(np.r_[True, itemids[1:] != itemids[:-1]]) if len(itemids) else np.array([], dtype=int)
+    unique_items = itemids[starts]
+
+    names, inverse = np.unique(props[first], return_inverse=True)
+    tokens = pa.array([str(p) for p in names.tolist()], type=pa.string()).take(pa.array(inverse))
+    offsets = np.searchsorted(np.flatnonzero(first), np.r_[starts, len(itemids)]).astype(np.int32)
+    joined = pc.binary_join(pa.ListArray.from_arrays(pa.array(offsets), tokens), ' ')
+
+    return pd.DataFrame({
+        'itemid': unique_items,
+        'property': joined.to_numpy(zero_copy_only=False),
+        'value_length': np.add.reduceat(lengths, starts) if len(starts) else np.array([], dtype=np.int64),
+        'depth': pd.Series(depth).groupby(itemids).median().to_numpy()
+    })
+
+
+def read_properties(path):
+    return pq.read_table(path, columns=['itemid', 'property', 'value'])
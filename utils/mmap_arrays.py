@@ -0,0 +1,47 @@
+import json
+import os
+
+import numpy as np
+
+META_FILE = 'meta.json'
+
+
+def save_arrays(path, arrays, meta=None):
+    """Сохраняет словарь {имя: массив} в каталог path как набор .npy-файлов (+ meta.json)."""
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f'{name}.npy'), np.ascontiguousarray(array))
+    if meta is not None:
+        with open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def load_arrays(path, names, mmap_mode='r'):
+    """
+    Открывает .npy-файлы каталога path. С mmap_mode='r' данные не копируются
+    в память процесса: все воркеры читают одни и те же страницы page cache.
+    """
+    return {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mmap_mode) for name in names}
+
+
+def load_meta(path):
+    with open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+        return json.load(f)
+
+
+def id_in_range(value, ids):
+    """Помещается ли id (например, из URL) в целочисленный тип массива ids; отрицательных id в данных нет."""
+    return 0 <= value <= np.iinfo(ids.dtype).max
+
+
+def find_sorted(sorted_ids, value):
+    """
+    Позиция value в отсортированном массиве id или None.
+    id вне диапазона типа массива не ищутся: searchsorted бросил бы OverflowError.
+    """
+    if not id_in_range(value, sorted_ids):
+        return None
+    pos = int(np.searchsorted(sorted_ids, value))
+    if pos < len(sorted_ids) and sorted_ids[pos] == value:
+        return pos
+    return None
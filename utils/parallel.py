@@ -0,0 +1,16 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+
+def parallel_map(func, items, workers=1, **kwargs):
+    '''
+    Применяет func к каждому элементу items, при workers > 1 — в пуле процессов.
+    Порядок результатов совпадает с порядком items, поэтому результат не зависит от числа воркеров.
+    func должна быть функцией уровня модуля (её передают в процессы через pickle).
+    '''
+    items = list(items)
+    call = partial(func, **kwargs) if kwargs else func
+    if workers <= 1 or len(items) <= 1:
+        return [call(item) for item in items]
+    with ProcessPoolExecutor(max_workers=min(workers, len(items))) as pool:
+        return list(pool.map(call, items))
@@ -0,0 +1,182 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from utils.mmap_arrays import find_sorted
+
+logger = logging.getLogger(__name__)
+
+# Коды типов пользователей в таблице
+STATUS_NAMES = ('new', 'passive', 'active')
+STATUS_CODES = {name: code for code, name in enumerate(STATUS_NAMES)}
+
+# Файл-указатель на актуальную версию таблицы внутри корневого каталога
+CURRENT_FILE = 'CURRENT'
+
+# Прямая адресация по visitorid используется, пока массив не слишком разрежен
+DIRECT_INDEX_MAX_RATIO = 4
+DIRECT_INDEX_MIN_SIZE = 1 << 20
+
+
+class RecommendationTable:
+    """
+    Предрассчитанные рекомендации одной версии, открытые через mmap.
+
+    Каталог версии содержит .npy-файлы:
+    - user_ids.npy — отсортированные visitorid;
+    - row_of.npy — (необязательно) прямой индекс visitorid → строка, -1 для неизвестных;
+    - offsets.npy — границы списков рекомендаций, len = U + 1;
+    - items.npy — itemid всех списков подряд;
+    - status.npy — тип пользователя (см. STATUS_NAMES);
+    и meta.json с top_n, alpha и временем построения.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.top_n = self.meta['top_n']
+        # Таблицы без alpha в meta.json построены до его учёта и не раздаются
+        self.alpha = self.meta.get('alpha')
+        self.user_ids = np.load(os.path.join(path, 'user_ids.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, 'offsets.npy'), mmap_mode='r')
+        self.items = np.load(os.path.join(path, 'items.npy'), mmap_mode='r')
+        self.status = np.load(os.path.join(path, 'status.npy'), mmap_mode='r')
+        row_of_path = os.path.join(path, 'row_of.npy')
+        self.row_of = np.load(row_of_path, mmap_mode='r') if os.path.exists(row_of_path) else None
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def _row(self, user_id):
+        if self.row_of is not None:
+            if 0 <= user_id < len(self.row_of):
+                row = int(self.row_of[user_id])
+                return row if row >= 0 else None
+            return None
+        return find_sorted(self.user_ids, user_id)
+
+    def get(self, user_id, top_n, alpha):
+        """
+        Рекомендации в формате get_recommendations или None, если пользователя нет в таблице.
+        Смешивание для активных зависит от top_n и alpha, поэтому при других параметрах
+        (в том числе меньшем top_n) таблица не отвечает — рекомендации считаются на лету.
+        """
+        if top_n != self.top_n or alpha != self.alpha:
+            return None
+        row = self._row(user_id)
+        if row is None:
+            return None
+        items = self.items[self.offsets[row]:self.offsets[row + 1]]
+        return {
+            "status": STATUS_NAMES[int(self.status[row])],
+            "recommendations": items.tolist()
+        }
+
+    @staticmethod
+    def write(path, results, top_n, alpha):
+        """
+        Записывает словарь {user_id: {"status", "recommendations"}} в каталог версии path.
+        """
+        os.makedirs(path, exist_ok=True)
+        user_ids = np.array(sorted(results), dtype=np.int64)
+        lengths = np.array([len(results[u]["recommendations"]) for u in user_ids.tolist()], dtype=np.int64)
+        offsets = np.zeros(len(user_ids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        items = np.fromiter(
+            (item for u in user_ids.tolist() for item in results[u]["recommendations"]),
+            dtype=np.int64, count=int(offsets[-1])
+        )
+        status = np.array([STATUS_CODES[results[u]["status"]] for u in user_ids.tolist()], dtype=np.uint8)
+
+        np.save(os.path.join(path, 'user_ids.npy'), user_ids)
+        np.save(os.path.join(path, 'offsets.npy'), offsets)
+        np.save(os.path.join(path, 'items.npy'), items)
+        np.save(os.path.join(path, 'status.npy'), status)
+
+        # Прямой индекс делает поиск O(1), если visitorid достаточно плотные
+        if len(user_ids) and user_ids[0] >= 0:
+            size = int(user_ids[-1]) + 1
+            if size <= max(DIRECT_INDEX_MIN_SIZE, DIRECT_INDEX_MAX_RATIO * len(user_ids)):
+                row_of = np.full(size, -1, dtype=np.int32 if len(user_ids) < 2 ** 31 else np.int64)
+                row_of[user_ids] = np.arange(len(user_ids))
+                np.save(os.path.join(path, 'row_of.npy'), row_of)
+
+        with open(os.path.join(path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump({'top_n': top_n, 'alpha': alpha, 'n_users': len(user_ids), 'created_at': time.time()}, f)
+
+
+def publish_version(root, version):
+    """Атомарно переключает CURRENT на каталог версии version."""
+    tmp_path = os.path.join(root, f'{CURRENT_FILE}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def cleanup_versions(root, keep=2):
+    """Удаляет старые версии, оставляя keep последних (включая текущую)."""
+    current = read_current_version(root)
+    versions = sorted(d for d in os.listdir(root)
+                      if d.startswith('v') and os.path.isdir(os.path.join(root, d)))
+    for version in versions[:-keep]:
+        if version != current:
+            shutil.rmtree(os.path.join(root, version), ignore_errors=True)
+
+
+def read_current_version(root):
+    try:
+        with open(os.path.join(root, CURRENT_FILE), encoding='utf-8') as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class PrecomputedRecommendations:
+    """
+    Раздаёт рекомендации из актуальной версии таблицы и подхватывает новые версии.
+
+    Файл CURRENT проверяется не чаще раза в reload_interval секунд; при смене
+    версии новая таблица открывается целиком и подменяет старую одной
+    операцией присваивания, поэтому параллельные запросы видят либо старую,
+    либо новую таблицу, но не их смесь.
+    """
+
+    def __init__(self, root, reload_interval=30.0):
+        self.root = root
+        self.reload_interval = reload_interval
+        self.table = None
+        self.version = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def reload(self):
+        """Открывает версию из CURRENT, если она изменилась. Возвращает True при переключении."""
+        with self._lock:
+            self._checked_at = time.monotonic()
+            version = read_current_version(self.root)
+            if version is None or version == self.version:
+                return False
+            try:
+                table = RecommendationTable(os.path.join(self.root, version))
+            except Exception:
+                logger.exception("Не удалось открыть таблицу рекомендаций версии %s", version)
+                return False
+            self.table, self.version = table, version
+            logger.info("Загружена таблица рекомендаций %s: %d пользователей, top_n=%d, alpha=%s", version, len(table),
+                        table.top_n, table.alpha)
+            return True
+
+    def get(self, user_id, top_n, alpha):
+        if time.monotonic() - self._checked_at >= self.reload_interval:
+            self.reload()
+        table = self.table
+        if table is None:
+            return None
+        return table.get(user_id, top_n, alpha)
@@ -0,0 +1,112 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import logging
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class RankerInference:
+    """
+    Обёртка над CatBoostRanker для раздачи рекомендаций.
+
+    Порядок признаков фиксируется при загрузке (тот же, что у RankerFeatureStore)
+    и сверяется с порядком, на котором обучалась модель: CatBoost получает матрицу
+    и сопоставляет колонки только по позиции. Вход приводится к float32 C-contiguous матрице — CatBoost не конвертирует данные
+    на каждом вызове. thread_count ограничивает потоки CatBoost: под gunicorn
+    с несколькими воркерами значение по умолчанию (все ядра) даёт переподписку.
+
+    time_budget (сек.) — необязательный жёсткий лимит: predict_within выполняет
+    расчёт в отдельном потоке и возвращает None, если он не уложился в лимит.
+    Не начатый к истечению лимита расчёт отменяется, уже идущий досчитывается в фоне,
+    и его результат отбрасывается. Одновременно выполняется не больше budget_workers
+    расчётов: если все заняты (например, досчитывают просроченные), predict_within
+    сразу возвращает None, и очередь под нагрузкой не растёт.
+    Пока CatBoost держит GIL, ожидающий поток не просыпается, поэтому лимит
+    соблюдается с точностью до интервала переключения GIL (~5 мс).
+    """
+
+    def __init__(self, model, feature_names, thread_count=1, time_budget=None, budget_workers=2):
+        self.model = model
+        self.feature_names = list(feature_names)
+        self._check_feature_names()
+        self.thread_count = thread_count if thread_count else -1
+        self.time_budget = time_budget or None
+        self._budget_workers = budget_workers
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(budget_workers)
+
+    def _check_feature_names(self):
+        model_features = [str(name) for name in (getattr(self.model, 'feature_names_', None) or [])]
+        if not model_features:
+            return
+        # Модель, обученная на матрице без имён, знает только число признаков ('0', '1', ...)
+        positional = model_features == [str(i) for i in range(len(model_features))]
+        if len(model_features) != self.n_features or not positional and model_features != self.feature_names:
+            raise ValueError(f"Порядок признаков не совпадает с моделью: модель {model_features}, "
+                             f"данные {self.feature_names}")
+
+    @property
+    def n_features(self):
+        return len(self.feature_names)
+
+    def prepare(self, features):
+        '''Матрица признаков в формате, который CatBoost принимает без копирования.'''
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        if features.ndim != 2 or features.shape[1] != self.n_features:
+            raise ValueError(f"Ожидалась матрица (n, {self.n_features}), получено {features.shape}")
+        return features
+
+    def predict(self, features):
+        features = self.prepare(features)
+        if len(features) == 0:
+            return np.empty(0, dtype=np.float64)
+        return self.model.predict(features, thread_count=self.thread_count)
+
+    def predict_within(self, features, time_budget=None):
+        '''
+        Скоры или None, если расчёт не уложился в time_budget (по умолчанию — self.time_budget)
+        или все потоки расчёта заняты.
+        '''
+        time_budget = time_budget or self.time_budget
+        if time_budget is None:
+            return self.predict(features)
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            return None
+        try:
+            future = self._get_executor().submit(self.predict, features)
+        except BaseException:
+            slots.release()
+            raise
+        # Слот освобождается, когда расчёт завершён или отменён
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=time_budget)
+        except FutureTimeoutError:
+            future.cancel()
+            return None
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._budget_workers,
+                                                    thread_name_prefix='ranker-inference')
+            return self._executor
+
+    def warm_up(self, rows=8):
+        '''Пробный расчёт, чтобы инициализация модели и пула потоков CatBoost не приходилась на запрос.'''
+        start = time.perf_counter()
+        self.predict(np.zeros((rows, self.n_features), dtype=np.float32))
+        logger.info("Прогрев ранжировщика: %.1f мс (thread_count=%s)", (time.perf_counter() - start) * 1000,
+                    self.thread_count)
+
+    def after_fork(self):
+        '''Вызывается в воркере после fork: потоки исполнителя и CatBoost остались в мастере.'''
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self._budget_workers)
+        self.warm_up()
@@ -0,0 +1,96 @@
+import numpy as np
+
+from utils.mmap_arrays import save_arrays, load_arrays, load_meta, find_sorted
+
+# Служебные колонки df_ranker, которые не являются признаками модели
+NON_FEATURE_COLUMNS = ('label', 'visitorid', 'itemid')
+
+ARRAY_NAMES = ('user_ids', 'offsets', 'itemids', 'features', 'seen')
+
+
+def resolve_feature_names(model, columns):
+    """
+    Возвращает порядок признаков для ранжировщика.
+    Если модель обучалась на DataFrame — берём её собственный порядок,
+    иначе все колонки df_ranker, кроме служебных.
+    """
+    model_features = list(getattr(model, 'feature_names_', None) or [])
+    if model_features and set(model_features) <= set(columns):
+        return model_features
+    return [col for col in columns if col not in NON_FEATURE_COLUMNS]
+
+
+class RankerFeatureStore:
+    """
+    Хранилище признаков ранжировщика, построенное один раз при загрузке.
+
+    Строки df_ranker отсортированы по visitorid, признаки лежат в одной
+    непрерывной float32-матрице в фиксированном порядке колонок, для каждого
+    пользователя известен диапазон строк. Маска seen заранее помечает пары
+    (visitorid, itemid), с которыми пользователь уже взаимодействовал.
+    """
+
+    def __init__(self, user_ids, offsets, itemids, features, seen, feature_names):
+        self.user_ids = user_ids
+        self.offsets = offsets
+        self.itemids = itemids
+        self.features = features
+        self.seen = seen
+        self.feature_names = feature_names
+
+    @classmethod
+    def from_frame(cls, ranker_data, feature_names, user_index):
+        visitors = ranker_data['visitorid'].to_numpy(dtype=np.int64)
+        order = np.argsort(visitors, kind='stable')
+        visitors = visitors[order]
+        itemids = ranker_data['itemid'].to_numpy(dtype=np.int64)[order]
+
+        # Заполняем матрицу по колонкам, чтобы не держать в памяти промежуточную копию всего фрейма
+        features = np.empty((len(order), len(feature_names)), dtype=np.float32)
+        for j, name in enumerate(feature_names):
+            features[:, j] = ranker_data[name].to_numpy(dtype=np.float32)[order]
+
+        user_ids, starts = np.unique(visitors, return_index=True)
+        offsets = np.append(starts, len(visitors)).astype(np.int64)
+
+        seen = cls._seen_mask(visitors, itemids, user_index)
+        return cls(user_ids, offsets, itemids, features, seen, list(feature_names))
+
+    @staticmethod
+    def _seen_mask(visitors, itemids, user_index):
+        """Отмечает строки, чья пара (visitorid, itemid) встречается в истории событий."""
+        if len(visitors) == 0 or len(user_index.itemids) == 0:
+            return np.zeros(len(visitors), dtype=bool)
+        base = int(max(itemids.max(), user_index.itemids.max())) + 1
+        event_visitors = np.repeat(user_index.user_ids, np.diff(user_index.offsets))
+        event_keys = np.unique(event_visitors * base + user_index.itemids)
+        return np.isin(visitors * base + itemids, event_keys)
+
+    def save(self, path):
+        save_arrays(path, {name: getattr(self, name) for name in ARRAY_NAMES},
+                    meta={'feature_names': self.feature_names})
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Открывает хранилище, сохранённое save(); по умолчанию массивы отображаются через mmap."""
+        arrays = load_arrays(path, ARRAY_NAMES, mmap_mode=mmap_mode)
+        feature_names = load_meta(path)['feature_names']
+        return cls(*(arrays[name] for name in ARRAY_NAMES), feature_names)
+
+    def __len__(self):
+        return len(self.itemids)
+
+    def _slice(self, user_id):
+        pos = find_sorted(self.user_ids, user_id)
+        if pos is None:
+            return slice(0, 0)
+        return slice(self.offsets[pos], self.offsets[pos + 1])
+
+    def candidates(self, user_id):
+        """
+        Непросмотренные пользователем кандидаты: (itemid, матрица признаков).
+        Матрица — float32 C-contiguous в порядке feature_names.
+        """
+        rows = self._slice(user_id)
+        unseen = ~self.seen[rows]
+        return self.itemids[rows][unseen], self.features[rows][unseen]
@@ -0,0 +1,78 @@
+from contextlib import contextmanager
+import fcntl
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class StagedLoader:
+    """
+    Последовательно выполняет этапы загрузки приложения — синхронно или в фоновом потоке.
+    Состояние (pending / loading / ready / failed), текущий этап и длительность
+    завершённых этапов отдаются в /readyz.
+    """
+
+    def __init__(self):
+        self.state = 'pending'
+        self.stage = None
+        self.error = None
+        self.completed = []
+        self.started_at = None
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.state == 'ready'
+
+    def run(self, stages):
+        """Выполняет этапы [(имя, функция), ...] в текущем потоке."""
+        self.state = 'loading'
+        self.started_at = time.time()
+        for number, (name, func) in enumerate(stages, 1):
+            self.stage = name
+            logger.info("Загрузка: этап %d/%d «%s»...", number, len(stages), name)
+            stage_start = time.time()
+            try:
+                func()
+            except Exception as e:
+                self.state = 'failed'
+                self.error = f"{name}: {e}"
+                logger.exception("Загрузка: этап «%s» завершился ошибкой", name)
+                return False
+            duration = time.time() - stage_start
+            self.completed.append({'stage': name, 'seconds': round(duration, 2)})
+            logger.info("Загрузка: этап «%s» выполнен за %.1f сек.", name, duration)
+        self.stage = None
+        self.state = 'ready'
+        logger.info("Приложение готово к работе, загрузка заняла %.1f сек.", time.time() - self.started_at)
+        return True
+
+    def start(self, stages):
+        """Запускает этапы в фоновом потоке, чтобы сервер мог принимать запросы сразу."""
+        self._thread = threading.Thread(target=self.run, args=(stages,), name='staged-loader', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def status(self):
+        return {
+            'state': self.state,
+            'stage': self.stage,
+            'error': self.error,
+            'completed': list(self.completed),
+            'elapsed': round(time.time() - self.started_at, 2) if self.started_at else None
+        }
+
+
+@contextmanager
+def file_lock(path):
+    """Межпроцессная блокировка на файле: один этап выполняется одним воркером за раз."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
@@ -0,0 +1,84 @@
+'''
+Замер времени этапов: расчёт рекомендаций, предобработка, загрузка БД.
+
+Текущая трассировка хранится в contextvar, поэтому этапы размечаются через
+`with stage('predict'):` без передачи объекта по всем методам. Если трассировка
+не включена, stage() возвращает общий пустой контекстный менеджер — накладные
+расходы сводятся к одному чтению contextvar.
+'''
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+
+_current = ContextVar('recommendation_trace', default=None)
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('trace', 'name', 'start')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Trace:
+    """Длительности этапов одного запроса (сек.); повторные замеры этапа суммируются."""
+
+    def __init__(self):
+        self.timings = {}
+        self.user_type = 'unknown'
+
+    def add(self, name, seconds):
+        self.timings[name] = self.timings.get(name, 0.0) + seconds
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def breakdown(self):
+        """Длительности этапов в миллисекундах — для JSON-ответа и лога."""
+        return {name: round(seconds * 1000, 3) for name, seconds in self.timings.items()}
+
+    def observe(self, histogram):
+        for name, seconds in self.timings.items():
+            histogram.labels(stage=name, user_type=self.user_type).observe(seconds)
+
+
+def stage(name):
+    """Контекстный менеджер замера этапа в текущей трассировке (или пустой, если её нет)."""
+    trace = _current.get()
+    return NULL_STAGE if trace is None else _Stage(trace, name)
+
+
+@contextmanager
+def tracing(enabled=True):
+    """Включает трассировку на время блока; при enabled=False отдаёт None и ничего не замеряет."""
+    if not enabled:
+        yield None
+        return
+    trace = Trace()
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
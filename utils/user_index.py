@@ -0,0 +1,108 @@
+import numpy as np
+
+from utils.mmap_arrays import save_arrays, load_arrays, find_sorted
+
+# Коды событий, под которыми они хранятся в индексе
+EVENT_CODES = {'view': 0, 'addtocart': 1, 'transaction': 2}
+EVENT_NAMES = ('view', 'addtocart', 'transaction')
+UNKNOWN_EVENT = 255
+
+ARRAY_NAMES = ('user_ids', 'offsets', 'itemids', 'events', 'timestamps', 'unique_counts')
+
+
+class UserInteractionIndex:
+    """
+    Компактный индекс взаимодействий пользователей в формате CSR.
+
+    Строится один раз при старте: события сортируются по visitorid (стабильно,
+    поэтому внутри пользователя сохраняется исходный порядок), а для каждого
+    пользователя хранится смещение в массивах itemid, кодов событий и времени.
+    Поиск пользователя — бинарный поиск O(log U), история — срез массива.
+    """
+
+    def __init__(self, user_ids, offsets, itemids, events, timestamps, unique_counts):
+        self.user_ids = user_ids            # отсортированные visitorid, int64
+        self.offsets = offsets              # границы строк пользователей, len = U + 1
+        self.itemids = itemids              # int64
+        self.events = events                # uint8, см. EVENT_CODES
+        self.timestamps = timestamps        # datetime64[ns]
+        self.unique_counts = unique_counts  # число уникальных товаров у пользователя
+
+    @classmethod
+    def from_events(cls, events):
+        """Строит индекс по DataFrame событий (visitorid, itemid, event, timestamp)."""
+        visitors = events['visitorid'].to_numpy(dtype=np.int64)
+        order = np.argsort(visitors, kind='stable')
+        visitors = visitors[order]
+        itemids = events['itemid'].to_numpy(dtype=np.int64)[order]
+
+        # Категории событий переводим в uint8 через таблицу соответствия;
+        # код -1 (пропуск) попадает на последний элемент таблицы — UNKNOWN_EVENT
+        event_cat = events['event'].astype('category').cat
+        lookup = np.array([EVENT_CODES.get(str(c), UNKNOWN_EVENT) for c in event_cat.categories] + [UNKNOWN_EVENT],
+                          dtype=np.uint8)
+        codes = lookup[event_cat.codes.to_numpy()][order]
+
+        if 'timestamp' in events:
+            timestamps = events['timestamp'].to_numpy(dtype='datetime64[ns]')[order]
+        else:
+            timestamps = np.zeros(len(order), dtype='datetime64[ns]')
+
+        user_ids, starts = np.unique(visitors, return_index=True)
+        offsets = np.append(starts, len(visitors)).astype(np.int64)
+
+        # Число уникальных товаров: внутри каждого пользователя сортируем itemid
+        # и считаем позиции, где начинается новая пара (visitorid, itemid)
+        pair_order = np.lexsort((itemids, visitors))
+        sorted_items = itemids[pair_order]
+        new_pair = np.ones(len(sorted_items), dtype=np.int64)
+        if len(sorted_items) > 1:
+            new_pair[1:] = sorted_items[1:] != sorted_items[:-1]
+        new_pair[starts] = 1
+        unique_counts = np.add.reduceat(new_pair, starts) if len(starts) else np.zeros(0, dtype=np.int64)
+
+        return cls(user_ids, offsets, itemids, codes, timestamps, unique_counts)
+
+    def save(self, path):
+        save_arrays(path, {name: getattr(self, name) for name in ARRAY_NAMES})
+
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """Открывает индекс, сохранённый save(); по умолчанию массивы отображаются через mmap."""
+        arrays = load_arrays(path, ARRAY_NAMES, mmap_mode=mmap_mode)
+        return cls(*(arrays[name] for name in ARRAY_NAMES))
+
+    def __len__(self):
+        return len(self.user_ids)
+
+    def __contains__(self, user_id):
+        return self._position(user_id) is not None
+
+    def _position(self, user_id):
+        return find_sorted(self.user_ids, user_id)
+
+    def _slice(self, user_id):
+        pos = self._position(user_id)
+        if pos is None:
+            return slice(0, 0)
+        return slice(self.offsets[pos], self.offsets[pos + 1])
+
+    def unique_items_count(self, user_id):
+        """Число уникальных товаров пользователя или None, если пользователь неизвестен."""
+        pos = self._position(user_id)
+        return None if pos is None else int(self.unique_counts[pos])
+
+    def items(self, user_id):
+        """itemid всех событий пользователя в исходном порядке (срез без копирования)."""
+        return self.itemids[self._slice(user_id)]
+
+    def seen_items(self, user_id):
+        """Уникальные itemid, с которыми взаимодействовал пользователь."""
+        return np.unique(self.items(user_id))
+
+    def history(self, user_id):
+        """Уникальные пары (itemid, event) пользователя в порядке первого появления."""
+        rows = self._slice(user_id)
+        pairs = zip(self.itemids[rows].tolist(), self.events[rows].tolist())
+        return [(itemid, EVENT_NAMES[code] if code < len(EVENT_NAMES) else None)
+                for itemid, code in dict.fromkeys(pairs)]
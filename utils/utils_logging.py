@@ -1,14 +1,125 @@
+'''
+Единая настройка логирования приложения.
+
+Записи из рабочих потоков попадают в очередь (QueueHandler), а форматирование
+и запись в файл/консоль выполняет отдельный поток QueueListener — запрос не ждёт
+файлового ввода-вывода и блокировки обработчика. Строки «на каждый запрос»
+пишутся в отдельные логгеры и прореживаются (SamplingFilter).
+'''
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
+
+import config
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+
+# Стандартные атрибуты LogRecord; всё остальное пришло через extra= и попадает в JSON
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_state = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна JSON-строка на запись: время, уровень, логгер, сообщение и поля из extra."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает долю rate записей уровня INFO и ниже; предупреждения и ошибки — всегда."""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        # Собственный генератор: общий random сдвигал бы random.shuffle в рекомендациях пассивным
+        self._random = random.Random()
+
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or self._random.random() < self.rate
+
+
+class _LocalQueueHandler(logging.handlers.QueueHandler):
+    # Сообщение собирается сразу, как в QueueHandler: изменяемые args к моменту записи
+    # в потоке слушателя могут поменяться. Очередь внутри процесса, поэтому exc_info
+    # и поля из extra остаются в записи для форматтера слушателя
+    def prepare(self, record):
+        message = record.getMessage()
+        record = copy.copy(record)
+        record.msg = message
+        record.args = None
+        return record
+
+
+def _handlers(log_file, json_format):
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+        handlers.append(logging.handlers.RotatingFileHandler(log_file, maxBytes=10 * 1024 * 1024,
+                                                             backupCount=5, encoding='utf-8'))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
+
+def _start_listener():
+    log_queue = queue.SimpleQueue()
+    _state['queue_handler'].queue = log_queue
+    listener = logging.handlers.QueueListener(log_queue, *_state['handlers'], respect_handler_level=True)
+    listener.start()
+    _state['listener'] = listener
+    _state['running'] = True
+
+
+def setup_logging(log_file=config.LOG_PATH, level=config.LOG_LEVEL, json_format=config.LOG_JSON,
+                  sample_rates=config.LOG_SAMPLE_RATES):
+    '''
+    Настраивает корневой логгер: QueueHandler → QueueListener → файл и консоль.
+    sample_rates — {имя логгера: доля пропускаемых INFO-записей}. Повторный вызов ничего не меняет.
+    '''
+    if 'listener' in _state:
+        return _state['listener']
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.setLevel(level)
+
+    _state['handlers'] = _handlers(log_file, json_format)
+    _state['queue_handler'] = _LocalQueueHandler(queue.SimpleQueue())
+    root.addHandler(_state['queue_handler'])
+    _start_listener()
+
+    for name, rate in sample_rates.items():
+        logging.getLogger(name).addFilter(SamplingFilter(rate))
+
+    atexit.register(stop_logging)
+    return _state['listener']
+
+
+def after_fork():
+    '''Поток слушателя не переживает fork: в дочернем процессе запускаем новый со своей очередью.'''
+    if 'listener' in _state:
+        _start_listener()
+
 
-def setup_logging(log_file='logs/app.log'):
-    os.makedirs(os.path.dirname(log_file), exist_ok=True)
-
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s [%(levelname)s] %(message)s",
-        handlers=[
-            logging.FileHandler(log_file, mode='a', encoding='utf-8'),
-            logging.StreamHandler()
-        ]
-    )
+def stop_logging():
+    '''Дописывает оставшиеся в очереди записи и останавливает поток слушателя.'''
+    if _state.pop('running', False):
+        _state['listener'].stop()